@@ -68,6 +68,13 @@ setup(
         # eg:
         #   'rst': ['docutils>=0.11'],
         #   ':python_version=="2.6"': ['argparse'],
+        'compression': ['zstandard', 'brotli'],
+        'polars': ['polars'],
+        's3': ['boto3'],
+        'xlsx': ['python-calamine'],
+        'cldr': ['ijson'],
+        'duckdb': ['duckdb'],
+        'msgpack': ['msgpack'],
     },
     entry_points={
         'console_scripts': [
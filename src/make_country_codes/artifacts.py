@@ -0,0 +1,34 @@
+"""
+Salted artifacts in a build directory, found by their filenames.
+
+Like :mod:`make_country_codes.names`, this module depends only on the
+standard library, so that lookups over built tables don't import luigi.
+"""
+import os
+
+
+def latest_artifact(prefix, ext, root='build/'):
+    """Returns the path of the most recently built salted artifact
+
+    :param str prefix: start of filename before the salt, e.g. 'country-codes-'
+    :param str ext: extension of filename, e.g. '.csv'
+    :param str root: directory of built artifacts
+    :returns: path, or None if no such artifact has been built
+    :rtype: str or None
+    """
+    try:
+        paths = [entry.path for entry in os.scandir(root)
+                 if entry.name.startswith(prefix) and entry.name.endswith(ext)
+                 and '-luigi-tmp-' not in entry.name]
+    except FileNotFoundError:
+        return None
+    if not paths:
+        return None
+    return max(paths, key=os.path.getmtime)
+
+
+def salt_of(path):
+    """Returns the salt of a salted artifact, parsed from its filename,
+    e.g. `1f0c2a` of `build/country-codes-1f0c2a.csv`"""
+    name, _ = os.path.splitext(os.path.basename(path))
+    return name.rsplit('-', 1)[-1]
@@ -0,0 +1,180 @@
+"""
+DataFrame backends for assembling the country codes table.
+
+Assembly reads cleaned intermediate tables, joins them with a chain of
+outer joins and writes the result. :class:`PandasBackend` is the
+reference implementation. :class:`PolarsBackend` plans the same chain
+lazily with Polars, reading intermediate tables lazily, and runs it once,
+on all cores, when the table is written (so columns dropped by a
+projection are never read), with identical output.
+
+Both follow the semantics of :func:`pandas.merge` with ``how='outer'``:
+rows of the left table are grouped by key (in order of first
+appearance), each followed by its matches in the right table, and then
+rows of the right table without a match. Missing keys match each other,
+and a key column shared by both tables is coalesced.
+"""
+import pandas as pd
+
+from .frames import read_frame
+from .frames import FEATHER_EXT
+from .schema import read_csv
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# na values of intermediate tables
+NA_VALUES = ['_']
+
+
+class PandasBackend:
+    """Eager pandas frames, the reference backend"""
+    name = 'pandas'
+
+    def read_csv(self, source, path):
+        """Returns the intermediate table of `source` at `path`, as strings
+
+        Namibia's 2 letter codes are often `NA`, so only `_` is missing!
+        """
+        return read_csv(source, path, keep_default_na=False, na_values=NA_VALUES)
+
+    def read_frame(self, path):
+        """Returns the intermediate table at `path`, see :func:`make_country_codes.frames.write_frame`"""
+        return read_frame(path)
+
+    def from_pandas(self, df):
+        return df
+
+    def to_pandas(self, frame, columns=None):
+        return frame if columns is None else frame[columns]
+
+    def columns(self, frame):
+        return list(frame.columns)
+
+    def drop(self, frame, columns):
+        return frame.drop(columns, axis=1)
+
+    def join(self, left, right, left_on, right_on):
+        return pd.merge(left, right, how='outer', left_on=left_on, right_on=right_on)
+
+    def append(self, frame, rows):
+        """Returns `frame` followed by `rows`, with the columns of both"""
+        return pd.concat([frame, rows], sort=False, ignore_index=True)
+
+    def write_csv(self, frame, f):
+        # as text, as pandas can't write to luigi's text pipes
+        f.write(frame.to_csv(index=False, float_format='%.0f'))
+
+
+def _polars_keyword(method, *names):
+    """Returns the first of `names` accepted by `method`, as keywords
+    have been renamed across Polars versions"""
+    import inspect
+    parameters = inspect.signature(method).parameters
+    return next((name for name in names if name in parameters), None)
+
+
+class PolarsBackend:
+    """Lazy Polars frames, requires `polars`
+
+    :raises ImportError: if polars is not installed
+    """
+    name = 'polars'
+
+    def __init__(self):
+        if pl is None:
+            raise ImportError('the polars backend requires polars')
+        self._nulls_equal = _polars_keyword(pl.LazyFrame.join, 'nulls_equal', 'join_nulls')
+        # full outer joins were called `outer` before Polars 1.0
+        self._full = 'full' if int(pl.__version__.split('.')[0]) >= 1 else 'outer'
+        # and concatenations casting columns to common types need Polars 0.20
+        version = tuple(int(n) for n in pl.__version__.split('.')[:2])
+        self._diagonal = 'diagonal_relaxed' if version >= (0, 20) else 'diagonal'
+        self._row_index = (pl.LazyFrame.with_row_index if hasattr(pl.LazyFrame, 'with_row_index')
+                           else pl.LazyFrame.with_row_count)
+
+    def read_csv(self, source, path):
+        options = {'null_values': NA_VALUES}
+        # every column as a string, so codes keep their leading zeros
+        if _polars_keyword(pl.scan_csv, 'infer_schema'):
+            options['infer_schema'] = False
+        else:
+            options['infer_schema_length'] = 0
+        # and empty values as empty strings, like pandas with `keep_default_na=False`
+        if _polars_keyword(pl.scan_csv, 'empty_string_is_null'):
+            options['empty_string_is_null'] = False
+        else:
+            options['missing_utf8_is_empty_string'] = True
+        return pl.scan_csv(path, **options)
+
+    def read_frame(self, path):
+        if path.endswith(FEATHER_EXT):
+            # Feather files are Arrow IPC files, which polars maps lazily
+            return pl.scan_ipc(path)
+        return self.from_pandas(read_frame(path))
+
+    def from_pandas(self, df):
+        df = df.astype(object).where(df.notnull(), None)
+        return pl.from_pandas(df).lazy()
+
+    def to_pandas(self, frame, columns=None):
+        if columns is not None:
+            frame = frame.select(columns)
+        df = frame.collect().to_pandas()
+        return df.where(df.notnull(), float('nan'))
+
+    def columns(self, frame):
+        if hasattr(frame, 'collect_schema'):
+            return frame.collect_schema().names()
+        return frame.columns
+
+    def drop(self, frame, columns):
+        return frame.drop(columns)
+
+    def _join(self, left, right, left_on, right_on, how, **kwargs):
+        kwargs[self._nulls_equal] = True
+        return left.join(right, left_on=left_on, right_on=right_on, how=how, **kwargs)
+
+    def join(self, left, right, left_on, right_on):
+        # a single full join uses each table once, so that a chain of joins
+        # stays one lazy plan (collected once, when written) rather than
+        # growing exponentially
+        left = self._row_index(left, '__left').with_columns(
+            # order of first appearance of each key of the left table
+            pl.col('__left').min().over(left_on).alias('__group'))
+        right = self._row_index(right, '__right')
+        # a key shared by both tables is coalesced, otherwise both are kept
+        joined = self._join(left, right, left_on, right_on, self._full, coalesce=left_on == right_on)
+
+        columns = [c for c in self.columns(left) + self.columns(right)
+                   if not c.startswith('__')]
+        columns = list(dict.fromkeys(columns))
+        # rows of the right table without a match have no group, and come last
+        return joined.sort(['__group', '__left', '__right'], nulls_last=True).select(columns)
+
+    def append(self, frame, rows):
+        return pl.concat([frame, rows], how=self._diagonal)
+
+    def write_csv(self, frame, f):
+        schema = frame.collect_schema() if hasattr(frame, 'collect_schema') else frame.schema
+        # polars quotes empty strings (unlike missing values), pandas writes neither
+        frame = frame.with_columns(
+            [pl.when(pl.col(c) == '').then(None).otherwise(pl.col(c)).alias(c)
+             for c, dtype in schema.items() if dtype == pl.Utf8] +
+            # and floats without decimals, like pandas with `float_format='%.0f'`
+            [pl.col(c).round(0).cast(pl.Int64) for c, dtype in schema.items() if dtype in (pl.Float32, pl.Float64)])
+        f.write(frame.collect().write_csv(null_value=''))
+
+
+BACKENDS = {'pandas': PandasBackend, 'polars': PolarsBackend}
+
+
+def get_backend(name='pandas'):
+    """Returns an instance of the backend called `name`
+
+    :raises KeyError: if there is no such backend
+    :raises ImportError: if the backend's dependencies are missing
+    """
+    return BACKENDS[name]()
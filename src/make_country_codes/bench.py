@@ -0,0 +1,194 @@
+"""
+Scaling of the pipeline, over synthetic sources.
+
+:func:`bench` builds tasks over synthetic sources (see
+:mod:`make_country_codes.synthetic`) at each of several scales, in a
+fresh directory, and records how long each task ran and, optionally, the
+peak memory it allocated (traced with :mod:`tracemalloc`, which slows
+tasks down). :func:`format_report` shows both by scale, along with how
+each task's runtime grows between the two largest scales: about 1 for
+linear code, 2 for quadratic code.
+
+`make-country-codes bench --scales 1,10,100` runs it from the command line.
+"""
+import math
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+from tempfile import TemporaryDirectory
+
+from luigi import build
+from luigi import Event
+from luigi import Task
+from luigi.task import logger as luigi_logger
+
+from . import cache
+from .synthetic import page_fetcher
+from .synthetic import write_sources
+from .synthetic import GAPS
+from .tasks.data import raw_compression
+from .utils import fetching_with
+
+SCALES = [1, 10, 100]
+
+
+class Recorder:
+    """Runtime and peak memory of each task run while it is recording
+
+    :param bool memory: whether to trace memory allocations
+    """
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.started = {}
+        self.seconds = OrderedDict()
+        self.peaks = {}
+
+    def start(self, task):
+        if self.memory:
+            tracemalloc.start()
+        self.started[task.task_id] = time.perf_counter()
+
+    def stop(self, task):
+        if task.task_id not in self.started:
+            return
+        self.seconds[str(task)] = time.perf_counter() - self.started.pop(task.task_id)
+        if self.memory:
+            self.peaks[str(task)] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+_recorder = None
+
+
+@Task.event_handler(Event.START)
+def task_started(task):
+    if _recorder is not None:
+        _recorder.start(task)
+
+
+@Task.event_handler(Event.SUCCESS)
+def task_succeeded(task):
+    if _recorder is not None:
+        _recorder.stop(task)
+
+
+@Task.event_handler(Event.FAILURE)
+def task_failed(task, exception):
+    if _recorder is not None:
+        _recorder.stop(task)
+
+
+class Run:
+    """The tasks run at one scale
+
+    :param float scale: countries, relative to the real sources
+    :param Recorder recorder: runtime (and memory) of each task
+    :param float seconds: runtime of the whole build
+    :param bool succeeded: whether every task succeeded
+    """
+    def __init__(self, scale, recorder, seconds, succeeded):
+        self.scale = scale
+        self.recorder = recorder
+        self.seconds = seconds
+        self.succeeded = succeeded
+
+    def as_dict(self):
+        return OrderedDict([('scale', self.scale), ('seconds', self.seconds),
+                            ('succeeded', self.succeeded),
+                            ('tasks', self.recorder.seconds),
+                            ('peaks', self.recorder.peaks)])
+
+
+def run(make_tasks, scale, root, gaps=GAPS, memory=False):
+    """Builds the tasks returned by `make_tasks()` over sources of
+    `scale` written in `root`
+
+    Scraped pages are read from `root`, and every task runs in this
+    process, so that it can be timed. Raw artifacts are stored
+    uncompressed, as they are written, and the cache of artifacts is
+    disabled, so nothing synthetic is pulled or pushed.
+
+    :rtype: Run
+    """
+    global _recorder
+    pages = write_sources(root, scale, gaps=gaps)
+    cwd = os.getcwd()
+    os.chdir(root)
+    _recorder = recorder = Recorder(memory)
+    started = time.perf_counter()
+    try:
+        with fetching_with(page_fetcher(pages)), cache.disabled(), raw_compression(False):
+            succeeded = build(make_tasks(), local_scheduler=True, workers=1)
+    finally:
+        _recorder = None
+        os.chdir(cwd)
+    return Run(scale, recorder, time.perf_counter() - started, succeeded)
+
+
+def bench(make_tasks, scales=SCALES, gaps=GAPS, memory=False, max_seconds=None, root=None):
+    """Builds the tasks returned by `make_tasks()` over sources of each
+    scale, in order, each in a temporary directory
+
+    :param callable make_tasks: returns the tasks to build
+    :param list scales: countries, relative to the real sources
+    :param float gaps: fraction of countries left out of each source
+    :param bool memory: whether to trace peak memory of each task
+    :param float max_seconds: larger scales are skipped once a build takes longer
+    :param str root: where temporary directories are made
+    :rtype: list
+    """
+    runs = []
+    for scale in scales:
+        with TemporaryDirectory(dir=root) as tmp:
+            result = run(make_tasks, scale, os.path.realpath(tmp), gaps=gaps, memory=memory)
+        runs.append(result)
+        luigi_logger.info('built scale %s in %.1fs', scale, result.seconds)
+        if not result.succeeded:
+            luigi_logger.warning('build failed at scale %s, skipping larger scales', scale)
+            break
+        if max_seconds is not None and result.seconds > max_seconds:
+            luigi_logger.warning('build took %.0fs at scale %s, skipping larger scales',
+                                 result.seconds, scale)
+            break
+    return runs
+
+
+def growth(runs, task):
+    """Returns the exponent of the growth of the runtime of `task`
+    between the two largest scales it ran at, or None
+
+    :rtype: float
+    """
+    points = [(r.scale, r.recorder.seconds[task]) for r in runs
+              if r.recorder.seconds.get(task, 0) > 0]
+    if len(points) < 2 or points[-1][0] == points[-2][0]:
+        return None
+    (s1, t1), (s2, t2) = points[-2:]
+    return math.log(t2 / t1) / math.log(s2 / s1)
+
+
+def format_report(runs):
+    """Returns a line per task with its runtime (and peak memory) at
+    each scale, and its growth, slowest first
+
+    :rtype: str
+    """
+    tasks = list(OrderedDict.fromkeys(task for r in runs for task in r.recorder.seconds))
+    tasks.sort(key=lambda task: -max(r.recorder.seconds.get(task, 0) for r in runs))
+    width = max([len(task) for task in tasks] + [4])
+    lines = ['  '.join(['task'.ljust(width)] + [f'{r.scale}x'.rjust(16) for r in runs] + ['growth'])]
+    for task in tasks:
+        cells = []
+        for r in runs:
+            if task not in r.recorder.seconds:
+                cells.append('-'.rjust(16))
+                continue
+            cell = f'{r.recorder.seconds[task]:.2f}s'
+            if task in r.recorder.peaks:
+                cell += f' {r.recorder.peaks[task] / 2 ** 20:.0f}MB'
+            cells.append(cell.rjust(16))
+        exponent = growth(runs, task)
+        lines.append('  '.join([task.ljust(width)] + cells + ['-' if exponent is None else f'n^{exponent:.1f}']))
+    lines.append('  '.join(['total'.ljust(width)] + [f'{r.seconds:.2f}s'.rjust(16) for r in runs]))
+    return '\n'.join(lines)
@@ -0,0 +1,280 @@
+"""
+Remote cache of salted artifacts, shared by build machines.
+
+Salted filenames address artifacts by their lineage (or content), so an
+artifact built on one machine can be reused as is on another. When a cache
+is configured (see :func:`configure`), salted targets check it whenever
+they don't exist locally, pulling the artifact into `build/` if the cache
+has it, and artifacts are pushed to the cache as soon as the task that
+wrote them succeeds.
+
+Caches are a shared directory (e.g. an NFS mount) or an S3 compatible
+bucket, the latter requiring the optional `boto3` package::
+
+    /mnt/artifacts/make-country-codes
+    s3://bucket/make-country-codes
+
+The endpoint of S3 compatible services (e.g. MinIO) is read from
+`AWS_ENDPOINT_URL`, and credentials as usual for boto3.
+
+Salts of raw sources are the hash of their content, so they are unknown
+until a source has been fetched. The cache also records the latest salt of
+each salted source (see :func:`make_country_codes.utils.record_source_salt`),
+which a machine that hasn't fetched the source uses instead, so that the
+salted source and everything derived from it are pulled rather than fetched
+and built again.
+"""
+import os
+import shutil
+import tempfile
+from abc import ABC
+from abc import abstractmethod
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from luigi import Event
+from luigi import Task
+from luigi.task import flatten
+from luigi.task import logger as luigi_logger
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+# environment variable holding the url of the default cache
+CACHE_ENV = 'MAKE_COUNTRY_CODES_CACHE'
+
+
+class ArtifactCache(ABC):
+    """A store of artifacts keyed by their (salted) filenames"""
+    @abstractmethod
+    def exists(self, key):
+        """Returns whether the cache has the artifact `key`"""
+
+    @abstractmethod
+    def get(self, key, path):
+        """Copies the artifact `key` to `path`"""
+
+    @abstractmethod
+    def put(self, path, key):
+        """Copies the file at `path` to the artifact `key`, replacing it"""
+
+    def pull(self, key, path):
+        """Copies `key` to `path` atomically, if the cache has it
+
+        :returns: whether `key` was pulled
+        :rtype: bool
+        """
+        if not self.exists(key):
+            return False
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}-cache-tmp-{os.getpid()}'
+        try:
+            self.get(key, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    def push(self, path, key):
+        """Copies `path` to `key`, unless the cache already has it
+
+        Artifacts are immutable, so an existing artifact is never replaced.
+
+        :returns: whether `path` was pushed
+        :rtype: bool
+        """
+        if self.exists(key):
+            return False
+        self.put(path, key)
+        return True
+
+    def record(self, key, value):
+        """Records the string `value` as `key`, replacing any previous value
+
+        Unlike artifacts, records change, e.g. the latest salt of a source.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, key)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(value)
+            self.put(path, key)
+
+    def recorded(self, key):
+        """Returns the string recorded as `key`, or None"""
+        if not self.exists(key):
+            return None
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, key)
+            self.get(key, path)
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+
+
+class FilesystemCache(ArtifactCache):
+    """Artifacts in a shared directory
+
+    :param str root: directory of artifacts, created if missing
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def __repr__(self):
+        return f'FilesystemCache({self.root!r})'
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key, path):
+        shutil.copyfile(self._path(key), path)
+
+    def put(self, path, key):
+        # copy then rename, so that readers never see partial artifacts
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f'{self._path(key)}-tmp-{os.getpid()}'
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, self._path(key))
+
+
+class S3Cache(ArtifactCache):
+    """Artifacts in an S3 compatible bucket
+
+    :param str bucket: name of bucket
+    :param str prefix: prefix of keys of artifacts
+    :param client: an S3 client, by default created with `boto3`
+    :raises ImportError: if no client is given and boto3 is not installed
+    """
+    # error codes of objects that don't exist
+    MISSING = ('404', 'NoSuchKey', 'NotFound')
+
+    def __init__(self, bucket, prefix='', client=None):
+        if client is None:
+            if boto3 is None:
+                raise ImportError('S3Cache requires boto3')
+            client = boto3.client('s3', endpoint_url=os.environ.get('AWS_ENDPOINT_URL'))
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client
+
+    def __repr__(self):
+        return f'S3Cache({self.bucket!r}, {self.prefix!r})'
+
+    def _key(self, key):
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if code in self.MISSING:
+                return False
+            raise
+        return True
+
+    def get(self, key, path):
+        self.client.download_file(self.bucket, self._key(key), path)
+
+    def put(self, path, key):
+        self.client.upload_file(path, self.bucket, self._key(key))
+
+
+def from_url(url):
+    """Returns the cache at `url`, e.g. `s3://bucket/prefix` or a directory
+
+    :rtype: ArtifactCache
+    """
+    parts = urlsplit(url)
+    if parts.scheme == 's3':
+        return S3Cache(parts.netloc, parts.path)
+    if parts.scheme == 'file':
+        return FilesystemCache(parts.path)
+    return FilesystemCache(url)
+
+
+_cache = None
+
+
+def configure(cache):
+    """Sets the cache of salted artifacts
+
+    :param cache: an :class:`ArtifactCache`, its url, or None to disable caching
+    """
+    global _cache
+    _cache = from_url(cache) if isinstance(cache, str) else cache
+
+
+def get_cache():
+    """Returns the configured cache, or None"""
+    return _cache
+
+
+@contextmanager
+def disabled():
+    """Disables the configured cache within the context, e.g. for dry runs"""
+    global _cache
+    cache, _cache = _cache, None
+    try:
+        yield
+    finally:
+        _cache = cache
+
+
+configure(os.environ.get(CACHE_ENV) or None)
+
+
+class CachedTargetMixin:
+    """Mixin of local targets of salted artifacts, which exist if they
+    exist locally or can be pulled from the configured cache"""
+    @property
+    def key(self):
+        return os.path.basename(self.path)
+
+    def exists(self):
+        if super().exists():
+            return True
+        cache = get_cache()
+        if cache is None:
+            return False
+        try:
+            pulled = cache.pull(self.key, self.path)
+        except Exception:
+            luigi_logger.warning('failed to pull %s from %r', self.key, cache, exc_info=True)
+            return False
+        if pulled:
+            luigi_logger.info('pulled %s from %r', self.key, cache)
+        return pulled
+
+    def push(self):
+        cache = get_cache()
+        if cache is None or not os.path.exists(self.path):
+            return False
+        return cache.push(self.path, self.key)
+
+
+_cached_classes = {}
+
+
+def cached_target_class(target_class):
+    """Returns a subclass of `target_class` backed by the configured cache"""
+    if target_class not in _cached_classes:
+        _cached_classes[target_class] = type(f'Cached{target_class.__name__}',
+                                             (CachedTargetMixin, target_class), {})
+    return _cached_classes[target_class]
+
+
+@Task.event_handler(Event.SUCCESS)
+def push_outputs(task):
+    """Pushes cached outputs of every successful task"""
+    for target in flatten(task.output()):
+        if isinstance(target, CachedTargetMixin):
+            try:
+                if target.push():
+                    luigi_logger.info('pushed %s to %r', target.key, get_cache())
+            except Exception:
+                luigi_logger.warning('failed to push %s', target.key, exc_info=True)
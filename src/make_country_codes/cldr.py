@@ -0,0 +1,168 @@
+"""
+Territory names of CLDR locales.
+
+Each locale of the Unicode Common Locale Data Repository publishes the
+names of territories in a `territories.json` document, keyed by ISO 3166
+alpha 2 code (or M49 code, for regions). Alternate names are keyed like
+`GB-alt-short`. Documents are parsed with the streaming `ijson` parser
+when it is installed, so a locale is never held in memory as a dict, and
+locales are parsed in a pool of processes.
+
+Names are flattened to a long table of `(code, locale, name, variant)`
+rows, where `variant` is empty for the main name of a territory.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+import requests
+
+from .utils import fetch
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# locales with territory names, by coverage level
+AVAILABLE_LOCALES_URL = ('https://raw.githubusercontent.com/unicode-cldr/cldr-core/'
+                         'master/availableLocales.json')
+# marks alternate names, e.g. `GB-alt-short`
+ALT = '-alt-'
+COLUMNS = ['Code', 'Locale', 'Name', 'Variant']
+# locales parsed by each process at a time
+CHUNKSIZE = 8
+
+
+def available_locales(content, coverage='full'):
+    """Returns locales listed in CLDR's `availableLocales.json`
+
+    :param bytes content: the document
+    :param str coverage: `full` or `modern`
+    :rtype: list
+    """
+    return json.loads(content)['availableLocales'][coverage]
+
+
+def locale_url(url, locale):
+    """Returns the url of `territories.json` of `locale`, given that of
+    another locale, e.g. the `cldr` source in the registry"""
+    head, _, tail = url.rpartition('/main/')
+    return f'{head}/main/{locale}/{tail.split("/", 1)[1]}'
+
+
+def territory_names(f):
+    """Yields `(key, name)` of each territory in a `territories.json` document
+
+    :param f: a binary file
+    """
+    if ijson is None:
+        document = json.load(f)
+        for names in document['main'].values():
+            yield from names['localeDisplayNames']['territories'].items()
+        return
+    # events of names are prefixed `main.{locale}.localeDisplayNames.territories.{key}`
+    for prefix, event, value in ijson.parse(f):
+        if event != 'string':
+            continue
+        parts = prefix.split('.')
+        if len(parts) == 5 and parts[2:4] == ['localeDisplayNames', 'territories']:
+            yield parts[4], value
+
+
+def territory_rows(names, locale):
+    """Yields `(code, locale, name, variant)` of countries in `names`,
+    discarding continents and regions (which have numeric codes)
+
+    :param iterable names: `(key, name)` pairs, see :func:`territory_names`
+    """
+    for key, name in names:
+        code, _, variant = key.partition(ALT)
+        if not code.isdigit():
+            yield code, locale, name, variant
+
+
+def locale_rows(locale_path):
+    """Returns the rows of the `territories.json` of a locale
+
+    :param tuple locale_path: `(locale, path)`, as a single argument for
+        :meth:`multiprocessing.pool.Pool.imap`
+    :rtype: list
+    """
+    locale, path = locale_path
+    with open(path, 'rb') as f:
+        return list(territory_rows(territory_names(f), locale))
+
+
+def iter_rows(paths, processes=None):
+    """Yields the rows of every locale, parsing locales in a process pool
+
+    :param dict paths: paths of `territories.json`, by locale
+    :param int processes: size of pool, defaults to number of CPUs.
+        With 1, locales are parsed in this process
+    """
+    items = sorted(paths.items())
+    if processes == 1 or len(items) < 2:
+        for item in items:
+            yield from locale_rows(item)
+        return
+    with Pool(processes or os.cpu_count()) as pool:
+        for rows in pool.imap(locale_rows, items, chunksize=CHUNKSIZE):
+            yield from rows
+
+
+def fold_alternates(rows):
+    """Returns the name of each territory followed by its alternate names,
+    separated by semicolons, e.g. `United Kingdom; UK`
+
+    :param iterable rows: `(code, locale, name, variant)` of one locale
+    :returns: names by code, in order of first appearance
+    :rtype: OrderedDict
+    """
+    main = {}
+    # alternates may come before the main name, so they are joined last
+    alternates = OrderedDict()
+    for code, _, name, variant in rows:
+        alternates.setdefault(code, [])
+        if variant:
+            alternates[code].append(name)
+        else:
+            main[code] = name
+    return OrderedDict((code, '; '.join(([main[code]] if code in main else []) + names))
+                       for code, names in alternates.items())
+
+
+def fetch_locales(url, locales, directory, throttle_dir, max_workers=4):
+    """Fetches `territories.json` of each locale concurrently
+
+    Locales without territory names are skipped.
+
+    :param str url: url of `territories.json` of any locale
+    :param list locales: locales to fetch
+    :param str directory: where documents are written, as `{locale}.json`
+    :param str throttle_dir: where times of requests to hosts are recorded
+    :param int max_workers: most requests in flight at once
+    :returns: `path` and sha256 `hash` of each fetched document, by locale
+    :rtype: dict
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def fetch_locale(locale):
+        try:
+            content = fetch(locale_url(url, locale), throttle_dir)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return locale, None
+            raise
+        path = os.path.join(directory, f'{locale}.json')
+        with open(f'{path}-tmp-{os.getpid()}', 'wb') as f:
+            f.write(content)
+        os.replace(f.name, path)
+        return locale, {'path': path, 'hash': hashlib.sha256(content).hexdigest()}
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        fetched = dict(executor.map(fetch_locale, locales))
+    return {locale: entry for locale, entry in sorted(fetched.items()) if entry}
@@ -14,23 +14,219 @@ Why does this file exist, and why not put this in __main__?
 
   Also see (1) from http://click.pocoo.org/5/setuptools/#setuptools-integration
 """
+import json
+import logging
 import argparse
 
 from luigi import build
+from luigi.configuration import get_config
 
+from . import cache
+from . import projection
+from . import utils
+from .tasks.data import configure_host_resources
 from .tasks.data import SaltedSources
 from .tasks.assemble import Datapackage
 from .tasks.assemble import CountryCodes
+from .tasks.assemble import cldrLocales
+from .tasks.export import Database
+from .tasks.export import History
+from .tasks.export import NameIndex
+from .tasks.export import Shards
 
-parser = argparse.ArgumentParser(description='Command description.')
-parser.add_argument('names', metavar='NAME', nargs=argparse.ZERO_OR_MORE,
-                    help="A name of something.")
+parser = argparse.ArgumentParser(description='Make a datapackage of standard country codes.')
+subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
 
+# options shared by `build` and `plan`, which define the graph of tasks
+graph_parser = argparse.ArgumentParser(add_help=False)
+graph_parser.add_argument('--early-cutoff', action='store_true',
+                          help="Salt derived tables by the content of their inputs, reusing "
+                               "tables whose inputs are unchanged.")
+graph_parser.add_argument('--compress-raw', action='store_true',
+                          help="Store raw upstream artifacts zstandard-compressed (requires zstandard).")
+graph_parser.add_argument('--history', default=None, metavar='PATH',
+                          help="Also add the built table to this append-only store "
+                               "(e.g. history.sqlite).")
+graph_parser.add_argument('--cldr-locales', default=None, metavar='LOCALES',
+                          help="Also build territory names of CLDR locales, 'all' or "
+                               "comma separated (e.g. fr,de).")
+graph_parser.add_argument('--columns', default=None, metavar='PATTERNS',
+                          help="Only build these columns or schemes of the table, comma separated "
+                               "patterns (e.g. 'ISO*,M49,*(iso4217)'), fetching only the sources "
+                               "they need.")
+graph_parser.add_argument('--duckdb', action='store_true',
+                          help="Also export the table to a DuckDB database (requires duckdb).")
 
-def main(args=None):
-    args = parser.parse_args(args=args)
-    print(args.names)
-    build([
+build_parser = subparsers.add_parser('build', parents=[graph_parser],
+                                     help="Build the country codes datapackage (default).")
+build_parser.add_argument('--workers', type=int, default=1,
+                          help="Tasks run in parallel; fetches from each host stay "
+                               "within its politeness limits.")
+build_parser.add_argument('--backend', default='pandas', choices=['pandas', 'polars'],
+                          help="DataFrame library used to join sources.")
+build_parser.add_argument('--cache', default=None,
+                          help="Shared cache of salted artifacts, a directory or s3://bucket/prefix "
+                               "(defaults to $MAKE_COUNTRY_CODES_CACHE).")
+
+watch_parser = subparsers.add_parser('watch', parents=[graph_parser],
+                                     help="Rebuild in a warm process whenever sources in build/ change.")
+watch_parser.add_argument('--interval', type=float, default=2.0,
+                          help="Seconds between checks for changes.")
+watch_parser.add_argument('--frames', type=int, default=64,
+                          help="Most parsed frames kept in memory, 0 to keep none.")
+
+bench_parser = subparsers.add_parser('bench', parents=[graph_parser],
+                                     help="Build over synthetic sources of growing size, and report how tasks scale.")
+bench_parser.add_argument('--scales', default='1,10,100',
+                          help="Comma separated sizes of sources, relative to the real ones.")
+bench_parser.add_argument('--gaps', type=float, default=0.02,
+                          help="Fraction of countries left out of each source.")
+bench_parser.add_argument('--memory', action='store_true',
+                          help="Also trace peak memory of each task (slower).")
+bench_parser.add_argument('--max-seconds', type=float, default=None,
+                          help="Skip larger scales once a build takes longer.")
+bench_parser.add_argument('--root', default=None,
+                          help="Where temporary build directories are made.")
+bench_parser.add_argument('--json', action='store_true',
+                          help="Print each scale as JSON lines.")
+
+plan_parser = subparsers.add_parser('plan', parents=[graph_parser],
+                                    help="Show what a build would run and why, without running it.")
+plan_parser.add_argument('--json', action='store_true',
+                         help="Print steps as JSON lines.")
+
+history_parser = subparsers.add_parser('history', help="Query the history of country codes.")
+history_parser.add_argument('entity', help="ISO 3166 alpha 3 code, e.g. DZA.")
+history_parser.add_argument('--as-of', dest='date',
+                            help="Date (YYYY-MM-DD) of values, defaults to today.")
+history_parser.add_argument('--field', default=None,
+                            help="Only print the value of this column.")
+history_parser.add_argument('--db', default='history.sqlite',
+                            help="Append-only store built with `build --history`.")
+
+serve_parser = subparsers.add_parser('serve', help="Serve lookups over the latest built table.")
+serve_parser.add_argument('--host', default='127.0.0.1')
+serve_parser.add_argument('--port', type=int, default=8049)
+serve_parser.add_argument('--root', default='build/',
+                          help="Directory of built artifacts.")
+serve_parser.add_argument('--cache-size', type=int, default=4096,
+                          help="Number of responses kept in the LRU cache.")
+serve_parser.add_argument('--reload-interval', type=float, default=5.0,
+                          help="Seconds between checks for a newly built table.")
+
+enrich_parser = subparsers.add_parser('enrich', help="Append code columns to a large CSV or Parquet file.")
+enrich_parser.add_argument('--in', dest='in_path', required=True,
+                           help="Input CSV or Parquet file.")
+enrich_parser.add_argument('--out', dest='out_path', required=True,
+                           help="Output CSV or Parquet file.")
+enrich_parser.add_argument('--col', required=True,
+                           help="Column of input to look up.")
+enrich_parser.add_argument('--from', dest='from_scheme', default='name',
+                           help="Scheme of values in column, e.g. ISO2 or name.")
+enrich_parser.add_argument('--to', dest='to_schemes', default='ISO3',
+                           help="Comma separated schemes of codes to append, e.g. ISO3,M49.")
+enrich_parser.add_argument('--chunksize', type=int, default=100000,
+                           help="Rows read, enriched and written at a time.")
+enrich_parser.add_argument('--processes', type=int, default=None,
+                           help="Size of process pool, defaults to number of CPUs.")
+enrich_parser.add_argument('--root', default='build/',
+                           help="Directory of built artifacts.")
+
+
+def build_tasks(args):
+    """Returns the tasks built by `args` of `build` (or `plan`)"""
+    columns = getattr(args, 'columns', None)
+    if columns:
+        # exports describe the whole table, so only the projection is built
+        return [CountryCodes(columns=projection.normalize(columns))]
+    tasks = [
         #SaltedSources(),
         Datapackage(),
-    ], local_scheduler=True)
+        NameIndex(),
+        Database(),
+        Shards(),
+    ]
+    if getattr(args, 'history', None):
+        tasks.append(History(path=args.history))
+    locales = getattr(args, 'cldr_locales', None)
+    if locales:
+        tasks.append(cldrLocales(locales='' if locales == 'all' else locales))
+    if getattr(args, 'duckdb', False):
+        tasks.append(Database(engine='duckdb'))
+    return tasks
+
+
+def main(args=None):
+    args = parser.parse_args(args=args)
+    if args.command == 'serve':
+        from .service import serve
+        logging.basicConfig(level=logging.INFO)
+        serve(host=args.host, port=args.port, root=args.root,
+              cache_size=args.cache_size, reload_interval=args.reload_interval)
+        return
+
+    if args.command == 'enrich':
+        from .enrich import enrich
+        enrich(args.in_path, args.out_path, args.col, args.from_scheme,
+               args.to_schemes.split(','), root=args.root,
+               chunksize=args.chunksize, processes=args.processes)
+        return
+
+    if args.command == 'history':
+        from .history import History as Store
+        from .history import today
+        with Store(args.db) as store:
+            date = args.date or today()
+            if args.field:
+                print(json.dumps(store.value_as_of(args.entity, args.field, date),
+                                 ensure_ascii=False))
+            else:
+                print(json.dumps(store.as_of(args.entity, date), ensure_ascii=False,
+                                 indent=2, sort_keys=True))
+        return
+
+    utils.EARLY_CUTOFF = getattr(args, 'early_cutoff', False)
+    if getattr(args, 'compress_raw', False):
+        config = get_config()
+        if not config.has_section('make-country-codes'):
+            config.add_section('make-country-codes')
+        config.set('make-country-codes', 'compress_raw', 'true')
+    if args.command == 'plan':
+        from .plan import format_plan
+        from .plan import plan
+        steps = plan(build_tasks(args))
+        if args.json:
+            for step in steps:
+                print(json.dumps(step.as_dict()))
+        else:
+            print(format_plan(steps))
+        return
+
+    if args.command == 'bench':
+        from .bench import bench
+        from .bench import format_report
+        runs = bench(lambda: build_tasks(args), scales=[float(s) for s in args.scales.split(',')],
+                     gaps=args.gaps, memory=args.memory, max_seconds=args.max_seconds,
+                     root=args.root)
+        if args.json:
+            for run in runs:
+                print(json.dumps(run.as_dict()))
+        else:
+            print(format_report(runs))
+        return
+
+    if args.command == 'watch':
+        from .watch import watch
+        configure_host_resources()
+        watch(lambda: build_tasks(args), interval=args.interval,
+              frame_cache_size=args.frames)
+        return
+
+    if getattr(args, 'cache', None):
+        cache.configure(args.cache)
+    configure_host_resources()
+    config = get_config()
+    if not config.has_section('CountryCodes'):
+        config.add_section('CountryCodes')
+    config.set('CountryCodes', 'backend', getattr(args, 'backend', 'pandas'))
+    build(build_tasks(args), local_scheduler=True, workers=getattr(args, 'workers', 1))
@@ -0,0 +1,163 @@
+"""
+SQL databases of the assembled table.
+
+The assembled table has a column per field of each source. In a
+database it is normalized into:
+
+- `countries`, a row per country with a column per code scheme (see
+  :data:`make_country_codes.table.SCHEMES`), each of them indexed
+- `attributes`, every other non-empty field of each country, by column
+- `names`, every variant of every name of each country (see
+  :data:`make_country_codes.names.NAME_COLUMNS`), with its language and
+  folded form, and a full text index over them (`names_fts`) in SQLite
+
+so that services can join on any scheme, e.g.::
+
+    SELECT c."ISO3", a.value FROM countries c
+    JOIN attributes a ON a.country_id = c.id AND a."column" = 'Capital (geonames)'
+    WHERE c."FIFA" = 'ALG'
+
+    SELECT c."ISO3" FROM names_fts JOIN names n ON n.id = names_fts.rowid
+    JOIN countries c ON c.id = n.country_id WHERE names_fts MATCH 'ivoire'
+
+SQLite is always written, and DuckDB only when requested (with `--duckdb`,
+or `Database(engine='duckdb')`), which requires the `duckdb` package.
+Rows are inserted in bulk in a single transaction.
+"""
+import sqlite3
+
+from .names import fold
+from .names import variants
+from .names import NAME_COLUMNS
+from .table import SCHEMES
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# name columns and their language
+NAME_LANGUAGES = {column: lang for lang, columns in NAME_COLUMNS.items() for column in columns}
+
+
+def quote(name):
+    """Quotes an SQL identifier"""
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def schema(full_text=True):
+    """Returns statements creating the tables, without indexes
+
+    :param bool full_text: whether to create an FTS5 index of names
+    :rtype: list
+    """
+    schemes = ',\n    '.join(f'{quote(scheme)} TEXT' for scheme in SCHEMES)
+    statements = [
+        f'CREATE TABLE countries (\n    id INTEGER PRIMARY KEY,\n    {schemes}\n)',
+        'CREATE TABLE attributes (\n    country_id INTEGER NOT NULL REFERENCES countries (id),\n'
+        '    "column" TEXT NOT NULL,\n    value TEXT NOT NULL\n)',
+        'CREATE TABLE names (\n    id INTEGER PRIMARY KEY,\n'
+        '    country_id INTEGER NOT NULL REFERENCES countries (id),\n'
+        '    lang TEXT NOT NULL,\n    "column" TEXT NOT NULL,\n'
+        '    name TEXT NOT NULL,\n    folded TEXT NOT NULL\n)',
+    ]
+    if full_text:
+        statements.append("CREATE VIRTUAL TABLE names_fts USING fts5(name, folded, content='names', "
+                          "content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+    return statements
+
+
+def indexes():
+    """Returns statements creating indexes, run after rows are inserted
+
+    :rtype: list
+    """
+    statements = [f'CREATE INDEX {quote("countries_" + scheme)} ON countries ({quote(scheme)})'
+                  for scheme in SCHEMES]
+    statements += ['CREATE INDEX attributes_country ON attributes (country_id)',
+                   'CREATE INDEX attributes_column ON attributes ("column", value)',
+                   'CREATE INDEX names_country ON names (country_id)',
+                   'CREATE INDEX names_folded ON names (folded)']
+    return statements
+
+
+def normalize(rows):
+    """Splits rows of the assembled table into rows of each table
+
+    :param iterable rows: dicts keyed by columns of the assembled table
+    :returns: lists of tuples, keyed by table
+    :rtype: dict
+    """
+    scheme_columns = set(SCHEMES.values())
+    tables = {'countries': [], 'attributes': [], 'names': []}
+    for country_id, row in enumerate(rows, 1):
+        tables['countries'].append((country_id,) + tuple(row.get(column) or None
+                                                         for column in SCHEMES.values()))
+        for column, value in row.items():
+            if not value or column in scheme_columns:
+                continue
+            tables['attributes'].append((country_id, column, value))
+            if column in NAME_LANGUAGES:
+                for variant in variants(value):
+                    tables['names'].append((len(tables['names']) + 1, country_id,
+                                            NAME_LANGUAGES[column], column, variant, fold(variant)))
+    return tables
+
+
+def insert_statement(table, width):
+    return f'INSERT INTO {table} VALUES ({", ".join(["?"] * width)})'
+
+
+def write_sqlite(rows, path):
+    """Writes rows of the assembled table to a new SQLite database at `path`
+
+    :param iterable rows: dicts keyed by columns of the assembled table
+    """
+    tables = normalize(rows)
+    db = sqlite3.connect(path)
+    try:
+        try:
+            db.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(name)')
+            full_text = True
+        except sqlite3.OperationalError:
+            # sqlite3 built without FTS5
+            full_text = False
+        with db:
+            for statement in schema(full_text):
+                db.execute(statement)
+            for table, values in tables.items():
+                if values:
+                    db.executemany(insert_statement(table, len(values[0])), values)
+            for statement in indexes():
+                db.execute(statement)
+            if full_text:
+                db.execute("INSERT INTO names_fts (names_fts) VALUES ('rebuild')")
+    finally:
+        db.close()
+
+
+def write_duckdb(rows, path):
+    """Writes rows of the assembled table to a new DuckDB database at `path`
+
+    DuckDB's full text search is an extension, so names are only indexed
+    by their folded form.
+
+    :param iterable rows: dicts keyed by columns of the assembled table
+    :raises ImportError: if duckdb is not installed
+    """
+    if duckdb is None:
+        raise ImportError('writing DuckDB databases requires duckdb')
+    tables = normalize(rows)
+    db = duckdb.connect(path)
+    try:
+        db.execute('BEGIN TRANSACTION')
+        for statement in schema(full_text=False):
+            db.execute(statement)
+        for table, values in tables.items():
+            if values:
+                db.executemany(insert_statement(table, len(values[0])), values)
+        for statement in indexes():
+            db.execute(statement)
+        db.execute('COMMIT')
+    finally:
+        db.close()
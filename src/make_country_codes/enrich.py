@@ -0,0 +1,149 @@
+"""
+Streaming enrichment of large CSV or Parquet files with country codes.
+
+The input is read in chunks, which are enriched in a pool of processes
+and written out in their original order as soon as they are ready. At
+most a few chunks per process are in flight at once, so memory use is
+bounded regardless of the size of the input.
+"""
+import os
+from collections import deque
+from multiprocessing import Pool
+
+import pandas as pd
+
+from .table import latest_paths
+from .table import CountryTable
+
+try:
+    import pyarrow
+    from pyarrow import parquet
+except ImportError:
+    pyarrow = None
+
+# chunks in flight per process
+QUEUE_DEPTH = 2
+
+_table = None
+
+
+def load_table(path, index_path):
+    global _table
+    _table = CountryTable.load(path, index_path=index_path)
+
+
+def enrich_chunk(chunk, column, from_scheme, to_schemes):
+    """Appends a column of codes for each of `to_schemes` to `chunk`
+
+    Each distinct value of `column` is looked up once per chunk.
+
+    :param pandas.DataFrame chunk: rows of the input file
+    :param str column: column of `chunk` to look up
+    :param str from_scheme: scheme of values in `column`, or `name`
+    :param list to_schemes: schemes of codes to append
+    :rtype: pandas.DataFrame
+    """
+    values = chunk[column]
+    rows = {v: _table.find(v, from_scheme) for v in values.dropna().unique()}
+    for scheme in to_schemes:
+        target = _table.column(scheme)
+        codes = {v: (row[target] if row else '') for v, row in rows.items()}
+        chunk[f'{column}_{scheme}'] = values.map(codes).fillna('')
+    return chunk
+
+
+def format_chunk(chunk, header, out_format):
+    if out_format == 'parquet':
+        return pyarrow.Table.from_pandas(chunk, preserve_index=False)
+    return chunk.to_csv(index=False, header=header)
+
+
+def process_chunk(chunk, header, column, from_scheme, to_schemes, out_format):
+    return format_chunk(enrich_chunk(chunk, column, from_scheme, to_schemes),
+                        header, out_format)
+
+
+def file_format(path):
+    return 'parquet' if path.endswith(('.parquet', '.pq')) else 'csv'
+
+
+def read_chunks(path, chunksize):
+    """Yields DataFrames of at most `chunksize` rows of the file at `path`"""
+    if file_format(path) == 'parquet':
+        if pyarrow is None:
+            raise ImportError('reading Parquet requires pyarrow')
+        for batch in parquet.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        # read everything as strings, so codes keep their leading zeros
+        yield from pd.read_csv(path, dtype=str, keep_default_na=False,
+                               na_values=[''], chunksize=chunksize)
+
+
+def enrich(in_path, out_path, column, from_scheme, to_schemes, root='build/',
+           chunksize=100000, processes=None):
+    """Enriches `in_path` with codes, writing the result to `out_path`
+
+    :param str in_path: location of input CSV or Parquet file
+    :param str out_path: location of output CSV or Parquet file
+    :param str column: column of input to look up
+    :param str from_scheme: scheme of values in `column`, or `name`
+    :param list to_schemes: schemes of codes to append as columns
+    :param str root: directory of built country codes table
+    :param int chunksize: rows per chunk
+    :param int processes: size of process pool, defaults to number of CPUs
+    :returns: number of rows written
+    :rtype: int
+    """
+    table_path, index_path = latest_paths(root)
+
+    # validate schemes up front, rather than in every process
+    load_table(table_path, index_path)
+    for scheme in to_schemes:
+        _table.column(scheme)
+
+    out_format = file_format(out_path)
+    if out_format == 'parquet' and pyarrow is None:
+        raise ImportError('writing Parquet requires pyarrow')
+    processes = processes or os.cpu_count()
+    written = 0
+    writer = None
+    tmp_path = f'{out_path}-tmp-{os.getpid()}'
+
+    with Pool(processes, initializer=load_table,
+              initargs=(table_path, index_path)) as pool:
+        pending = deque()
+
+        def write(result):
+            nonlocal writer
+            if out_format == 'parquet':
+                if writer is None:
+                    writer = parquet.ParquetWriter(tmp_path, result.schema)
+                writer.write_table(result.cast(writer.schema))
+            else:
+                writer.write(result)
+
+        if out_format == 'csv':
+            writer = open(tmp_path, 'w', newline='', encoding='utf-8')
+        try:
+            for n, chunk in enumerate(read_chunks(in_path, chunksize)):
+                pending.append(pool.apply_async(
+                    process_chunk, (chunk, n == 0, column, from_scheme,
+                                    to_schemes, out_format)))
+                written += len(chunk)
+                # write finished chunks in order, bounding chunks in flight
+                while len(pending) >= processes * QUEUE_DEPTH:
+                    write(pending.popleft().get())
+            while pending:
+                write(pending.popleft().get())
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if writer is not None:
+            writer.close()
+
+    os.replace(tmp_path, out_path)
+    return written
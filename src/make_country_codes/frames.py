@@ -0,0 +1,163 @@
+"""
+Columnar storage of intermediate DataFrames.
+
+Frames are stored as Feather (Arrow IPC) files when `pyarrow` is
+installed, which are read back without parsing, or else pickled.
+Both round trip the types of columns, unlike CSV, and are how tasks hand
+tables to each other; only published tables are CSV. Tables of codes
+are handed over as text (see :func:`as_text`), so that codes keep their
+leading zeros and missing values match across sources.
+
+A long running process (see `make-country-codes watch`) can also keep
+frames in memory with :func:`keep_frames`, so that files which have not
+changed since they were last read are not parsed again.
+"""
+import os
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+FEATHER_EXT = '.feather'
+PICKLE_EXT = '.pkl'
+# extension of frames written by :func:`write_frame`
+FRAME_EXT = FEATHER_EXT if pyarrow is not None else PICKLE_EXT
+
+
+# frames kept in memory by default, see :func:`keep_frames`
+FRAME_CACHE_SIZE = 64
+
+
+class FrameCache:
+    """The most recently read frames, by path and reader, kept while
+    the size and mtime of their files are unchanged
+
+    :param int size: most frames kept
+    """
+    def __init__(self, size=FRAME_CACHE_SIZE):
+        self.size = size
+        self.frames = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, path, key, read):
+        """Returns a copy of the frame read from `path` by `read()`
+
+        :param str key: identifies the reader and its options
+        :param callable read: returns the frame
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        entry = self.frames.get((path, key))
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            self.frames.move_to_end((path, key))
+        else:
+            self.misses += 1
+            entry = self.frames[(path, key)] = (stamp, read())
+            while len(self.frames) > self.size:
+                self.frames.popitem(last=False)
+        # callers are free to modify the frames they read
+        return entry[1].copy()
+
+
+_frame_cache = None
+
+
+def keep_frames(size=FRAME_CACHE_SIZE):
+    """Keeps frames read with :func:`cached_frame` in memory, or stops
+    keeping them if `size` is 0
+
+    :returns: the cache, or None
+    :rtype: FrameCache
+    """
+    global _frame_cache
+    _frame_cache = FrameCache(size) if size else None
+    return _frame_cache
+
+
+def get_frame_cache():
+    """Returns the cache of frames kept in memory, or None"""
+    return _frame_cache
+
+
+def cached_frame(path, read, key=''):
+    """Returns the frame read from `path` by `read()`, from memory if
+    frames are kept (see :func:`keep_frames`) and `path` is unchanged
+
+    :rtype: pandas.DataFrame
+    """
+    if _frame_cache is None:
+        return read()
+    return _frame_cache.get(path, key, read)
+
+
+def as_text(df, float_format='%.0f', date_format='%Y-%m-%d', na_values=('_',)):
+    """Returns a copy of `df` with every value as a string, like a CSV of
+    `df` read without type inference (see :func:`make_country_codes.schema.read_csv`)
+
+    :param str float_format: format of values of float columns
+    :param str date_format: format of values of datetime columns
+    :param tuple na_values: values that are missing, like NaN and None
+    :returns: frame of strings, with missing values empty
+    :rtype: pandas.DataFrame
+    """
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if values.dtype.kind == 'f':
+            values = values.map(lambda value: float_format % value, na_action='ignore')
+        elif values.dtype.kind == 'M':
+            values = values.dt.strftime(date_format).where(values.notnull())
+        else:
+            values = values.astype(object).map(str, na_action='ignore')
+        df[column] = values.where(~values.isin(na_values)).fillna('').astype(object)
+    return df
+
+
+def write_frame(df, path):
+    """Writes `df` to `path`, as Feather or a pickle by its extension
+
+    The index of `df` is not stored.
+    """
+    df = df.reset_index(drop=True)
+    if path.endswith(FEATHER_EXT):
+        df.to_feather(path)
+    else:
+        df.to_pickle(path)
+
+
+def write_frames(frames, path, columns):
+    """Writes `frames` to `path` as a single frame, see :func:`write_frame`
+
+    As Feather, each frame is written as a record batch as soon as it is
+    yielded, so only one is held in memory. Pickles can't be appended to,
+    so without pyarrow the frames are concatenated first.
+
+    :param iterable frames: frames of text (see :func:`as_text`), of `columns`
+    :param list columns: columns of every frame, and of the frame written
+    """
+    if not path.endswith(FEATHER_EXT):
+        frames = [df[columns] for df in frames]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+        df.to_pickle(path)
+        return
+    schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+    with pyarrow.OSFile(path, 'wb') as sink, pyarrow.ipc.new_file(sink, schema) as writer:
+        for df in frames:
+            writer.write_batch(pyarrow.RecordBatch.from_pandas(df[columns], schema=schema,
+                                                               preserve_index=False))
+
+
+def read_frame(path):
+    """Reads a frame written by :func:`write_frame`
+
+    :rtype: pandas.DataFrame
+    """
+    if path.endswith(FEATHER_EXT):
+        return cached_frame(path, lambda: pd.read_feather(path))
+    return cached_frame(path, lambda: pd.read_pickle(path))
@@ -0,0 +1,302 @@
+"""
+Append-only history of country codes, with as-of and range queries.
+
+Each fact records that a field of an entity (a country, identified by its
+ISO 3166 alpha 3 code) had a value from `valid_from`, optionally until an
+explicit `valid_to`. Facts are never updated or deleted: a change is a new
+fact with a later `valid_from`, and a field losing its value is recorded
+as a fact whose value is NULL. The value of a field on a date is that of
+the fact with the latest `valid_from` on or before the date which has not
+expired by then (ties going to the most recently appended fact).
+
+Each generation of the assembled table is ingested once, keyed by its
+salt, appending only the facts that changed since the previous
+generation. Facts known from sources with dates (e.g. `start-date` and
+`end-date` of the UK government's register, withdrawal dates of
+historic ISO 4217 currencies) are seeded the same way.
+
+Like :mod:`make_country_codes.names`, this module depends only on the
+standard library.
+"""
+import re
+import sqlite3
+from bisect import bisect_right
+from datetime import datetime
+
+# key of entities in the assembled table
+ENTITY = 'ISO3 (exio-wiod-eora)'
+# `valid_from` of facts known to hold since before any recorded date
+MIN_DATE = '0001-01-01'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    generation TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    valid_from TEXT NOT NULL,
+    ingested_at TEXT NOT NULL,
+    facts INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS facts (
+    id INTEGER PRIMARY KEY,
+    entity TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT,
+    valid_from TEXT NOT NULL,
+    valid_to TEXT,
+    generation TEXT NOT NULL REFERENCES generations (generation)
+);
+CREATE INDEX IF NOT EXISTS facts_as_of ON facts (entity, field, valid_from);
+CREATE INDEX IF NOT EXISTS facts_range ON facts (valid_from);
+CREATE TRIGGER IF NOT EXISTS facts_append_only BEFORE UPDATE ON facts
+BEGIN
+    SELECT RAISE(ABORT, 'facts are append-only');
+END;
+CREATE TRIGGER IF NOT EXISTS facts_append_only_delete BEFORE DELETE ON facts
+BEGIN
+    SELECT RAISE(ABORT, 'facts are append-only');
+END;
+"""
+
+
+# fields of the assembled table known from ISO 4217 currency lists
+CURRENCY_FIELDS = ['Currency Name (iso4217)', 'Currency Code Alpha (iso4217)',
+                   'Currency Code Numeric (iso4217)']
+
+
+def today():
+    return datetime.utcnow().strftime('%Y-%m-%d')
+
+
+def withdrawal_date(text):
+    """Returns the (last) date of a withdrawal of an ISO 4217 currency,
+    which may be a year, a month or a range, e.g. `1989 to 1990`
+
+    >>> withdrawal_date('2008-01'), withdrawal_date('1989 to 1990')
+    ('2008-01-01', '1990-01-01')
+    """
+    dates = re.findall(r'(\d{4})(?:-(\d{2}))?', text or '')
+    if not dates:
+        return None
+    year, month = dates[-1]
+    return f'{year}-{month or "01"}-01'
+
+
+def ukgov_facts(records, iso3_by_iso2):
+    """Returns facts of items of the UK government's country (or
+    territory) register, valid between their `start-date` and `end-date`
+
+    :param iterable records: items of the register, keyed by field
+    :param dict iso3_by_iso2: entities of current countries, by their
+        2 letter codes. Other records are keyed like `ukgov:SU`
+    :rtype: list
+    """
+    facts = []
+    for record in records:
+        code = record.get('country') or record.get('territory')
+        if not code:
+            continue
+        entity = iso3_by_iso2.get(code, f'ukgov:{code}')
+        valid_from = record.get('start-date') or MIN_DATE
+        valid_to = record.get('end-date') or None
+        for field, value in record.items():
+            if field not in ('start-date', 'end-date') and value:
+                facts.append((entity, f'{field} (ukgov)', value, valid_from, valid_to))
+    return facts
+
+
+def currency_facts(entries, resolve, current):
+    """Returns facts of currencies withdrawn from each country and of
+    the currency that followed
+
+    The withdrawal dates of a country's currencies are chained, each
+    currency being valid from the withdrawal of the one before it.
+
+    :param iterable entries: dicts of historic ISO 4217 entries, keyed by
+        `CtryNm`, `CcyNm`, `Ccy`, `CcyNbr` and `WthdrwlDt`
+    :param callable resolve: returns the entity of a country name, or None
+    :param dict current: rows of the assembled table, by entity
+    :rtype: list
+    """
+    withdrawn = {}
+    for entry in entries:
+        ended = withdrawal_date(entry.get('WthdrwlDt'))
+        name = entry.get('CtryNm')
+        if not (ended and name):
+            continue
+        entity = resolve(name) or f'iso4217:{name}'
+        values = [entry.get('CcyNm'), entry.get('Ccy'), entry.get('CcyNbr')]
+        withdrawn.setdefault(entity, []).append((ended, values))
+
+    facts = []
+    for entity, currencies in withdrawn.items():
+        valid_from = MIN_DATE
+        for ended, values in sorted(currencies, key=lambda c: c[0]):
+            facts.extend((entity, field, value, valid_from, ended)
+                         for field, value in zip(CURRENCY_FIELDS, values) if value)
+            valid_from = ended
+        row = current.get(entity, {})
+        facts.extend((entity, field, row[field], valid_from, None)
+                     for field in CURRENCY_FIELDS if row.get(field))
+    return facts
+
+
+class History:
+    """An append-only store of facts in the SQLite database at `path`
+
+    :param str path: location of the database, created if missing
+    """
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def has_generation(self, generation):
+        row = self.db.execute('SELECT 1 FROM generations WHERE generation = ?',
+                              (generation,)).fetchone()
+        return row is not None
+
+    def current(self):
+        """Returns the latest value of every field of every entity
+
+        :returns: values keyed by `(entity, field)`
+        :rtype: dict
+        """
+        cursor = self.db.execute('SELECT entity, field, value FROM facts '
+                                 'ORDER BY valid_from, id')
+        return {(entity, field): value for entity, field, value in cursor}
+
+    def append(self, facts, generation, kind, valid_from):
+        """Appends `facts` of a generation in a single transaction
+
+        :param list facts: `(entity, field, value, valid_from, valid_to)` tuples
+        :param str generation: e.g. salt of an assembled table
+        :param str kind: e.g. `country-codes` or the name of a source
+        :param str valid_from: date of the generation
+        :returns: number of facts appended, or None if `generation`
+            has already been appended
+        """
+        with self.db:
+            # checked in the same transaction, so that concurrent builds
+            # append each generation once
+            cursor = self.db.execute('INSERT OR IGNORE INTO generations VALUES (?, ?, ?, ?, ?)',
+                                     (generation, kind, valid_from,
+                                      datetime.utcnow().isoformat(), len(facts)))
+            if not cursor.rowcount:
+                return None
+            self.db.executemany('INSERT INTO facts (entity, field, value, valid_from, '
+                                'valid_to, generation) VALUES (?, ?, ?, ?, ?, ?)',
+                                [fact + (generation,) for fact in facts])
+        return len(facts)
+
+    def ingest(self, rows, generation, valid_from=None, entity=ENTITY):
+        """Appends the changes in a generation of the assembled table
+
+        Fields whose value differs from the current one are appended
+        with `valid_from`, and fields of entities that no longer have a
+        value are appended as NULL.
+
+        :param iterable rows: dicts keyed by columns of the assembled table
+        :param str generation: salt of the table
+        :param str valid_from: date of the table, defaults to today
+        :param str entity: column identifying entities
+        :returns: number of facts appended, or None if already ingested
+        """
+        if self.has_generation(generation):
+            return None
+        valid_from = valid_from or today()
+        current = self.current()
+        observed = {}
+        for row in rows:
+            key = row.get(entity)
+            if not key:
+                continue
+            for field, value in row.items():
+                if value:
+                    observed.setdefault((key, field), value)
+
+        facts = [(key, field, value, valid_from, None)
+                 for (key, field), value in observed.items()
+                 if current.get((key, field)) != value]
+        facts.extend((key, field, None, valid_from, None)
+                     for (key, field), value in current.items()
+                     if value is not None and (key, field) not in observed)
+        return self.append(facts, generation, 'country-codes', valid_from)
+
+    def as_of(self, entity, date):
+        """Returns the value of every field of `entity` on `date`
+
+        :param str entity: e.g. `DZA`
+        :param str date: ISO 8601 date, e.g. `2010-06-30`
+        :rtype: dict
+        """
+        cursor = self.db.execute('SELECT field, value, valid_to FROM facts '
+                                 'WHERE entity = ? AND valid_from <= ? '
+                                 'ORDER BY field, valid_from, id', (entity, date))
+        values = {}
+        for field, value, valid_to in cursor:
+            if valid_to is None or valid_to > date:
+                values[field] = value
+        return {field: value for field, value in values.items() if value is not None}
+
+    def value_as_of(self, entity, field, date):
+        """Returns the value of `field` of `entity` on `date`, or None"""
+        cursor = self.db.execute('SELECT value, valid_to FROM facts '
+                                 'WHERE entity = ? AND field = ? AND valid_from <= ? '
+                                 'ORDER BY valid_from DESC, id DESC', (entity, field, date))
+        for value, valid_to in cursor:
+            if valid_to is None or valid_to > date:
+                return value
+        return None
+
+    def changes(self, start, end, field=None):
+        """Returns facts that became valid on or after `start` and before `end`
+
+        :param str field: only return facts of this field
+        :returns: `(entity, field, value, valid_from, valid_to)` tuples
+        :rtype: list
+        """
+        query = ('SELECT entity, field, value, valid_from, valid_to FROM facts '
+                 'WHERE valid_from >= ? AND valid_from < ?')
+        params = [start, end]
+        if field is not None:
+            query += ' AND field = ?'
+            params.append(field)
+        return self.db.execute(query + ' ORDER BY valid_from, id', params).fetchall()
+
+    def resolver(self, field):
+        """Returns a function of `(entity, date)` returning the value of
+        `field` on that date
+
+        The intervals of `field` are loaded once, so that each lookup is a
+        binary search in memory, e.g. for backfilling millions of dated records.
+
+        :rtype: callable
+        """
+        intervals = {}
+        cursor = self.db.execute('SELECT entity, value, valid_from, valid_to FROM facts '
+                                 'WHERE field = ? ORDER BY entity, valid_from, id', (field,))
+        for entity, value, valid_from, valid_to in cursor:
+            starts, facts = intervals.setdefault(entity, ([], []))
+            starts.append(valid_from)
+            facts.append((value, valid_to))
+
+        def resolve(entity, date):
+            if entity not in intervals:
+                return None
+            starts, facts = intervals[entity]
+            # latest fact valid on `date` which has not expired
+            for i in range(bisect_right(starts, date) - 1, -1, -1):
+                value, valid_to = facts[i]
+                if valid_to is None or valid_to > date:
+                    return value
+            return None
+        return resolve
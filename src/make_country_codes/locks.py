@@ -0,0 +1,181 @@
+"""
+Advisory locks of targets, shared by processes building into one `build/`.
+
+Before a task writes its outputs, it takes a lock file next to each of
+them (created with `O_EXCL`, so exactly one process holds it). A second
+process building the same target waits for the lock, and then adopts the
+output built by the holder rather than downloading or computing it again.
+
+Lock files record the pid, host and time of their holder. A lock is stale
+when its holder has exited (if it ran on this host), or when it is older
+than `stale_after` (e.g. held by a crashed process on another host sharing
+`build/` over NFS). Stale locks are broken by the next process to wait.
+"""
+import json
+import os
+import socket
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from luigi.task import flatten
+from luigi.task import logger as luigi_logger
+
+LOCK_EXT = '.lock'
+# seconds after which locks held from other hosts are presumed abandoned
+STALE_AFTER = 60 * 60
+# seconds between checks of a lock held by another process
+POLL_INTERVAL = 0.5
+
+
+def pid_exists(pid):
+    """Returns whether a process with `pid` is running on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # running, as another user
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class FileLock:
+    """An advisory lock held by creating the file at `path`
+
+    :param str path: location of the lock file
+    :param float stale_after: seconds after which a lock is stale
+    :param float poll_interval: seconds between attempts to acquire the lock
+    """
+    def __init__(self, path, stale_after=STALE_AFTER, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.held = False
+
+    def __repr__(self):
+        return f'FileLock({self.path!r})'
+
+    def holder(self):
+        """Returns the pid, host and time of the holder of the lock, or None"""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # being written by its holder, or truncated by a crash
+            try:
+                created = os.path.getmtime(self.path)
+            except FileNotFoundError:
+                return None
+            return {'pid': None, 'host': None, 'time': created}
+
+    def is_stale(self, holder):
+        if holder.get('host') == socket.gethostname() and holder.get('pid'):
+            return not pid_exists(holder['pid'])
+        return time.time() - holder.get('time', 0) > self.stale_after
+
+    def try_acquire(self):
+        """Creates the lock file, unless another process holds it
+
+        :returns: whether the lock was acquired
+        :rtype: bool
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'pid': os.getpid(), 'host': socket.gethostname(),
+                       'time': time.time()}, f)
+        self.held = True
+        return True
+
+    def break_stale(self):
+        """Removes the lock file if its holder is stale
+
+        The lock file is renamed before it is removed, and restored if it
+        turns out to have been replaced by a live holder in the meantime.
+
+        :returns: whether a stale lock was broken
+        :rtype: bool
+        """
+        holder = self.holder()
+        if holder is None or not self.is_stale(holder):
+            return False
+        broken = f'{self.path}-stale-{os.getpid()}'
+        try:
+            os.rename(self.path, broken)
+        except FileNotFoundError:
+            return False
+        try:
+            with open(broken) as f:
+                replaced = json.load(f) != holder
+        except ValueError:
+            replaced = False
+        if replaced and not os.path.exists(self.path):
+            os.rename(broken, self.path)
+            return False
+        os.remove(broken)
+        luigi_logger.warning('broke stale lock %s held by %s', self.path, holder)
+        return True
+
+    def acquire(self, timeout=None):
+        """Waits for the lock, breaking it if stale
+
+        :param float timeout: most seconds to wait, or None to wait indefinitely
+        :returns: whether the lock was acquired
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        waiting = False
+        while not self.try_acquire():
+            if self.break_stale():
+                continue
+            if deadline is not None and time.time() >= deadline:
+                return False
+            if not waiting:
+                luigi_logger.info('waiting for %s held by %s', self.path, self.holder())
+                waiting = True
+            time.sleep(self.poll_interval)
+        return True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def locked(run):
+    """Decorates `run` of a task, so that it holds the locks of its outputs
+
+    Locks are taken in order of path, so tasks sharing outputs can't
+    deadlock. If the outputs were built by another process while waiting,
+    they are adopted and `run` is skipped.
+    """
+    @wraps(run)
+    def wrapper(task):
+        paths = sorted({target.path for target in flatten(task.output())})
+        with ExitStack() as stack:
+            for path in paths:
+                stack.enter_context(FileLock(path + LOCK_EXT))
+            if task.complete():
+                luigi_logger.info('%s was built by another process, adopting %s',
+                                  task, ', '.join(paths))
+                return
+            return run(task)
+    return wrapper
@@ -0,0 +1,107 @@
+"""
+Matching of country names to ISO 3166 alpha 3, with the regexes of
+exio-wiod-eora, remembered across builds.
+
+Sources without codes (iso4217, marc, edgar and itu-glad) are joined by
+the code of the first regex matching each of their names. Their names
+rarely change, so matches are recorded in `.matches-{salt}.json`, where
+the salt is a hash of the regexes, in order. Changing the regexes starts
+a new, empty, record (and removes the old one), so only names not yet
+matched with the current regexes are scanned.
+
+Like :mod:`make_country_codes.names`, this module depends only on the
+standard library.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+MATCH_CACHE = '.matches-{salt}.json'
+
+
+def normalize(name):
+    """Returns the form of `name` which is matched, and recorded
+
+    :rtype: str
+    """
+    if not isinstance(name, str):
+        # missing names match nothing
+        return ''
+    return unicodedata.normalize('NFC', name)
+
+
+def regexes_salt(regexes):
+    """Returns a hash of `regexes`, a list of (code, regex) pairs
+
+    :rtype: str
+    """
+    encoded = json.dumps([list(pair) for pair in regexes], ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+def _read_matches(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class NameMatcher:
+    """Codes of names, by the first of `regexes` matching them
+
+    :param iterable regexes: (code, regex) pairs, matched in order and
+        ignoring case; repeated pairs are ignored
+    :param str directory: where matches are recorded, or None to only
+        remember them in memory
+    """
+    def __init__(self, regexes, directory=None):
+        self.regexes = list(dict.fromkeys(tuple(pair) for pair in regexes))
+        self.salt = regexes_salt(self.regexes)
+        self.directory = directory
+        self.path = os.path.join(directory, MATCH_CACHE.format(salt=self.salt)) if directory else None
+        self.matches = _read_matches(self.path) if self.path else {}
+        # names matched since the record was read
+        self.unseen = {}
+        # compiled on the first name not already matched
+        self._patterns = None
+
+    def patterns(self):
+        if self._patterns is None:
+            self._patterns = [(code, re.compile(regex, flags=re.I)) for code, regex in self.regexes]
+        return self._patterns
+
+    def match(self, name):
+        """Returns the code of the first regex matching `name`, or ''
+
+        :rtype: str
+        """
+        name = normalize(name)
+        if name not in self.matches:
+            code = next((code for code, pattern in self.patterns() if pattern.search(name)), '')
+            self.matches[name] = self.unseen[name] = code
+        return self.matches[name]
+
+    def save(self):
+        """Records names matched since the record was read, merging them
+        with those recorded meanwhile by other processes, and removes
+        records of other regexes"""
+        if not self.path or not self.unseen:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        merged = _read_matches(self.path)
+        merged.update(self.unseen)
+        tmp_path = f'{self.path}-tmp-{os.getpid()}'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(merged, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.unseen = {}
+        for path in glob.glob(os.path.join(self.directory, MATCH_CACHE.format(salt='*'))):
+            if path != self.path:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
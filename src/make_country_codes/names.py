@@ -0,0 +1,139 @@
+"""
+Exact-match lookup of country names, in any language, to ISO 3166 alpha 3.
+
+Names are folded (casefolded, with accents, marks and punctuation removed)
+before indexing and before lookup, so `Côte d'Ivoire`, `COTE D IVOIRE`
+and `cote d’ivoire` all resolve to `CIV`.
+
+This module intentionally depends only on the standard library, so
+that resolving names at runtime does not require loading pandas.
+"""
+import json
+import unicodedata
+
+# columns of the assembled table with ISO 3166 alpha 3 codes, in order of preference
+KEY_COLUMNS = ['ISO3 (exio-wiod-eora)', 'ISO-alpha3 Code (M49)']
+
+LANGUAGES = {'en': 'English', 'cn': 'Chinese', 'ru': 'Russian',
+             'fr': 'French', 'es': 'Spanish', 'ar': 'Arabic'}
+
+# columns of the assembled table with names of countries, by language
+NAME_COLUMNS = {lang: [f'Country or Area_{lang} (M49)',
+                       f'{language} Short (unterm)',
+                       f'{language} Formal (unterm)']
+                for lang, language in LANGUAGES.items()}
+NAME_COLUMNS['en'] += [
+    'Locale Display Name (cldr)',
+    'name_short (exio-wiod-eora)', 'name_official (exio-wiod-eora)',
+    'Short name (fao)', 'Official name (fao)',
+    'Country (fifa-ioc)',
+    'Country (geonames)',
+    'name (ukgov)', 'official-name (ukgov)',
+    'Country Name (iso4217)',
+    'Country Name (marc)',
+    'Country Name (edgar)',
+    'Designation (itu-glad)',
+]
+
+# some sources list several variants of a name in one value
+VARIANT_SEPARATOR = '; '
+
+# unicode categories dropped (marks) or treated as spaces (punctuation, symbols)
+DROPPED_CATEGORIES = ('Mn', 'Mc', 'Me')
+SPACED_CATEGORIES = ('P', 'S', 'Z')
+
+
+def fold(name):
+    """Returns a normalized form of `name` for exact matching
+
+    Compatibility decomposition (NFKD) splits accented letters into base
+    letters and combining marks, which are dropped along with Arabic
+    harakat; punctuation and symbols become spaces, and the result is
+    casefolded with whitespace collapsed.
+
+    :param str name: a name, in any script
+    :rtype: str
+    """
+    chars = []
+    for char in unicodedata.normalize('NFKD', name):
+        category = unicodedata.category(char)
+        if category in DROPPED_CATEGORIES:
+            continue
+        if category.startswith(SPACED_CATEGORIES) or char.isspace():
+            chars.append(' ')
+        else:
+            chars.append(char)
+    return ' '.join(''.join(chars).casefold().split())
+
+
+def variants(value):
+    """Yields each name variant in a cell of the assembled table
+
+    :param str value: e.g. `Hong Kong SAR China; Hong Kong`
+    :rtype: generator
+    """
+    for variant in value.split(VARIANT_SEPARATOR):
+        variant = variant.strip()
+        if variant:
+            yield variant
+
+
+def build_index(rows):
+    """Returns an index of folded names to ISO 3166 alpha 3 codes
+
+    Names that fold to the same key but belong to different
+    countries are ambiguous, and are excluded from the index.
+
+    :param iterable rows: dicts keyed by columns of the assembled table
+    :returns: `names` (folded name to code) and `ambiguous` (folded names)
+    :rtype: dict
+    """
+    names = {}
+    ambiguous = set()
+    columns = [c for lang in NAME_COLUMNS.values() for c in lang]
+    for row in rows:
+        code = next((row[k] for k in KEY_COLUMNS if row.get(k)), None)
+        if not code:
+            continue
+        for column in columns:
+            for variant in variants(row.get(column) or ''):
+                key = fold(variant)
+                if not key or key in ambiguous:
+                    continue
+                if names.setdefault(key, code) != code:
+                    ambiguous.add(key)
+                    names.pop(key)
+    return {'names': names, 'ambiguous': sorted(ambiguous)}
+
+
+class NameIndex:
+    """Constant time resolution of country names to ISO 3166 alpha 3 codes
+
+    >>> index = NameIndex({'names': {'cote d ivoire': 'CIV'}})
+    >>> index.resolve("Côte d’Ivoire")
+    'CIV'
+    """
+    def __init__(self, index):
+        self.names = index['names']
+        self.ambiguous = frozenset(index.get('ambiguous', []))
+
+    @classmethod
+    def load(cls, path):
+        """Loads an index written by :class:`make_country_codes.tasks.export.NameIndex`
+
+        :param str path: location of index JSON
+        :rtype: NameIndex
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def resolve(self, name):
+        """Returns the ISO 3166 alpha 3 code of `name`, or None if unknown
+
+        :param str name: name of a country, in any indexed language
+        :rtype: str or None
+        """
+        return self.names.get(fold(name))
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,95 @@
+"""
+Vectorized normalization of text and codes.
+
+Each function takes and returns a whole :class:`pandas.Series`, using
+``.str`` and NumPy operations rather than calling back into Python for
+every cell (as ``converters`` passed to pandas readers do).
+"""
+import re
+
+import pandas as pd
+
+# footnote markers, e.g. `Algeria[3]`
+FOOTNOTE = r'\[\d+\]'
+# escaped newlines left behind in some scraped tables, i.e. a literal `\n`
+ESCAPED_NEWLINE = r'\\n'
+
+
+def collapse_whitespace(series):
+    """Collapses runs of whitespace (including NBSP, CR and LF) into
+    single spaces and strips leading and trailing whitespace
+
+    Vectorized equivalent of :func:`make_country_codes.utils.clean`.
+
+    :param pandas.Series series: text
+    :rtype: pandas.Series
+    """
+    return series.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def remove(series, pattern):
+    """Removes all matches of regular expression `pattern`
+
+    :param pandas.Series series: text
+    :param str pattern: e.g. `FOOTNOTE` or `ESCAPED_NEWLINE`
+    :rtype: pandas.Series
+    """
+    return series.str.replace(pattern, '', regex=True)
+
+
+def replace_aliases(series, aliases):
+    """Replaces every occurrence of each key of `aliases` with its value
+
+    All aliases are replaced in a single pass over `series`.
+
+    :param pandas.Series series: text
+    :param dict aliases: mapping of substrings to their replacements
+    :rtype: pandas.Series
+    """
+    pattern = '|'.join(re.escape(old) for old in aliases)
+    return series.str.replace(pattern, lambda m: aliases[m.group(0)], regex=True)
+
+
+def numeric_code(series):
+    """Returns integer codes as strings without leading zeros
+
+    Vectorized equivalent of :func:`make_country_codes.utils.convert_numeric_code`;
+    values which are not numeric become empty strings.
+
+    :param pandas.Series series: codes
+    :rtype: pandas.Series
+    """
+    numbers = pd.to_numeric(series, errors='coerce')
+    valid = numbers.notna()
+    codes = pd.Series('', index=series.index, dtype=object)
+    codes[valid] = numbers[valid].astype('int64').astype(str)
+    return codes
+
+
+def pad_code(series, width=3):
+    """Returns integer codes as strings zero-padded to `width`
+
+    Codes like M49 and ISO 3166 numeric should be treated as strings, as
+    their leading zeros are meaningful and must be preserved. Vectorized
+    equivalent of :func:`make_country_codes.utils.convert_numeric_code_with_pad`.
+
+    :param pandas.Series series: codes
+    :param int width: minimum length of codes
+    :rtype: pandas.Series
+    """
+    codes = numeric_code(series)
+    valid = codes != ''
+    codes[valid] = codes[valid].str.zfill(width)
+    return codes
+
+
+def flag(series):
+    """Returns `True` where a value is present and an empty string elsewhere
+
+    Used for columns of scraped tables which mark membership with any
+    non-empty cell, e.g. an `x`.
+
+    :param pandas.Series series: text
+    :rtype: pandas.Series
+    """
+    return series.where(series.fillna('') == '', 'True').fillna('')
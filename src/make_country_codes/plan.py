@@ -0,0 +1,149 @@
+"""
+Dry runs of builds: what would be built, and why.
+
+:func:`plan` walks the graph of requirements of some tasks, as
+:func:`luigi.build` would, without running anything. Salts of sources
+come from the stat cache (see :func:`make_country_codes.utils.cached_by_stat`),
+so on a warm `build/` no file is read. The cache of artifacts is disabled
+while planning, and outputs are checked on the local filesystem only, so
+nothing is fetched or pulled from a cache (even to salt tasks by content
+with `--early-cutoff`).
+"""
+import os
+from collections import OrderedDict
+
+from luigi.task import flatten
+from salted.salted_demo import get_salted_version
+
+from . import cache
+from . import utils
+from .artifacts import latest_artifact
+
+OK = 'ok'
+STALE = 'stale'
+
+
+class Step:
+    """The state of one task of a plan
+
+    :param task: the task
+    :param str salt: salt in the names of its outputs, if any
+    :param list paths: paths of its outputs
+    :param bool complete: whether it would be skipped
+    :param str reason: why it would run
+    :param list upstream: requirements that would run first
+    """
+    def __init__(self, task, salt, paths, complete, reason, upstream):
+        self.task = task
+        self.salt = salt
+        self.paths = paths
+        self.complete = complete
+        self.reason = reason
+        self.upstream = upstream
+
+    def __repr__(self):
+        return f'Step({self.task}, {self.state!r})'
+
+    @property
+    def state(self):
+        return OK if self.complete else STALE
+
+    def as_dict(self):
+        return OrderedDict([('task', str(self.task)), ('state', self.state),
+                            ('salt', self.salt), ('paths', self.paths),
+                            ('reason', self.reason),
+                            ('upstream', [str(task) for task in self.upstream])])
+
+
+def task_salt(task):
+    """Returns the salt of `task`'s outputs, as :class:`.SaltedOutput` does"""
+    if hasattr(task, 'salt'):
+        return task.salt
+    if not hasattr(task, '__version__'):
+        return None
+    if utils.EARLY_CUTOFF:
+        return utils.get_content_salted_version(task)[:6]
+    return get_salted_version(task)[:6]
+
+
+def previous_artifact(path, salt):
+    """Returns the most recently built artifact like `path` but with
+    another salt, or None"""
+    name = os.path.basename(path)
+    if not salt or salt not in name:
+        return None
+    prefix, _, ext = name.rpartition(salt)
+    previous = latest_artifact(prefix, ext, root=os.path.dirname(path) or '.')
+    return previous if previous != path else None
+
+
+def step(task, upstream):
+    targets = flatten(task.output())
+    paths = [target.path for target in targets]
+    if targets:
+        # locally, rather than pulling from a cache
+        complete = all(os.path.exists(path) for path in paths)
+    else:
+        complete = task.complete()
+    salt = task_salt(task) if targets else None
+    if salt and not any(salt in os.path.basename(path) for path in paths):
+        # outputs are not salted
+        salt = None
+
+    if complete:
+        reason = 'up to date'
+    else:
+        previous = [previous_artifact(path, salt) for path in paths]
+        previous = [p for p in previous if p]
+        if salt == 'tk':
+            reason = 'salted by a source that is not fetched yet'
+        elif previous:
+            reason = f'salt changed (was {os.path.basename(previous[0])})'
+        elif targets:
+            reason = 'never built'
+        else:
+            reason = 'incomplete'
+        if upstream:
+            reason += ', after ' + ', '.join(str(task) for task in upstream)
+    return Step(task, salt, paths, complete, reason, upstream)
+
+
+def plan(tasks):
+    """Returns the steps of building `tasks`, requirements first
+
+    :param list tasks: tasks to build
+    :rtype: list
+    """
+    steps = OrderedDict()
+
+    def visit(task):
+        if task.task_id in steps:
+            return steps[task.task_id]
+        steps[task.task_id] = None
+        requirements = [visit(req) for req in flatten(task.requires())]
+        upstream = [s.task for s in requirements if s is not None and not s.complete]
+        # requirements first, so move this task after them
+        del steps[task.task_id]
+        steps[task.task_id] = step(task, upstream)
+        return steps[task.task_id]
+
+    # nothing is pulled, e.g. by `complete()` of requirements salting tasks by content
+    with cache.disabled():
+        for task in tasks:
+            visit(task)
+    return list(steps.values())
+
+
+def format_plan(steps):
+    """Returns a line per step, e.g.
+    `stale  cldr()  17faed  build/cldr-17faed.csv  never built`
+
+    :rtype: str
+    """
+    lines = []
+    for s in steps:
+        lines.append('  '.join([s.state.ljust(5), str(s.task), s.salt or '-',
+                                ', '.join(s.paths) or '-', s.reason]))
+    stale = sum(not s.complete for s in steps)
+    lines.append(f'{stale} of {len(steps)} tasks would run')
+    return '\n'.join(lines)
@@ -0,0 +1,91 @@
+"""
+Projections of the assembled table, for partial builds.
+
+A projection is a comma separated list of glob patterns, e.g.
+`ISO*,M49,*(iso4217)`, each matched against names of code schemes (see
+:data:`make_country_codes.table.SCHEMES`) and against columns of the
+assembled table. Only the sources of matching columns are needed, which
+is known before any source is fetched:
+
+- a pattern matching names of schemes needs the sources of their
+  columns, and only those, e.g. `ISO*` needs exio-wiod-eora (but still
+  matches `ISO-alpha3 Code (M49)`, as the UN codes are always joined)
+- a pattern ending in a source suffix, e.g. `Currency* (iso4217)` or
+  `*(iso*)`, needs the sources matching the suffix
+- any other pattern, e.g. `*Short*`, may match columns of any source,
+  so it needs all of them
+
+Sources are joined through others (see
+:data:`make_country_codes.tasks.assemble.JOINED_THROUGH`), which are
+needed as well.
+"""
+import re
+from fnmatch import fnmatchcase
+
+from .schema import source_of
+from .schema import SOURCE_SUFFIXES
+from .table import SCHEMES
+
+# source suffix at the end of a pattern, e.g. `*(iso4217)`
+SUFFIX = re.compile(r'\(([^()]+)\)$')
+
+
+def parse(columns):
+    """Returns the patterns of a projection
+
+    :param str columns: comma separated patterns, e.g. `ISO*, *(iso4217)`
+    :rtype: list
+    """
+    return [pattern.strip() for pattern in columns.split(',') if pattern.strip()]
+
+
+def normalize(columns):
+    """Returns `columns` without redundant whitespace, so that equal
+    projections salt their outputs equally"""
+    return ','.join(parse(columns))
+
+
+def scheme_columns(pattern):
+    """Returns the columns of schemes matching `pattern`
+
+    :rtype: list
+    """
+    return [column for scheme, column in SCHEMES.items() if fnmatchcase(scheme, pattern)]
+
+
+def sources(patterns, joined_through=None):
+    """Returns the sources needed by `patterns`
+
+    :param list patterns: see :func:`parse`
+    :param dict joined_through: sources each source is joined through
+    :rtype: set
+    """
+    needed = set()
+    for pattern in patterns:
+        suffix = SUFFIX.search(pattern)
+        if suffix:
+            needed.update(s for s in SOURCE_SUFFIXES if fnmatchcase(s, suffix.group(1).strip()))
+        columns = scheme_columns(pattern)
+        if columns:
+            needed.update(source_of(column) for column in columns)
+        elif not suffix:
+            return set(SOURCE_SUFFIXES)
+    pending = list(needed)
+    while pending:
+        for source in (joined_through or {}).get(pending.pop(), []):
+            if source not in needed:
+                needed.add(source)
+                pending.append(source)
+    return needed
+
+
+def select(columns, patterns):
+    """Returns the columns matched by `patterns`, in their order
+
+    :param list columns: columns of the assembled table
+    :param list patterns: see :func:`parse`
+    :rtype: list
+    """
+    schemes = {column for pattern in patterns for column in scheme_columns(pattern)}
+    return [column for column in columns
+            if column in schemes or any(fnmatchcase(column, pattern) for pattern in patterns)]
@@ -0,0 +1,102 @@
+"""
+Streaming ingestion of GOV.UK registers.
+
+A register's `records.json` is an object of records keyed by their key,
+each with the `item` (or items) of its latest entry, and is paginated
+(pages are linked from the `Link` header of each response). Pages are
+parsed incrementally with `ijson` when it is installed, and records are
+stored as JSON lines, so that a register of any size is ingested (and
+read back) in constant memory.
+
+Every item of a record is kept: the first is the current one, and
+others (with their `start-date` and `end-date`) feed the history, see
+:mod:`make_country_codes.history`.
+"""
+import io
+import json
+from urllib.parse import urljoin
+
+import requests
+
+from .sources import wait_for_turn
+from .utils import REQUEST_HEADERS
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+# records requested per page, the most registers serve
+PAGE_SIZE = 5000
+
+
+def iter_members(f):
+    """Yields `(key, value)` of each member of the JSON object in `f`,
+    building one member at a time
+
+    :param f: a binary file
+    """
+    if ijson is None:
+        yield from json.load(f).items()
+        return
+    key = builder = None
+    for prefix, event, value in ijson.parse(f):
+        if prefix == '':
+            if builder is not None:
+                yield key, builder.value
+                builder = None
+            if event == 'map_key':
+                key, builder = value, ObjectBuilder()
+        else:
+            builder.event(event, value)
+
+
+def iter_records(url, throttle_dir, page_size=PAGE_SIZE):
+    """Yields records of the register at `url`, following pagination
+
+    Requests are spaced out according to the politeness limits of the
+    host, see :func:`make_country_codes.sources.wait_for_turn`.
+
+    :param str url: location of `records.json` of a register
+    :param str throttle_dir: where times of requests to hosts are recorded
+    :param int page_size: records requested per page
+    """
+    page = f'{url}?page-size={page_size}'
+    while page:
+        wait_for_turn(page, throttle_dir=throttle_dir)
+        with requests.get(page, stream=True, headers=REQUEST_HEADERS) as r:
+            r.raise_for_status()
+            r.raw.decode_content = True
+            for _, record in iter_members(r.raw):
+                yield record
+            link = r.links.get('next')
+        page = urljoin(page, link['url']) if link else None
+
+
+def _number(value):
+    # ijson parses numbers as Decimal
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def to_jsonl(record):
+    """Returns `record` as a JSON line
+
+    :rtype: bytes
+    """
+    return (json.dumps(record, ensure_ascii=False, default=_number) + '\n').encode('utf-8')
+
+
+def iter_jsonl(f):
+    """Yields the records stored as JSON lines in `f`
+
+    :param f: a binary file, e.g. from :func:`make_country_codes.utils.open_target`
+    """
+    for line in io.TextIOWrapper(f, encoding='utf-8'):
+        if line.strip():
+            yield json.loads(line)
+
+
+def current_item(record):
+    """Returns the current item of a record"""
+    return record['item'][0]
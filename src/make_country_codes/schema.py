@@ -0,0 +1,297 @@
+"""
+Table Schema (https://specs.frictionlessdata.io/table-schema/)
+descriptions of the assembled country codes table.
+
+Columns of the assembled table are suffixed with the name of their
+source, e.g. `ISO3 (fao)`, so the type of every column contributed by a
+known source is declared here rather than inferred from the data.
+"""
+import os
+import re
+import csv
+import warnings
+from itertools import islice
+
+import pandas as pd
+
+from .frames import cached_frame
+from .utils import resource_stats
+
+try:
+    import pyarrow
+    from pyarrow import csv as pyarrow_csv
+except ImportError:
+    pyarrow = None
+
+# suffixes of columns in the assembled table, one per source
+SOURCE_SUFFIXES = ('M49', 'unterm', 'exio-wiod-eora', 'fao', 'fifa-ioc',
+                   'geonames', 'usa-census', 'ukgov', 'cldr', 'iso4217',
+                   'marc', 'edgar', 'itu-glad')
+
+# declared types of columns of known sources that are not strings, as
+# the pandas dtypes :func:`read_csv` reads them with, by source.
+# NB codes like M49 and ISO 3166 numeric are strings,
+# as their leading zeros are meaningful and must be preserved
+DTYPES = {
+    'geonames': {'Area(in sq km)': 'float64',
+                 'Population': 'Int64',
+                 'geonameid': 'Int64'},
+    'ukgov': {'start-date': 'datetime64[ns]'},
+}
+
+
+def field_type(dtype):
+    """Returns the Table Schema type of a column of pandas `dtype`
+
+    :rtype: str
+    """
+    dtype = pd.api.types.pandas_dtype(dtype)
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'integer'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'number'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        # sources only have dates, without times
+        return 'date'
+    return 'string'
+
+
+# types of columns of the assembled table, derived from `DTYPES`
+FIELD_TYPES = {f'{column} ({source})': field_type(dtype)
+               for source, dtypes in DTYPES.items()
+               for column, dtype in dtypes.items()}
+
+MISSING_VALUES = ['']
+
+# columns that identify a row, if their values are unique and complete
+PRIMARY_KEY_CANDIDATES = ['ISO3 (exio-wiod-eora)']
+
+# rows read when inferring types of columns from unknown sources
+SAMPLE_ROWS = 100
+
+# NB values with leading zeros are codes, not numbers
+# nullable strings where pandas supports them
+STRING = 'string' if hasattr(pd, 'StringDtype') else str
+
+# options of :func:`pandas.read_csv` that can be
+# translated to pyarrow's (multithreaded) CSV reader
+PYARROW_OPTIONS = {'sep', 'header', 'na_values', 'keep_default_na'}
+PANDAS_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN',
+                    '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA',
+                    'NULL', 'NaN', 'n/a', 'nan', 'null']
+
+LANGUAGES = ('en', 'cn', 'ru', 'fr', 'es', 'ar')
+
+# low-cardinality columns of each CSV source to read as categoricals.
+# every other column is read as a string, so no types are
+# sniffed and leading zeros of codes are preserved (intermediate
+# tables are frames of text, see :func:`make_country_codes.frames.as_text`)
+CATEGORIES = {
+    'M49': ['Developed / Developing Countries',
+            'Least Developed Countries (LDC)',
+            'Land Locked Developing Countries (LLDC)',
+            'Small Island Developing States (SIDS)'] + [
+            f'{level} Name_{lang}' for lang in LANGUAGES
+            for level in ('Global', 'Region', 'Sub-region', 'Intermediate Region')],
+    'exio-wiod-eora': ['continent', 'UNregion', 'EXIO1', 'EXIO2', 'EXIO3',
+                       'WIOD', 'Cecilia2050', 'OECD', 'EU', 'EURO'],
+    'geonames': ['Continent', 'CurrencyCode', 'CurrencyName'],
+}
+
+patterns = (
+    ('integer', re.compile(r'^-?(0|[1-9]\d*)$')),
+    ('number', re.compile(r'^-?(0|[1-9]\d*)(\.\d+)?$')),
+    ('date', re.compile(r'^\d{4}-\d{2}-\d{2}$')),
+    ('boolean', re.compile(r'^(true|false)$', flags=re.I)),
+)
+
+
+def source_of(column):
+    """Returns the source suffix of `column`, or None if source is unknown
+
+    :param str column: name of a column in the assembled table
+    :rtype: str or None
+    """
+    for suffix in SOURCE_SUFFIXES:
+        if column.endswith(f' ({suffix})'):
+            return suffix
+    return None
+
+
+def infer_field_type(values):
+    """Returns the narrowest Table Schema type matching all `values`
+
+    Missing values are ignored; a column of only missing values is a string.
+
+    :param iterable values: sample of values from one column
+    :rtype: str
+    """
+    present = [v for v in values if v not in MISSING_VALUES]
+    if not present:
+        return 'string'
+    for field_type, pattern in patterns:
+        if all(pattern.match(v) for v in present):
+            return field_type
+    return 'string'
+
+
+def is_key(values):
+    """Returns True if `values` are unique and none are missing
+
+    :param list values: all values from one column
+    :rtype: bool
+    """
+    if any(v in MISSING_VALUES for v in values):
+        return False
+    return len(set(values)) == len(values)
+
+
+def table_schema(path):
+    """Describes the CSV at `path` with a Table Schema
+
+    Only the header is read to type columns of known sources; a sample of
+    rows is read to infer types for any columns from unknown sources.
+    Columns in `PRIMARY_KEY_CANDIDATES` are read in full and the first
+    found to be unique and complete is declared as the primary key.
+
+    :param str path: location of a CSV with a header row
+    :rtype: dict
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        unknown = [i for i, column in enumerate(header)
+                   if source_of(column) is None]
+        candidates = [header.index(c) for c in PRIMARY_KEY_CANDIDATES
+                      if c in header]
+        rows = reader if candidates else islice(reader, SAMPLE_ROWS)
+
+        sample = []
+        keys = {i: [] for i in candidates}
+        for n, row in enumerate(rows):
+            if unknown and n < SAMPLE_ROWS:
+                sample.append(row)
+            for i in candidates:
+                keys[i].append(row[i] if i < len(row) else '')
+
+    fields = []
+    for i, column in enumerate(header):
+        if i in unknown:
+            field_type = infer_field_type(row[i] for row in sample if i < len(row))
+        else:
+            field_type = FIELD_TYPES.get(column, 'string')
+        fields.append({'name': column, 'type': field_type, 'format': 'default'})
+
+    schema = {'fields': fields, 'missingValues': MISSING_VALUES}
+    for i in candidates:
+        if is_key(keys[i]):
+            schema['primaryKey'] = [header[i]]
+            break
+    return schema
+
+
+def describe_resource(path):
+    """Returns a tabular data resource descriptor for the CSV at `path`
+
+    Size and hash of the file are computed in a single streaming pass.
+
+    :param str path: location of a CSV with a header row
+    :rtype: dict
+    """
+    name, _ = os.path.splitext(os.path.basename(path))
+    resource = {'path': path,
+                'profile': 'tabular-data-resource',
+                'name': name,
+                'format': 'csv',
+                'mediatype': 'text/csv',
+                'encoding': 'utf-8'}
+    resource.update(resource_stats(path))
+    resource['schema'] = table_schema(path)
+    return resource
+
+
+def apply_dtypes(source, df):
+    """Returns `df` with the declared `DTYPES` of `source`
+
+    Values that are not of their column's type are missing.
+
+    :param str source: key of `DTYPES`, e.g. 'geonames'
+    :rtype: pandas.DataFrame
+    """
+    dtypes = {column: dtype for column, dtype in DTYPES.get(source, {}).items()
+              if column in df.columns}
+    if not dtypes:
+        return df
+    df = df.copy()
+    for column, dtype in dtypes.items():
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            df[column] = pd.to_datetime(df[column], format='%Y-%m-%d', errors='coerce')
+        else:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+    return df
+
+
+def read_csv_pyarrow(path, sep=',', header=0, na_values=None, keep_default_na=True):
+    """Reads the CSV at `path` with pyarrow, all columns as strings
+
+    pandas' own pyarrow engine infers column types before applying `dtype`,
+    which drops leading zeros, so string column types are declared
+    up front from the header row instead.
+
+    :rtype: pandas.DataFrame
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        names = next(csv.reader(islice(f, header, None), delimiter=sep))
+
+    null_values = list(na_values or [])
+    if keep_default_na:
+        null_values += PANDAS_NA_VALUES
+    table = pyarrow_csv.read_csv(
+        path,
+        read_options=pyarrow_csv.ReadOptions(skip_rows=header),
+        parse_options=pyarrow_csv.ParseOptions(delimiter=sep),
+        convert_options=pyarrow_csv.ConvertOptions(
+            column_types={name: pyarrow.string() for name in names},
+            null_values=null_values, strings_can_be_null=True))
+    if STRING == 'string':
+        return table.to_pandas(types_mapper={pyarrow.string(): pd.StringDtype()}.get)
+    return table.to_pandas()
+
+
+def read_csv(source, filepath_or_buffer, **kwargs):
+    """Reads a CSV from `source` with its declared column schema
+
+    Columns are read as strings (no type sniffing) except for the
+    `DTYPES` and `CATEGORIES` of `source`. pyarrow's CSV reader is used when it is
+    installed and supports all of the options given.
+
+    Files (rather than buffers) are read once while frames are kept in
+    memory, see :func:`make_country_codes.frames.keep_frames`.
+
+    :param str source: key of `CATEGORIES`, e.g. 'geonames'
+    :param filepath_or_buffer: passed to :func:`pandas.read_csv`
+    :rtype: pandas.DataFrame
+    """
+    if isinstance(filepath_or_buffer, str) and 'chunksize' not in kwargs:
+        key = repr((source, sorted(kwargs.items())))
+        return cached_frame(filepath_or_buffer, lambda: _read_csv(source, filepath_or_buffer, **kwargs),
+                            key=key)
+    return _read_csv(source, filepath_or_buffer, **kwargs)
+
+
+def _read_csv(source, filepath_or_buffer, **kwargs):
+    if (pyarrow is not None and isinstance(filepath_or_buffer, str)
+            and set(kwargs) <= PYARROW_OPTIONS):
+        df = read_csv_pyarrow(filepath_or_buffer, **kwargs)
+    else:
+        kwargs.setdefault('dtype', STRING)
+        with warnings.catch_warnings():
+            # columns that still have converters use them in place of the dtype
+            warnings.simplefilter('ignore', category=pd.errors.ParserWarning)
+            df = pd.read_csv(filepath_or_buffer, **kwargs)
+
+    df = apply_dtypes(source, df)
+    categories = [c for c in CATEGORIES.get(source, []) if c in df.columns]
+    return df.astype({c: 'category' for c in categories})
@@ -0,0 +1,150 @@
+"""
+Declarative scraping of HTML tables.
+
+Each source declares :class:`TableSpec` objects describing the tables it
+wants from a page. :func:`extract_tables` parses the page once with lxml
+and extracts every requested table in a single pass over the document.
+"""
+from lxml import html
+import pandas as pd
+
+from .utils import clean
+
+# rows of a table, excluding those of any nested tables
+ROWS = './tr|./thead/tr|./tbody/tr|./tfoot/tr'
+CELLS = './th|./td'
+
+
+class TableSpec:
+    """Describes one table to extract from a page
+
+    :param str name: key of extracted table in results
+    :param str selector: XPath expression selecting candidate tables
+    :param int index: which of the selected tables to extract
+    :param int header: index of row with column names, or None if
+        the table has no header (columns are then numbered)
+    :param str start_marker: if set, rows up to and including the first
+        row whose text is `start_marker` are skipped
+    :param int width: if set, rows without exactly `width` cells are skipped
+    :param dict cleaners: column names to functions that take and
+        return a :class:`pandas.Series`, e.g. from :mod:`.normalize`
+    """
+    def __init__(self, name, selector='//table', index=0, header=0,
+                 start_marker=None, width=None, cleaners=None):
+        self.name = name
+        self.selector = selector
+        self.index = index
+        self.header = header
+        self.start_marker = start_marker
+        self.width = width
+        self.cleaners = cleaners or {}
+
+    def __repr__(self):
+        return f'TableSpec({self.name!r}, {self.selector!r}, index={self.index})'
+
+
+def table_rows(table):
+    """Returns the text of cells of `table`, one list per row
+
+    Cells spanning several columns or rows are repeated in each,
+    like :func:`pandas.read_html`.
+
+    :param lxml.html.HtmlElement table: a `table` element
+    :rtype: list
+    """
+    rows = []
+    # cells spanning rows below the current one, by column
+    spans = {}
+    for tr in table.xpath(ROWS):
+        row = []
+        column = 0
+        cells = iter(tr.xpath(CELLS))
+        while True:
+            if column in spans:
+                text, remaining = spans[column]
+                row.append(text)
+                if remaining > 1:
+                    spans[column] = (text, remaining - 1)
+                else:
+                    del spans[column]
+                column += 1
+                continue
+            cell = next(cells, None)
+            if cell is None:
+                break
+            text = clean(cell.text_content())
+            rowspan = int(cell.get('rowspan', 1) or 1)
+            for _ in range(int(cell.get('colspan', 1) or 1)):
+                if rowspan > 1:
+                    spans[column] = (text, rowspan - 1)
+                row.append(text)
+                column += 1
+        # spans continuing beyond the last cell of this row
+        while column in spans:
+            text, remaining = spans.pop(column)
+            row.append(text)
+            if remaining > 1:
+                spans[column] = (text, remaining - 1)
+            column += 1
+        rows.append(row)
+    return rows
+
+
+def unique_columns(names):
+    """Renames repeated column names like pandas, e.g. `X`, `X.1`"""
+    seen = {}
+    columns = []
+    for name in names:
+        if name in seen:
+            seen[name] += 1
+            columns.append(f'{name}.{seen[name]}')
+        else:
+            seen[name] = 0
+            columns.append(name)
+    return columns
+
+
+def to_frame(rows, spec):
+    """Returns the rows of a table as a DataFrame of strings, as described by `spec`
+
+    :rtype: pandas.DataFrame
+    """
+    if spec.start_marker is not None:
+        texts = [' '.join(' '.join(row).split()) for row in rows]
+        if spec.start_marker in texts:
+            rows = rows[texts.index(spec.start_marker) + 1:]
+        else:
+            rows = []
+
+    columns = None
+    if spec.header is not None and len(rows) > spec.header:
+        columns = unique_columns(rows[spec.header])
+        rows = rows[spec.header + 1:]
+
+    if spec.width is not None:
+        rows = [row for row in rows if len(row) == spec.width]
+    rows = [row for row in rows if any(row)]
+
+    width = len(columns) if columns else max((len(r) for r in rows), default=0)
+    rows = [(row + [''] * width)[:width] for row in rows]
+    df = pd.DataFrame(rows, columns=columns if columns else range(width), dtype=object)
+
+    for column, cleaner in spec.cleaners.items():
+        if column in df.columns:
+            df[column] = cleaner(df[column])
+    return df
+
+
+def extract_tables(content, specs, encoding='utf-8'):
+    """Parses `content` once and extracts every table described by `specs`
+
+    :param bytes content: an HTML document
+    :param list specs: :class:`TableSpec` of each table to extract
+    :param str encoding: encoding of `content`, or None to detect it
+    :raises IndexError: if a selector does not match enough tables
+    :returns: DataFrames keyed by `TableSpec.name`
+    :rtype: dict
+    """
+    doc = html.fromstring(content, parser=html.HTMLParser(encoding=encoding))
+    return {spec.name: to_frame(table_rows(doc.xpath(spec.selector)[spec.index]), spec)
+            for spec in specs}
@@ -0,0 +1,228 @@
+"""
+Local HTTP lookup service over the most recently built country codes table.
+
+Endpoints (all responses are JSON):
+
+- ``GET /convert?from=ISO2&to=ISO3&value=DZ``
+- ``GET /resolve?name=Algérie``
+- ``GET /row/DZA`` or ``GET /row/ISO2/DZ``
+- ``GET /status``
+- ``POST /convert`` with ``{"from": "ISO2", "to": "ISO3", "values": [...]}``
+- ``POST /resolve`` with ``{"names": [...]}``
+- ``POST /rows`` with ``{"scheme": "ISO2", "values": [...]}``
+
+Schemes are keys of :data:`make_country_codes.table.SCHEMES`, column names
+of the table, or ``name``. GET responses are kept in an LRU cache, which
+is cleared whenever a newly salted table appears in the build directory
+and is hot reloaded.
+"""
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+from .table import CountryTable
+from .table import UnknownScheme
+from .artifacts import latest_artifact
+
+logger = logging.getLogger(__name__)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class LRUCache:
+    """Least recently used cache of at most `maxsize` items"""
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key):
+        try:
+            self._items.move_to_end(key)
+        except KeyError:
+            return None
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def require(params, *keys):
+    missing = [k for k in keys if not params.get(k)]
+    if missing:
+        raise HTTPError(400, f'missing {", ".join(missing)}')
+    return [params[k] for k in keys]
+
+
+class LookupService:
+    """Answers lookup requests from a hot-reloaded :class:`CountryTable`
+
+    :param str root: directory of built artifacts
+    :param int cache_size: number of GET responses to cache
+    :param float reload_interval: seconds between checks for a newer table
+    """
+    def __init__(self, root='build/', cache_size=4096, reload_interval=5.0, table=None):
+        self.root = root
+        self.reload_interval = reload_interval
+        self.cache = LRUCache(cache_size)
+        self.table = table if table is not None else CountryTable.latest(root)
+
+    def respond(self, method, target, body=b''):
+        """Returns the status and encoded JSON response to a request
+
+        :param str method: `GET` or `POST`
+        :param str target: request target, e.g. `/row/DZA`
+        :param bytes body: JSON request body of POSTs
+        :rtype: tuple
+        """
+        if method == 'GET':
+            cached = self.cache.get(target)
+            if cached is not None:
+                return cached
+        try:
+            result = 200, self.dispatch(method, target, body)
+        except HTTPError as e:
+            result = e.status, {'error': str(e)}
+        except UnknownScheme as e:
+            result = 400, {'error': f'unknown scheme {e}'}
+        encoded = result[0], json.dumps(result[1], ensure_ascii=False).encode('utf-8')
+        if method == 'GET' and result[0] == 200:
+            self.cache.put(target, encoded)
+        return encoded
+
+    def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        table = self.table
+        if not parts:
+            raise HTTPError(404, 'not found')
+        endpoint = parts[0]
+
+        if method == 'GET':
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if endpoint == 'convert':
+                value, from_scheme, to_scheme = require(params, 'value', 'from', 'to')
+                return {'value': value,
+                        'result': table.convert(value, from_scheme, to_scheme)}
+            if endpoint == 'resolve':
+                name, = require(params, 'name')
+                return {'name': name, 'ISO3': table.names.resolve(name)}
+            if endpoint == 'row' and len(parts) in (2, 3):
+                scheme, value = parts[1:] if len(parts) == 3 else ('ISO3', parts[1])
+                row = table.find(value, scheme)
+                if row is None:
+                    raise HTTPError(404, f'no row for {scheme} {value}')
+                return row
+            if endpoint == 'status':
+                return {'path': table.path, 'salt': table.salt, 'rows': len(table.rows)}
+            raise HTTPError(404, 'not found')
+
+        if method == 'POST':
+            try:
+                params = json.loads(body.decode('utf-8') or '{}')
+            except ValueError:
+                raise HTTPError(400, 'body must be JSON')
+            if endpoint == 'convert':
+                values, from_scheme, to_scheme = require(params, 'values', 'from', 'to')
+                return {'results': [table.convert(v, from_scheme, to_scheme) for v in values]}
+            if endpoint == 'resolve':
+                names, = require(params, 'names')
+                return {'results': [table.names.resolve(n) for n in names]}
+            if endpoint == 'rows':
+                values, scheme = require(params, 'values', 'scheme')
+                return {'results': [table.find(v, scheme) for v in values]}
+            raise HTTPError(404, 'not found')
+
+        raise HTTPError(405, f'method {method} not allowed')
+
+    async def reload_when_rebuilt(self):
+        """Swaps in the latest table whenever a new salt is built"""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            path = latest_artifact('country-codes-', '.csv', root=self.root)
+            if path is None or path == self.table.path:
+                continue
+            try:
+                table = await loop.run_in_executor(None, CountryTable.latest, self.root)
+            except Exception:
+                logger.exception('failed to reload %s', path)
+                continue
+            self.table = table
+            self.cache.clear()
+            logger.info('reloaded %s', table.path)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, payload = self.respond(method, target, body)
+                except Exception:
+                    logger.exception('failed to respond to %s %s', method, target)
+                    status, payload = 500, b'{"error": "internal error"}'
+
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+                writer.write(
+                    f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                    f'Content-Type: application/json; charset=utf-8\r\n'
+                    f'Content-Length: {len(payload)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+                    f'\r\n'.encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8049):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info('serving %s on %s:%s', self.table.path, host, port)
+        reloader = asyncio.ensure_future(self.reload_when_rebuilt())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reloader.cancel()
+
+
+def serve(host='127.0.0.1', port=8049, root='build/', cache_size=4096, reload_interval=5.0):
+    """Runs a :class:`LookupService` until interrupted"""
+    service = LookupService(root=root, cache_size=cache_size,
+                            reload_interval=reload_interval)
+    asyncio.run(service.serve(host=host, port=port))
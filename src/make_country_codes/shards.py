@@ -0,0 +1,133 @@
+"""
+Sharded distribution of the assembled table, for web and mobile clients.
+
+Rather than the whole CSV, clients fetch a small manifest and then only
+the shards they need:
+
+- `index/names`, the names of every country in each language, e.g. for
+  a country picker
+- `maps/{scheme}`, the countries having each code of a scheme (see
+  :data:`make_country_codes.table.SCHEMES`), e.g. `{"DZ": ["DZA"]}`
+- `countries/{key}`, every non-empty field of a country
+
+Countries are keyed by ISO 3166 alpha 3 (see
+:data:`make_country_codes.names.KEY_COLUMNS`). Shards are minified JSON,
+and MessagePack too when `msgpack` is installed, named by a hash of their
+content, so they can be cached forever::
+
+    {"path": "{kind}/{name}.{hash}.{format}", "formats": ["json", "msgpack"],
+     "shards": {"index": {"names": "1f0c..."}, "maps": {"ISO2": "9e1b..."},
+                "countries": {"DZA": "c2a7...", ...}}}
+
+Like :mod:`make_country_codes.names`, this module depends only on the
+standard library (and optionally `msgpack`).
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from .names import variants
+from .names import KEY_COLUMNS
+from .names import NAME_COLUMNS
+from .table import SCHEMES
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PATH = '{kind}/{name}.{hash}.{format}'
+# hex digits of the sha256 of a shard in its name
+HASH_LENGTH = 12
+
+
+def formats():
+    """Returns the formats shards are written in"""
+    return ['json', 'msgpack'] if msgpack is not None else ['json']
+
+
+def dumps(obj, format='json'):
+    """Returns `obj` serialized compactly, and deterministically
+
+    :rtype: bytes
+    """
+    if format == 'msgpack':
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def country_key(row):
+    """Returns the ISO 3166 alpha 3 code of a row, or None"""
+    return next((row[k] for k in KEY_COLUMNS if row.get(k)), None)
+
+
+def display_names(row):
+    """Returns the first name of a row in each language
+
+    :rtype: dict
+    """
+    names = {}
+    for lang, columns in NAME_COLUMNS.items():
+        name = next((variant for column in columns
+                     for variant in variants(row.get(column) or '')), None)
+        if name:
+            names[lang] = name
+    return names
+
+
+def shards(rows):
+    """Returns the content of every shard of `rows`
+
+    :param iterable rows: dicts keyed by columns of the assembled table
+    :returns: content by name, by kind
+    :rtype: dict
+    """
+    names = {}
+    maps = {scheme: {} for scheme in SCHEMES}
+    countries = {}
+    for row in rows:
+        key = country_key(row)
+        if not key or key in countries:
+            continue
+        countries[key] = {column: value for column, value in row.items() if value}
+        names[key] = display_names(row)
+        for scheme, column in SCHEMES.items():
+            if row.get(column):
+                maps[scheme].setdefault(row[column], []).append(key)
+    return {'index': {'names': names},
+            'maps': {scheme: codes for scheme, codes in maps.items() if codes},
+            'countries': countries}
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}-tmp-{os.getpid()}', 'wb') as f:
+        f.write(content)
+    os.replace(f.name, path)
+
+
+def write_shards(rows, directory):
+    """Writes every shard of `rows` in `directory`
+
+    Shards are named by a hash of their JSON, so a shard that exists is
+    already up to date and is not written again.
+
+    :param iterable rows: dicts keyed by columns of the assembled table
+    :param str directory: where shards are written
+    :returns: the manifest
+    :rtype: dict
+    """
+    manifest = OrderedDict([('path', PATH), ('formats', formats()),
+                            ('shards', OrderedDict())])
+    for kind, contents in shards(rows).items():
+        hashes = manifest['shards'][kind] = OrderedDict()
+        for name, content in sorted(contents.items()):
+            encoded = dumps(content)
+            hashes[name] = digest = hashlib.sha256(encoded).hexdigest()[:HASH_LENGTH]
+            for format in manifest['formats']:
+                path = os.path.join(directory, PATH.format(kind=kind, name=name, hash=digest, format=format))
+                if not os.path.exists(path):
+                    write_file(path, encoded if format == 'json' else dumps(content, format))
+    return manifest
@@ -0,0 +1,272 @@
+"""
+Registry of upstream sources.
+
+Every source is declared once, as a :class:`Source`, along with the host
+it is fetched from, how politely that host must be treated and roughly
+how large it is. The tables of :mod:`make_country_codes.tasks.data` are
+derived from the registry, and fetch tasks use it to claim a luigi
+resource per host (bounding concurrent requests to each host), to space
+out requests to a host and to start the largest downloads first.
+
+Other packages can register more sources through the
+``make_country_codes.sources`` entry point group; each entry point should
+refer to a :class:`Source` or an iterable of them. File sources are
+fetched by ``FileSource``, table sources by ``SimpleTableScrapeSource``,
+GOV.UK registers by ``RegisterSource``, and custom sources by a ``{name}Source`` task (and its ``Salted{name}Source``
+counterpart) that the plugin must define.
+"""
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+try:
+    from importlib.metadata import entry_points
+except ImportError:
+    entry_points = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ENTRY_POINT_GROUP = 'make_country_codes.sources'
+
+# kinds of sources
+FILE = 'file'
+TABLE = 'table'
+CUSTOM = 'custom'
+REGISTER = 'register'
+
+# defaults for hosts that don't declare politeness limits
+MAX_CONCURRENCY = 2
+MIN_INTERVAL = 1.0
+EXPECTED_SIZE = 100 * 1024
+
+# where the time of the last request to each host is recorded, in the
+# DATA_ROOT of fetching tasks, so that spacing is kept across worker processes
+THROTTLE_DIR = '.hosts'
+
+
+def host_of(url):
+    """Returns the hostname of `url`, e.g. `unstats.un.org`
+
+    Sources on other hosts of the same organization share limits only
+    when they declare the same `host`."""
+    return urlsplit(url).hostname or ''
+
+
+class Source:
+    """An upstream source of country codes
+
+    :param str name: slug of the source, used in task parameters and filenames
+    :param str title: name of the organization publishing the source
+    :param str url: location of the source
+    :param str kind: `FILE`, `TABLE`, `REGISTER` or `CUSTOM`
+    :param str host: host whose limits apply, by default derived from `url`
+    :param int max_concurrency: most requests in flight to `host` at once
+    :param float min_interval: fewest seconds between requests to `host`
+    :param int expected_size: rough size in bytes, larger sources are fetched first
+    :param bool history_only: only fetched to seed the history (see `--history`),
+        rather than joined into the table
+    """
+    def __init__(self, name, title, url, kind=FILE, host=None,
+                 max_concurrency=MAX_CONCURRENCY, min_interval=MIN_INTERVAL,
+                 expected_size=EXPECTED_SIZE, history_only=False):
+        self.name = name
+        self.title = title
+        self.url = url
+        self.kind = kind
+        self.host = host or host_of(url)
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.expected_size = expected_size
+        self.history_only = history_only
+
+    def __repr__(self):
+        return f'Source({self.name!r}, {self.url!r})'
+
+    @property
+    def ext(self):
+        if self.kind == FILE:
+            return os.path.splitext(urlsplit(self.url).path)[1]
+        if self.kind == REGISTER:
+            return '.jsonl'
+        return '.csv'
+
+    @property
+    def resource(self):
+        """Name of the luigi resource shared by sources on the same host"""
+        return f'host:{self.host}'
+
+    @property
+    def priority(self):
+        """luigi priority, so that larger downloads are scheduled first"""
+        return self.expected_size // 1024
+
+    def metadata(self):
+        return {'name': self.name, 'title': self.title, 'path': self.url}
+
+
+BUILTIN_SOURCES = [
+    Source('unterm', 'United Nations Protocol and Liason Service',
+           'https://protocol.un.org/dgacm/pls/site.nsf/files/Country%20Names%20UNTERM2/$FILE/UNTERM%20EFSRCA.xlsx',
+           host='un.org', max_concurrency=1, min_interval=2.0, expected_size=300 * 1024),
+    Source('iso4217', 'Swiss Association for Standardization',
+           'https://www.currency-iso.org/dam/downloads/lists/list_one.xml',
+           expected_size=100 * 1024),
+    # withdrawn currencies, with dates, used to seed the history
+    Source('iso4217-historic', 'Swiss Association for Standardization',
+           'https://www.currency-iso.org/dam/downloads/lists/list_three.xml',
+           expected_size=50 * 1024, history_only=True),
+    Source('marc', 'USA Library of Congress',
+           'http://www.loc.gov/standards/codelists/countries.xml',
+           expected_size=60 * 1024),
+    Source('cldr', 'Unicode Common Locale Data Repository',
+           'https://raw.githubusercontent.com/unicode-cldr/cldr-localenames-full/master/main/en/territories.json',
+           max_concurrency=4, min_interval=0.2, expected_size=20 * 1024),
+    Source('geonames', 'GeoNames',
+           'http://download.geonames.org/export/dump/countryInfo.txt',
+           expected_size=30 * 1024),
+    Source('usa-census', 'USA Census Bureau',
+           'https://www.census.gov/foreign-trade/schedules/c/country2.txt',
+           expected_size=10 * 1024),
+    Source('exio-wiod-eora', 'Secondary source providing EXIOBASE, WIOD, Eora, and other country codes',
+           'https://raw.githubusercontent.com/konstantinstadler/country_converter/master/country_converter/country_data.tsv',
+           max_concurrency=4, min_interval=0.2, expected_size=70 * 1024),
+    Source('ukgov', 'Government of the United Kingdom',
+           'https://country.register.gov.uk/records.json',
+           kind=REGISTER, expected_size=80 * 1024),
+    Source('ukgov-territory', 'Government of the United Kingdom',
+           'https://territory.register.gov.uk/records.json',
+           kind=REGISTER, expected_size=30 * 1024, history_only=True),
+    Source('Edgar', 'USA Security and Exchange Commission',
+           'https://www.sec.gov/edgar/searchedgar/edgarstatecodes.htm',
+           kind=CUSTOM, max_concurrency=1, min_interval=1.0, expected_size=40 * 1024),
+    Source('M49', 'United Nations Statistics Division',
+           'https://unstats.un.org/unsd/methodology/m49/overview/',
+           kind=CUSTOM, host='un.org', max_concurrency=1, min_interval=2.0, expected_size=1024 * 1024),
+    Source('itu-glad', 'International Telecommunications Union',
+           'https://www.itu.int/gladapp/GeographicalArea/List',
+           kind=TABLE, expected_size=150 * 1024),
+    Source('fao', 'Food and Agriculture Organization',
+           'http://www.fao.org/countryprofiles/iso3list/en/',
+           kind=TABLE, expected_size=60 * 1024),
+    Source('fifa-ioc', 'Wikipedia (FIFA and IOC)',
+           'https://simple.wikipedia.org/wiki/Comparison_of_IOC,_FIFA,_and_ISO_3166_country_codes',
+           kind=TABLE, expected_size=200 * 1024),
+]
+
+REGISTRY = OrderedDict()
+
+
+def register(source):
+    """Adds `source` to the registry, replacing any source of the same name"""
+    REGISTRY[source.name] = source
+    return source
+
+
+def load_entry_points():
+    """Registers sources provided by installed packages"""
+    if entry_points is not None:
+        eps = entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group=ENTRY_POINT_GROUP)
+        else:
+            eps = eps.get(ENTRY_POINT_GROUP, [])
+    else:
+        try:
+            import pkg_resources
+        except ImportError:
+            return
+        eps = pkg_resources.iter_entry_points(ENTRY_POINT_GROUP)
+
+    for ep in eps:
+        provided = ep.load()
+        for source in ([provided] if isinstance(provided, Source) else provided):
+            register(source)
+
+
+for _source in BUILTIN_SOURCES:
+    register(_source)
+load_entry_points()
+
+
+def sources(kind=None, history=True):
+    """Returns registered sources, optionally only those of `kind`
+
+    :param bool history: include sources only used by the history
+    :rtype: list
+    """
+    return [s for s in REGISTRY.values() if (kind is None or s.kind == kind)
+            and (history or not s.history_only)]
+
+
+def host_limits():
+    """Returns the strictest limits declared by sources on each host
+
+    :returns: `(max_concurrency, min_interval)` keyed by host
+    :rtype: dict
+    """
+    limits = {}
+    for source in REGISTRY.values():
+        concurrency, interval = limits.get(source.host, (source.max_concurrency,
+                                                         source.min_interval))
+        limits[source.host] = (min(concurrency, source.max_concurrency),
+                               max(interval, source.min_interval))
+    return limits
+
+
+def declared_host(url):
+    """Returns the host whose limits apply to requests to `url`, that
+    declared by registered sources on its hostname, or else its hostname"""
+    hostname = host_of(url)
+    return next((s.host for s in REGISTRY.values() if host_of(s.url) == hostname), hostname)
+
+
+@contextmanager
+def host_lock(path):
+    """Holds an exclusive lock of the host recorded at `path`, shared by
+    threads and processes, with `flock` where it is available"""
+    lock_path = f'{path}.lock'
+    if fcntl is None:
+        from .locks import FileLock
+        with FileLock(lock_path, poll_interval=0.05):
+            yield
+        return
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def wait_for_turn(url, throttle_dir):
+    """Sleeps until at least `min_interval` has passed since the last
+    request to the host of `url`, then records the time of this request
+    in `throttle_dir`
+
+    Concurrency is bounded by luigi resources, so this only spaces out
+    requests made by the (few) tasks holding a host at once. They take
+    turns holding a lock of the host, so that no two read the same time.
+
+    :returns: seconds slept
+    :rtype: float
+    """
+    host = declared_host(url)
+    _, interval = host_limits().get(host, (MAX_CONCURRENCY, MIN_INTERVAL))
+    os.makedirs(throttle_dir, exist_ok=True)
+    path = os.path.join(throttle_dir, host)
+    with host_lock(path):
+        try:
+            last = os.path.getmtime(path)
+        except OSError:
+            last = 0
+        delay = max(0.0, last + interval - time.time())
+        if delay:
+            time.sleep(delay)
+        with open(path, 'a'):
+            os.utime(path)
+    return delay
@@ -0,0 +1,86 @@
+"""
+Fast reading of xlsx workbooks.
+
+:func:`pandas.read_excel` loads a whole workbook into memory as cell
+objects before building a frame. :func:`read_xlsx` instead streams rows of
+a sheet, with the Rust `calamine` reader (``pip install python-calamine``)
+when available, or else openpyxl in read-only mode, and builds a frame
+like :func:`pandas.read_excel` would.
+"""
+import io
+
+import pandas as pd
+
+from .scrape import unique_columns
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+def _value(value):
+    """Returns a cell value as pandas would read it: empty cells are
+    None and integral numbers are ints"""
+    if value == '':
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def sheet_rows(f, sheet=0):
+    """Yields the values of each row of a sheet of the workbook in `f`
+
+    :param f: a seekable binary file
+    :param int sheet: index of the sheet
+    :raises ImportError: if neither calamine nor openpyxl is installed
+    """
+    if CalamineWorkbook is not None:
+        workbook = CalamineWorkbook.from_filelike(f)
+        yield from workbook.get_sheet_by_index(sheet).to_python(skip_empty_area=False)
+        return
+    if openpyxl is None:
+        raise ImportError('reading xlsx requires python-calamine or openpyxl')
+    workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[sheet].rows:
+            yield [cell.value for cell in row]
+    finally:
+        # read-only workbooks hold their archive open until closed
+        if hasattr(workbook, 'close'):
+            workbook.close()
+
+
+def read_xlsx(f, sheet=0):
+    """Returns a sheet of the workbook in `f` as a DataFrame, with
+    column names from its first row
+
+    Like :func:`pandas.read_excel`, unnamed columns are named
+    `Unnamed: {i}` and repeated names are suffixed `.1`, but only empty
+    cells are missing values (Namibia's 2 letter code is `NA`!).
+
+    :param f: a binary file, which is buffered in memory if not seekable
+        (e.g. a decompressing reader)
+    :param int sheet: index of the sheet
+    :rtype: pandas.DataFrame
+    """
+    if not (hasattr(f, 'seekable') and f.seekable()):
+        f = io.BytesIO(f.read())
+    rows = iter(sheet_rows(f, sheet))
+    header = next(rows, [])
+    while header and header[-1] in (None, ''):
+        header = header[:-1]
+    columns = unique_columns([f'Unnamed: {i}' if name in (None, '') else str(name)
+                              for i, name in enumerate(header)])
+    width = len(columns)
+    records = []
+    for row in rows:
+        values = [_value(value) for value in row[:width]]
+        records.append(values + [None] * (width - len(values)))
+    return pd.DataFrame(records, columns=columns).infer_objects()
@@ -0,0 +1,324 @@
+"""
+Synthetic upstream sources, at any scale.
+
+The real sources describe about 250 countries, too few for code that is
+quadratic in the number of rows to stand out. :func:`countries` makes up
+any number of countries, with codes and names that agree across sources
+(each source leaves out a few, as real sources do), and :func:`write_sources`
+writes every source in its upstream format:
+
+- files (the UNTERM workbook, ISO 4217 and MARC XML, CLDR JSON, the
+  geonames TSV, the census pipe separated text, exio-wiod-eora's TSV),
+  in `build/` as :class:`make_country_codes.tasks.data.FileSource` would
+- registers, as JSON lines in `build/` as
+  :class:`make_country_codes.tasks.data.RegisterSource` would
+- scraped pages (M49, Edgar and the tables of fao, fifa-ioc and
+  itu-glad), as HTML in `pages/`, to be served in place of their urls,
+  see :func:`page_fetcher`
+
+See :mod:`make_country_codes.bench` for running the pipeline over them.
+"""
+import json
+import os
+import random
+import zlib
+from collections import namedtuple
+from html import escape
+from xml.sax.saxutils import escape as escape_xml
+
+from luigi.task import logger as luigi_logger
+
+from .sources import REGISTRY
+from .tasks.data import M49_TABLES
+
+# countries at scale 1, about as many as in the real sources
+COUNTRIES = 250
+# fraction of countries left out of each source
+GAPS = 0.02
+# rows of an xlsx worksheet, besides its header
+MAX_SHEET_ROWS = 1048575
+
+SYLLABLES = ['ba', 'ka', 'lo', 'mi', 'nu', 're', 'sa', 'to',
+             'vi', 'zo', 'de', 'fu', 'ga', 'hi', 'jo', 'pe']
+# languages of columns of the UNTERM workbook
+UNTERM_LANGUAGES = [('English', 'en'), ('French', 'fr'), ('Spanish', 'es'),
+                    ('Russian', 'ru'), ('Chinese', 'cn'), ('Arabic', 'ar')]
+CONTINENTS = ['AF', 'AS', 'EU', 'NA', 'OC', 'SA']
+REGIONS = ['Africa', 'Asia', 'Europe', 'South America', 'Oceania']
+# columns of each table of the M49 overview page
+M49_COLUMNS = ['Global Code', 'Global Name', 'Region Code', 'Region Name',
+               'Sub-region Code', 'Sub-region Name', 'Intermediate Region Code',
+               'Intermediate Region Name', 'Country or Area', 'M49 Code',
+               'ISO-alpha3 Code', 'Least Developed Countries (LDC)',
+               'Land Locked Developing Countries (LLDC)',
+               'Small Island Developing States (SIDS)',
+               'Developed / Developing Countries']
+EXIO_COLUMNS = ['name_short', 'name_official', 'regex', 'ISO2', 'ISO3', 'ISOnumeric',
+                'UNcode', 'continent', 'UNregion', 'EXIO1', 'EXIO2', 'EXIO3', 'WIOD',
+                'Eora', 'OECD', 'EU', 'EURO', 'UNmember', 'obsolete', 'Cecilia2050']
+GEONAMES_COLUMNS = ['ISO', 'ISO3', 'ISO-Numeric', 'fips', 'Country', 'Capital',
+                    'Area(in sq km)', 'Population', 'Continent', 'tld', 'CurrencyCode',
+                    'CurrencyName', 'Phone', 'Postal Code Format', 'Postal Code Regex',
+                    'Languages', 'geonameid', 'neighbours', 'EquivalentFipsCode']
+# lines of comments before the header of geonames' countryInfo.txt
+GEONAMES_COMMENTS = 50
+
+Country = namedtuple('Country', ['index', 'name', 'iso2', 'iso3', 'numeric', 'currency'])
+
+
+def letters(i, width):
+    """Returns `i` as capital letters, at least `width` of them"""
+    code = ''
+    while i or len(code) < width:
+        i, digit = divmod(i, 26)
+        code = chr(ord('A') + digit) + code
+    return code
+
+
+def word(i, width=3):
+    """Returns `i` as a made up word of at least `width` syllables,
+    e.g. `Bakalonia`. Words of different countries never contain
+    each other"""
+    syllables = ''
+    while i or len(syllables) < 2 * width:
+        i, digit = divmod(i, len(SYLLABLES))
+        syllables = SYLLABLES[digit] + syllables
+    return syllables.capitalize() + 'nia'
+
+
+def countries(scale=1):
+    """Returns `COUNTRIES * scale` made up countries
+
+    :rtype: list
+    """
+    return [Country(i, word(i), letters(i, 2), letters(i, 3), f'{i + 1:03d}',
+                    letters(i, 3)[::-1])
+            for i in range(int(COUNTRIES * scale))]
+
+
+def covered(source, world, gaps=GAPS):
+    """Returns the countries of `world` in `source`, leaving out about
+    `gaps` of them, the same ones on every call"""
+    rng = random.Random(zlib.crc32(source.encode('utf-8')))
+    return [country for country in world if rng.random() >= gaps]
+
+
+def html_table(columns, rows, **attributes):
+    """Returns an HTML table with a header of `columns`"""
+    attrs = ''.join(f' {name}="{escape(value)}"' for name, value in attributes.items())
+    lines = [f'<table{attrs}>', '<tr>' + ''.join(f'<th>{escape(c)}</th>' for c in columns) + '</tr>']
+    lines.extend('<tr>' + ''.join(f'<td>{escape(str(v))}</td>' for v in row) + '</tr>' for row in rows)
+    lines.append('</table>')
+    return '\n'.join(lines)
+
+
+def html_page(*tables):
+    return ('<html><head><meta charset="utf-8"></head><body>\n'
+            + '\n'.join(tables) + '\n</body></html>').encode('utf-8')
+
+
+def m49_page(world):
+    tables = []
+    for lang, table_id in M49_TABLES.items():
+        local = '' if lang == 'en' else f' ({lang})'
+        rows = []
+        for c in world:
+            region = c.index % len(REGIONS)
+            flags = ['x' if (c.index >> bit) % 7 == 0 else '' for bit in range(3)]
+            rows.append(['001', f'World{local}', f'{region + 2:03d}', f'{REGIONS[region]}{local}',
+                         f'{region + 10:03d}', f'Sub-region {region}{local}', '', '',
+                         f'{c.name}{local}', c.numeric, c.iso3] + flags
+                        + ['Developed' if c.index % 3 else 'Developing'])
+        tables.append(html_table(M49_COLUMNS, rows, id=table_id))
+    return html_page(*tables)
+
+
+def edgar_page(world):
+    states = [[f'S{i}', f'State {i}'] for i in range(50)]
+    rows = states + [['Other Countries', '']] + [[f'E{c.index}', c.name.upper()] for c in world]
+    # codes are in the fourth table of the page
+    return html_page(*[html_table(['Code', 'State or Country'], []) for _ in range(3)],
+                     html_table(['Code', 'State or Country'], rows))
+
+
+def unterm_rows(world):
+    for c in world:
+        yield [f'{c.name}{"" if lang == "en" else f" ({lang})"}' for _, lang in UNTERM_LANGUAGES] + \
+              [f'the Republic of {c.name}' for _ in UNTERM_LANGUAGES]
+
+
+def write_unterm(path, world):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([f'{language} Short' for language, _ in UNTERM_LANGUAGES] +
+                 [f'{language} Formal' for language, _ in UNTERM_LANGUAGES])
+    if len(world) > MAX_SHEET_ROWS:
+        luigi_logger.warning('only the first %d of %d countries fit in the UNTERM workbook',
+                             MAX_SHEET_ROWS, len(world))
+    for row in unterm_rows(world[:MAX_SHEET_ROWS]):
+        sheet.append(row)
+    workbook.save(path)
+
+
+def iso4217_xml(world):
+    entries = []
+    for c in world:
+        entries.append((c.name.upper(), f'{c.name} Dollar', c.currency, c.numeric, '2'))
+        if c.index % 10 == 0:
+            # also a currency accepted there, which is left out
+            entries.append((c.name.upper(), 'US Dollar', 'USD', '840', '2'))
+    tags = ['CtryNm', 'CcyNm', 'Ccy', 'CcyNbr', 'CcyMnrUnts']
+    lines = ['<ISO_4217 Pblshd="2019-01-01"><CcyTbl>']
+    lines.extend('<CcyNtry>' + ''.join(f'<{t}>{escape_xml(v)}</{t}>' for t, v in zip(tags, entry))
+                 + '</CcyNtry>' for entry in entries)
+    lines.append('</CcyTbl></ISO_4217>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def iso4217_historic_xml(world):
+    lines = ['<ISO_4217 Pblshd="2019-01-01"><HstrcCcyTbl>']
+    for c in world[::5]:
+        lines.append(f'<HstrcCcyNtry><CtryNm>{c.name.upper()}</CtryNm><CcyNm>Old {c.name} Dollar</CcyNm>'
+                     f'<Ccy>{c.currency[:2]}O</Ccy><CcyNbr>9{c.numeric}</CcyNbr>'
+                     f'<WthdrwlDt>{1990 + c.index % 30}-01</WthdrwlDt></HstrcCcyNtry>')
+    lines.append('</HstrcCcyTbl></ISO_4217>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def marc_xml(world):
+    lines = ['<codelist xmlns="info:lc/xmlns/codelist-v1"><countries>']
+    lines.extend(f'<country><name>{c.name}</name><code>{c.iso2.lower()}</code>'
+                 f'<region>{REGIONS[c.index % len(REGIONS)]}</region></country>' for c in world)
+    lines.append('</countries></codelist>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def cldr_json(world):
+    territories = {'001': 'world', '002': 'Africa'}
+    for c in world:
+        territories[c.iso2] = c.name
+        if c.index % 4 == 0:
+            territories[f'{c.iso2}-alt-short'] = c.name[:4]
+    return json.dumps({'main': {'en': {'localeDisplayNames': {'territories': territories}}}},
+                      ensure_ascii=False).encode('utf-8')
+
+
+def geonames_txt(world):
+    lines = [f'# comment {i}' for i in range(GEONAMES_COMMENTS)]
+    lines.append('#' + '\t'.join(GEONAMES_COLUMNS))
+    for c in world:
+        lines.append('\t'.join([c.iso2, c.iso3, str(c.index + 1), c.iso2[::-1], c.name,
+                                f'{c.name} City', f'{c.index * 10.5:.1f}', str(c.index * 1000),
+                                CONTINENTS[c.index % len(CONTINENTS)], f'.{c.iso2.lower()}',
+                                c.currency, f'{c.name} Dollar', str(c.index), '#####',
+                                r'^(\d{5})$', 'en', str(1000000 + c.index), '', '']))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def census_txt(world):
+    lines = ['Schedule C', 'Country Codes', 'Foreign Trade', ' Code | Name | ISO Code', '-----|-----|-----']
+    lines.extend(f'{c.index:04d}|{c.name}| {c.iso2}' for c in world)
+    lines.extend(['Notes', 'End'])
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def exio_tsv(world):
+    lines = ['\t'.join(EXIO_COLUMNS)]
+    for c in world:
+        lines.append('\t'.join([c.name, f'the Republic of {c.name}', rf'\b{c.name.lower()}\b',
+                                c.iso2, c.iso3, str(c.index + 1), str(c.index + 1),
+                                REGIONS[c.index % len(REGIONS)], f'Region {c.index % 7}',
+                                'WA', 'WA', 'WA', 'RoW', c.iso3, '', '', '', 'UN', '', '']))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def register_jsonl(world, key):
+    lines = []
+    for c in world:
+        item = {key: c.iso2, 'name': c.name, 'official-name': f'The Republic of {c.name}',
+                'citizen-names': f'{c.name}n'}
+        if c.index % 9 == 0:
+            item['start-date'] = f'{1950 + c.index % 50}-01-01'
+        lines.append(json.dumps({'entry-number': str(c.index + 1), 'key': c.iso2, 'item': [item]},
+                                ensure_ascii=False))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def table_pages(world, gaps=GAPS):
+    """Returns the content of each scraped page, by name of source
+
+    :rtype: dict
+    """
+    return {
+        'M49': m49_page(covered('M49', world, gaps)),
+        'Edgar': edgar_page(covered('Edgar', world, gaps)),
+        'fao': html_page(html_table(
+            ['Short name', 'Official name', 'ISO3', 'ISO2', 'UNI', 'UNDP', 'FAOSTAT', 'GAUL'],
+            [[c.name, f'the Republic of {c.name}', c.iso3, c.iso2, c.iso3, c.iso3,
+              c.index + 1, c.index + 1000] for c in covered('fao', world, gaps)])),
+        'fifa-ioc': html_page(html_table(
+            ['Country', 'Flag', 'IOC', 'FIFA', 'ISO'],
+            [[c.name, '', c.iso3[::-1], c.iso3, c.iso3] for c in covered('fifa-ioc', world, gaps)])),
+        'itu-glad': html_page(html_table(
+            ['Designation', 'Code'],
+            [[f'{c.name} (Republic of)', c.iso3] for c in covered('itu-glad', world, gaps)])),
+    }
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def write_sources(root, scale=1, gaps=GAPS):
+    """Writes every source of `COUNTRIES * scale` made up countries in `root`
+
+    :param str root: where a build will run, with `build/` and `pages/`
+    :param float scale: countries, relative to the real sources
+    :param float gaps: fraction of countries left out of each source
+    :returns: paths of scraped pages, by url
+    :rtype: dict
+    """
+    world = countries(scale)
+    build = os.path.join(root, 'build')
+    files = {
+        'iso4217': iso4217_xml(covered('iso4217', world, gaps)),
+        'iso4217-historic': iso4217_historic_xml(covered('iso4217-historic', world, gaps)),
+        'marc': marc_xml(covered('marc', world, gaps)),
+        'cldr': cldr_json(covered('cldr', world, gaps)),
+        'geonames': geonames_txt(covered('geonames', world, gaps)),
+        'usa-census': census_txt(covered('usa-census', world, gaps)),
+        'exio-wiod-eora': exio_tsv(covered('exio-wiod-eora', world, gaps)),
+    }
+    for name, content in files.items():
+        write_file(os.path.join(build, f'FileSource-{name}{REGISTRY[name].ext}'), content)
+    os.makedirs(build, exist_ok=True)
+    write_unterm(os.path.join(build, 'FileSource-unterm.xlsx'), covered('unterm', world, gaps))
+
+    registers = {'ukgov': register_jsonl(covered('ukgov', world, gaps), 'country'),
+                 # territories are few
+                 'ukgov-territory': register_jsonl(world[::50], 'territory')}
+    for name, content in registers.items():
+        write_file(os.path.join(build, f'RegisterSource-{name}.jsonl'), content)
+
+    pages = {}
+    for name, content in table_pages(world, gaps).items():
+        path = os.path.join(root, 'pages', f'{name}.html')
+        write_file(path, content)
+        pages[REGISTRY[name].url] = path
+    return pages
+
+
+def page_fetcher(pages):
+    """Returns a fetcher (see :func:`make_country_codes.utils.fetching_with`)
+    which reads the pages written by :func:`write_sources`
+
+    :param dict pages: paths of pages, by url
+    """
+    def fetch(url, throttle_dir):
+        with open(pages[url], 'rb') as f:
+            return f.read()
+    return fetch
@@ -0,0 +1,168 @@
+"""
+In-memory lookups over a built country codes table.
+
+Like :mod:`make_country_codes.names`, this module depends only on the
+standard library so that services and batch jobs can convert codes
+without loading pandas.
+"""
+import os
+import csv
+
+from .names import build_index
+from .names import NameIndex
+from .artifacts import latest_artifact
+from .artifacts import salt_of
+
+# short names of code schemes, and their columns in the assembled table
+SCHEMES = {
+    'ISO3': 'ISO3 (exio-wiod-eora)',
+    'ISO2': 'ISO2 (exio-wiod-eora)',
+    'ISONumeric': 'ISOnumeric (exio-wiod-eora)',
+    'M49': 'M49 Code (M49)',
+    'FIPS': 'fips (geonames)',
+    'GeoNames': 'geonameid (geonames)',
+    'TLD': 'tld (geonames)',
+    'IOC': 'IOC (fifa-ioc)',
+    'FIFA': 'FIFA (fifa-ioc)',
+    'FAOSTAT': 'FAOSTAT (fao)',
+    'GAUL': 'GAUL (fao)',
+    'MARC': 'Marc Code (marc)',
+    'Edgar': 'Edgar Code (edgar)',
+    'ITU': 'Code (itu-glad)',
+    'Census': 'Code (usa-census)',
+    'Currency': 'Currency Code Alpha (iso4217)',
+    'CurrencyNumeric': 'Currency Code Numeric (iso4217)',
+    'EXIO3': 'EXIO3 (exio-wiod-eora)',
+    'WIOD': 'WIOD (exio-wiod-eora)',
+    'Eora': 'Eora (exio-wiod-eora)',
+}
+
+# pseudo-scheme for converting from names, via :class:`NameIndex`
+NAME = 'name'
+
+
+def latest_paths(root='build/'):
+    """Returns the paths of the most recently built table in `root` and of
+    the name index built from it, which has the same salt
+
+    :raises FileNotFoundError: if no table, or no index of it, has been built
+    :rtype: tuple
+    """
+    path = latest_artifact('country-codes-', '.csv', root=root)
+    if path is None:
+        raise FileNotFoundError(f'no country-codes table in {root}')
+    index_path = os.path.join(root, f'name-index-{salt_of(path)}.json')
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f'no name index of {path} in {root}')
+    return path, index_path
+
+
+class UnknownScheme(KeyError):
+    pass
+
+
+class CountryTable:
+    """Rows of a built country codes table, indexed by code scheme
+
+    Indexes for each scheme are built on first use. Codes are matched
+    exactly, except that alphabetic codes are case-insensitive.
+
+    :param list rows: dicts keyed by columns of the assembled table
+    :param NameIndex names: index used to resolve names, built from `rows` if None
+    """
+    def __init__(self, rows, names=None, path=None):
+        self.rows = rows
+        self.path = path
+        self.columns = list(rows[0]) if rows else []
+        self._names = names
+        self._indexes = {}
+
+    @classmethod
+    def load(cls, path, index_path=None):
+        """Loads the CSV at `path` and optionally a name index
+
+        :param str path: location of a built `country-codes-{salt}.csv`
+        :param str index_path: location of a built `name-index-{salt}.json`
+        :rtype: CountryTable
+        """
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        names = NameIndex.load(index_path) if index_path else None
+        return cls(rows, names=names, path=path)
+
+    @classmethod
+    def latest(cls, root='build/'):
+        """Loads the most recently built table and its name index in `root`,
+        see :func:`latest_paths`
+
+        :raises FileNotFoundError: if no table, or no index of it, has been built
+        :rtype: CountryTable
+        """
+        return cls.load(*latest_paths(root))
+
+    @property
+    def salt(self):
+        """Salt of the loaded table, parsed from its filename"""
+        if self.path is None:
+            return None
+        return salt_of(self.path)
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = NameIndex(build_index(self.rows))
+        return self._names
+
+    def column(self, scheme):
+        """Returns the column of `scheme`, which may itself be a column name
+
+        :raises UnknownScheme: if `scheme` is not a scheme or column
+        :rtype: str
+        """
+        column = SCHEMES.get(scheme, scheme)
+        if column not in self.columns:
+            raise UnknownScheme(scheme)
+        return column
+
+    def index(self, scheme):
+        """Returns a mapping of codes of `scheme` to rows
+
+        When several rows share a code, the first is used.
+
+        :rtype: dict
+        """
+        column = self.column(scheme)
+        if column not in self._indexes:
+            index = {}
+            for row in self.rows:
+                code = row[column]
+                if code:
+                    index.setdefault(code.upper(), row)
+            self._indexes[column] = index
+        return self._indexes[column]
+
+    def find(self, value, scheme):
+        """Returns the row identified by `value` in `scheme`, or None
+
+        :param str value: a code, or a name when `scheme` is `NAME`
+        :param str scheme: key of `SCHEMES`, a column name, or `NAME`
+        :rtype: dict or None
+        """
+        if not value:
+            return None
+        if scheme == NAME:
+            iso3 = self.names.resolve(value)
+            return self.index('ISO3').get(iso3) if iso3 else None
+        return self.index(scheme).get(str(value).upper())
+
+    def convert(self, value, from_scheme, to_scheme):
+        """Converts `value` from one scheme to another
+
+        :returns: the converted code, or None if `value` is unknown
+        :rtype: str or None
+        """
+        to_column = self.column(to_scheme)
+        row = self.find(value, from_scheme)
+        if row is None:
+            return None
+        return row[to_column] or None
@@ -1,23 +1,55 @@
-import re
+import csv
 import json
-from itertools import filterfalse
+from functools import reduce
+from itertools import islice
 
+from luigi import IntParameter
+from luigi import Parameter
 from luigi import Task
 from luigi.task import logger as luigi_logger
 
 import pandas as pd
 from lxml import objectify
-from datapackage import Package
 
 from ..utils import TargetOutput
 from ..utils import SaltedOutput
 from ..utils import SuffixPreservingLocalTarget as LocalTarget
-from ..utils import convert_numeric_code_with_pad
-from ..utils import convert_numeric_code
 from ..utils import Requires
 from ..utils import Requirement
-
+from ..utils import cutoff_early
+from ..utils import open_target
+from ..utils import sha256sum
+from ..backends import get_backend
+from ..cldr import fold_alternates
+from ..cldr import iter_rows
+from ..cldr import territory_names
+from ..cldr import territory_rows
+from ..cldr import COLUMNS
+from ..frames import as_text
+from ..frames import cached_frame
+from ..frames import read_frame
+from ..frames import write_frame
+from ..frames import write_frames
+from ..frames import FRAME_EXT
+from ..locks import locked
+from ..matching import NameMatcher
+from ..schema import apply_dtypes
+from ..schema import describe_resource
+from ..schema import read_csv
+from ..registers import current_item
+from ..registers import iter_jsonl
+from .. import projection
+from ..normalize import remove
+from ..normalize import pad_code
+from ..normalize import numeric_code
+from ..normalize import replace_aliases
+from ..normalize import FOOTNOTE
+from ..normalize import ESCAPED_NEWLINE
+from ..spreadsheet import read_xlsx
+
+from .data import CLDRLocalesSource
 from .data import SaltedFileSource
+from .data import SaltedRegisterSource
 from .data import SaltedSTSSource
 from .data import SaltedM49Source
 from .data import SaltedEdgarSource
@@ -25,31 +57,103 @@ from .data import SOURCES
 from .data import DEV_MODE
 
 
-class UNCodes(Task):
+def read_raw_csv(source, target, **kwargs):
+    """Reads the (possibly compressed) raw CSV of `source` at `target`,
+    see :func:`make_country_codes.schema.read_csv`"""
+    def read():
+        with open_target(target) as f:
+            return read_csv(source, f, **kwargs)
+    return cached_frame(target.path, read, key=repr((source, sorted(kwargs.items()))))
+
+
+def match_on_names(df, name_column, matcher):
+    """Returns `df` with the `ISO3` code of each of its names, see
+    :class:`make_country_codes.matching.NameMatcher`
+
+    Names matching no country have the code '', with a warning.
+
+    :param str name_column: column of names
+    :rtype: pandas.DataFrame
+    """
+    def correct(territory):
+        return pd.Series({'ISO3': matcher.match(territory), name_column: territory})
+    # once per name, as merging repeated names would square their rows
+    df = pd.merge(df, df.get(name_column).drop_duplicates().apply(correct))
+    unmatched = df['ISO3'] == ''
+    if unmatched.any():
+        luigi_logger.warning('%d names in %s match no country', unmatched.sum(), name_column)
+    return df
+
+
+def merge_matched(frames):
+    """Returns the outer join of `frames` on `ISO3`, see :func:`match_on_names`
+
+    Rows of names matching no country all have the same code, '', so
+    rather than joined to each other they follow the join, once each.
+
+    :rtype: pandas.DataFrame
+    """
+    merged = reduce(lambda left, right: pd.merge(left, right, how='outer',
+                                                 left_on='ISO3',
+                                                 right_on='ISO3'),
+                    [df[df['ISO3'] != ''] for df in frames])
+    return pd.concat([merged] + [df[df['ISO3'] == ''] for df in frames],
+                     sort=False, ignore_index=True)
+
+
+class UntermSheet(Task):
+    """The UNTERM workbook, decoded once into a columnar file keyed by
+    the salt of the workbook, so that it is only parsed when it changes"""
     __version__ = '0.1'
     DATA_ROOT = 'build/'
 
     pattern = '{task.__class__.__name__}-{salt}'
-    output = SaltedOutput(file_pattern=pattern, ext='.csv',
+    output = SaltedOutput(file_pattern=pattern, ext=FRAME_EXT,
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
     requires = Requires()
     unterm = Requirement(SaltedFileSource, slug='unterm', ext='.xlsx')
+
+    @property
+    def salt(self):
+        return self.requires().get('unterm').salt
+
+    @locked
+    def run(self):
+        with open_target(self.requires().get('unterm').output()) as f:
+            unterm = read_xlsx(f)
+
+        with self.output().temporary_path() as path:
+            write_frame(unterm, path)
+
+
+class UNCodes(Task):
+    __version__ = '0.1'
+    DATA_ROOT = 'build/'
+
+    pattern = '{task.__class__.__name__}-{salt}'
+    output = SaltedOutput(file_pattern=pattern, ext=FRAME_EXT,
+                          base_dir=DATA_ROOT,
+                          target_class=LocalTarget)
+
+    requires = Requires()
+    unterm = Requirement(UntermSheet)
     m49 = Requirement(SaltedM49Source, slug='M49', ext='.csv')
 
+    @cutoff_early
+    @locked
     def run(self):
         # Namibia's 2 letter codes are often `NA`, so setting
         # `keep_default_na=False` and clearing `na_values` is essential!
-        m49 = pd.read_csv(self.requires().get('m49').output().path,
-                          keep_default_na=False, na_values=['_'],
-                          converters={'Country or Area_en':
-                                      lambda x: x.replace("Côte d’Ivoire", "Côte d'Ivoire"),
-                                      'M49 Code': convert_numeric_code_with_pad,
-                                      'Global Code': convert_numeric_code,
-                                      'Region Code': convert_numeric_code,
-                                      'Sub-region Code': convert_numeric_code,
-                                      'Intermediate Region Code': convert_numeric_code})
+        m49 = read_csv('M49', self.requires().get('m49').output().path,
+                       keep_default_na=False, na_values=['_'])
+        m49['Country or Area_en'] = replace_aliases(m49['Country or Area_en'],
+                                                    {"Côte d’Ivoire": "Côte d'Ivoire"})
+        m49['M49 Code'] = pad_code(m49['M49 Code'])
+        for column in ['Global Code', 'Region Code', 'Sub-region Code',
+                       'Intermediate Region Code']:
+            m49[column] = numeric_code(m49[column])
         m49 = m49.add_suffix(' (M49)')
 
         # UN Protocol liason office needs to update their names!
@@ -58,15 +162,11 @@ class UNCodes(Task):
             "Swaziland": "Eswatini",
             "the former Yugoslav Republic of Macedonia": "North Macedonia"}
 
-        def fix_english_short(text):
-            better = text.replace('(the)', '').replace('*', '').strip()
-            for old, new in unterm_replacements.items():
-                better = better.replace(old, new)
-            return better
+        unterm = read_frame(self.requires().get('unterm').output().path)
 
-        unterm_converters = {'English Short': fix_english_short}
-        unterm = pd.read_excel(self.requires().get('unterm').output().path,
-                               converters=unterm_converters)
+        english_short = unterm['English Short'].str.replace('(the)', '', regex=False)
+        english_short = english_short.str.replace('*', '', regex=False).str.strip()
+        unterm['English Short'] = replace_aliases(english_short, unterm_replacements)
 
         unterm = unterm.add_suffix(' (unterm)')
 
@@ -76,8 +176,8 @@ class UNCodes(Task):
                       left_on='Country or Area_en (M49)',
                       right_on='English Short (unterm)')
 
-        with self.output().open('w') as f:
-            un.to_csv(f, index=False, float_format='%.0f')
+        with self.output().temporary_path() as path:
+            write_frame(as_text(un), path)
 
 
 class iso4217(Task):
@@ -85,15 +185,18 @@ class iso4217(Task):
     DATA_ROOT = 'build/'
 
     pattern = '{task.__class__.__name__}-{salt}'
-    output = SaltedOutput(file_pattern=pattern, ext='.csv',
+    output = SaltedOutput(file_pattern=pattern, ext=FRAME_EXT,
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
     requires = Requires()
     iso4217 = Requirement(SaltedFileSource, slug='iso4217', ext='.xml')
 
+    @cutoff_early
+    @locked
     def run(self):
-        as_xml = objectify.parse(self.requires().get('iso4217').output().path)
+        with open_target(self.requires().get('iso4217').output()) as f:
+            as_xml = objectify.parse(f)
 
         # currencies to skip
         skip = ['EUROPEAN UNION', 'MEMBER COUNTRIES OF THE AFRICAN DEVELOPMENT BANK GROUP',\
@@ -120,7 +223,7 @@ class iso4217(Task):
         }
 
         as_lists = []
-        seen = []
+        seen = set()
         for iso_currency_table in as_xml.iter():
             if isinstance(iso_currency_table, objectify.ObjectifiedElement):
                 # get strings rather than an ObjectifiedElements
@@ -137,7 +240,7 @@ class iso4217(Task):
                             # source includes additional, commonly used or
                             # accepted currencies from other states.
                             # we keep only the first/most official currency
-                            seen.append(currency[0])
+                            seen.add(currency[0])
                             as_lists.append(currency)
 
         columns = ['Country Name (iso4217)', 'Currency Name (iso4217)',\
@@ -145,8 +248,8 @@ class iso4217(Task):
                    'Currency Minor Units (iso4217)']
         df = pd.DataFrame(data=as_lists, columns=columns)
 
-        with self.output().open('w') as f:
-            df.to_csv(f, index=False, float_format='%.0f')
+        with self.output().temporary_path() as path:
+            write_frame(as_text(df), path)
 
 
 class marc(Task):
@@ -154,15 +257,18 @@ class marc(Task):
     DATA_ROOT = 'build/'
 
     pattern = '{task.__class__.__name__}-{salt}'
-    output = SaltedOutput(file_pattern=pattern, ext='.csv',
+    output = SaltedOutput(file_pattern=pattern, ext=FRAME_EXT,
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
     requires = Requires()
     marc = Requirement(SaltedFileSource, slug='marc', ext='.xml')
 
+    @cutoff_early
+    @locked
     def run(self):
-        as_xml = objectify.parse(self.requires().get('marc').output().path)
+        with open_target(self.requires().get('marc').output()) as f:
+            as_xml = objectify.parse(f)
         as_lists = []
         for territory in as_xml.getroot().countries.iterchildren():
             if isinstance(territory, objectify.ObjectifiedElement):
@@ -187,8 +293,8 @@ class marc(Task):
                    'Continent (marc)']
         df = pd.DataFrame(data=as_lists, columns=columns)
 
-        with self.output().open('w') as f:
-            df.to_csv(f, index=False, float_format='%.0f')
+        with self.output().temporary_path() as path:
+            write_frame(as_text(df), path)
 
 
 class ukgov(Task):
@@ -196,22 +302,37 @@ class ukgov(Task):
     DATA_ROOT = 'build/'
 
     pattern = '{task.__class__.__name__}-{salt}'
-    output = SaltedOutput(file_pattern=pattern, ext='.csv',
+    output = SaltedOutput(file_pattern=pattern, ext=FRAME_EXT,
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
     requires = Requires()
-    ukgov = Requirement(SaltedFileSource, slug='ukgov', ext='.json')
+    ukgov = Requirement(SaltedRegisterSource, slug='ukgov', ext='.jsonl')
 
+    # records held in memory at a time, see :func:`make_country_codes.frames.write_frames`
+    batch_size = 10000
+
+    @cutoff_early
+    @locked
     def run(self):
+        # items may have fields of their own, so all fields are found first
         source = self.requires().get('ukgov').output()
-        as_json = json.load(open(source.path, 'r'))
-        as_list_of_dicts  = {k: v['item'][0] for k,v in as_json.items()}.values()
-        df = pd.DataFrame(as_list_of_dicts)
-        df = df.add_suffix(' (ukgov)')
+        with open_target(source) as f:
+            fields = sorted({field for record in iter_jsonl(f) for field in current_item(record)})
 
-        with self.output().open('w') as f:
-            df.to_csv(f, index=False, float_format='%.0f')
+        def batches():
+            with open_target(source) as f:
+                records = iter_jsonl(f)
+                while True:
+                    items = [current_item(record) for record in islice(records, self.batch_size)]
+                    if not items:
+                        return
+                    df = pd.DataFrame([[item.get(field, '') for field in fields] for item in items],
+                                      columns=fields)
+                    yield as_text(apply_dtypes('ukgov', df).add_suffix(' (ukgov)'))
+
+        with self.output().temporary_path() as path:
+            write_frames(batches(), path, [f'{field} (ukgov)' for field in fields])
 
 
 class cldr(Task):
@@ -219,53 +340,111 @@ class cldr(Task):
     DATA_ROOT = 'build/'
 
     pattern = '{task.__class__.__name__}-{salt}'
-    output = SaltedOutput(file_pattern=pattern, ext='.csv',
+    output = SaltedOutput(file_pattern=pattern, ext=FRAME_EXT,
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
     requires = Requires()
     cldr = Requirement(SaltedFileSource, slug='cldr', ext='.json')
 
+    @cutoff_early
+    @locked
     def run(self):
-        source = self.requires().get('cldr').output()
-        as_json = json.load(open(source.path, 'r'))
-        territories = as_json['main']['en']['localeDisplayNames']['territories']
-
-        # find countries with alternate short/variant names
-        alt = {k: v for k,v in territories.items() if len(k) > 2 and not k.isdigit()}
-
-        # instead of separate items, append alternates to name separated by semicolon
-        for k, v in alt.items():
-            code, alt, kind = k.split('-')
-            # find original name
-            orig = territories.get(code)
-            # combine cldr name and alternate
-            edit = f'{orig}; {v}'
-            # update with alternate name
-            territories.update({code: edit})
-            # remove alternate item
-            territories.pop(k)
-
-        # discard continents/regions (which have numeric codes)
-        countries = filterfalse(lambda x: x[0].isdigit(), territories.items())
+        with open_target(self.requires().get('cldr').output()) as f:
+            rows = territory_rows(territory_names(f), 'en')
+            # instead of separate items, append alternates to name separated by semicolon
+            countries = list(fold_alternates(rows).items())
 
         columns = ['Locale Code (cldr)', 'Locale Display Name (cldr)']
         df = pd.DataFrame(countries, columns=columns)
 
-        with self.output().open('w') as f:
-            df.to_csv(f, index=False, float_format='%.0f')
+        with self.output().temporary_path() as path:
+            write_frame(as_text(df), path)
 
 
-class CountryCodes(Task):
+class cldrLocales(Task):
+    """Territory names of every CLDR locale, as a long table of
+    `(Code, Locale, Name, Variant)` rows"""
     __version__ = '0.1'
     DATA_ROOT = 'build/'
 
-    pattern = 'country-codes-{salt}'
+    locales = Parameter(default='')
+    processes = IntParameter(default=0, significant=False)
+    salt = sha256sum()
+
+    pattern = '{task.__class__.__name__}-{salt}'
     output = SaltedOutput(file_pattern=pattern, ext='.csv',
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
     requires = Requires()
+    source = Requirement(CLDRLocalesSource, locales=locales)
+
+    @cutoff_early
+    @locked
+    def run(self):
+        with self.requires().get('source').output().open('r') as f:
+            manifest = json.load(f)
+        paths = {locale: entry['path'] for locale, entry in manifest.items()}
+
+        with self.output().open('w') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(COLUMNS)
+            writer.writerows(iter_rows(paths, processes=self.processes or None))
+
+
+# sources joined to the UN codes (which all other sources are joined
+# to) through other sources, see :meth:`CountryCodes.run`
+JOINED_THROUGH = {
+    'geonames': ['exio-wiod-eora'],
+    'usa-census': ['geonames'],
+    'ukgov': ['usa-census'],
+    'cldr': ['geonames'],
+    # names are matched with regexes of exio-wiod-eora
+    'iso4217': ['exio-wiod-eora'],
+    'marc': ['exio-wiod-eora'],
+    'edgar': ['exio-wiod-eora'],
+    'itu-glad': ['exio-wiod-eora'],
+}
+
+# sources of requirements of :class:`CountryCodes`
+REQUIREMENT_SOURCES = {
+    'src_UNCodes': 'M49',
+    'src_iso4217': 'iso4217',
+    'src_marc': 'marc',
+    'src_ukgov': 'ukgov',
+    'src_cldr': 'cldr',
+    'src_edgar': 'edgar',
+    'src_geonames': 'geonames',
+    'src_usacensus': 'usa-census',
+    'src_exio': 'exio-wiod-eora',
+    'src_fao': 'fao',
+    'src_fifa': 'fifa-ioc',
+    'src_itu': 'itu-glad',
+}
+
+
+class CountryCodes(Task):
+    """The assembled table, or a projection of its `columns` (see
+    :mod:`make_country_codes.projection`), joining only the sources the
+    projection needs"""
+    __version__ = '0.2'
+    DATA_ROOT = 'build/'
+
+    pattern = '{task.table_name}-{salt}'
+    output = SaltedOutput(file_pattern=pattern, ext='.csv',
+                          base_dir=DATA_ROOT,
+                          target_class=LocalTarget)
+
+    # comma separated patterns of columns or schemes, all columns if empty
+    columns = Parameter(default='')
+
+    @property
+    def table_name(self):
+        """Start of the filename, projections are named apart so that they
+        are never loaded as the whole table (see :func:`make_country_codes.table.latest_paths`)"""
+        return 'projection' if self.columns else 'country-codes'
+
     src_UNCodes = Requirement(UNCodes)
     src_iso4217 = Requirement(iso4217)
     src_marc = Requirement(marc)
@@ -279,132 +458,153 @@ class CountryCodes(Task):
     src_fifa = Requirement(SaltedSTSSource, slug='fifa-ioc', ext='.csv')
     src_itu = Requirement(SaltedSTSSource, slug='itu-glad', ext='.csv')
 
+    # DataFrame backend of joins, see :mod:`make_country_codes.backends`.
+    # backends produce identical output, so the salt does not depend on it
+    backend = Parameter(default='pandas', significant=False)
+
+    def sources(self):
+        """Returns the sources joined, the UN codes and those needed by `columns`
+
+        :rtype: set
+        """
+        if not self.columns:
+            return set(REQUIREMENT_SOURCES.values())
+        return projection.sources(projection.parse(self.columns), JOINED_THROUGH) | {'M49'}
+
+    def requires(self):
+        sources = self.sources()
+        return {key: task for key, task in Requires()(self).items()
+                if REQUIREMENT_SOURCES[key] in sources}
 
+    @cutoff_early
+    @locked
     def run(self):
+        backend = get_backend(self.backend)
+        sources = self.sources()
+
         # load pre-cleaned datasets (e.g., sources with their own named tasks)
-        UNCodes = pd.read_csv(self.requires().get('src_UNCodes').output().path,
-                              keep_default_na=False, na_values=['_'])
+        UNCodes = backend.read_frame(self.requires().get('src_UNCodes').output().path)
         if DEV_MODE:
-            UNCodes.drop('_merge', inplace=True, axis=1)
-        iso4217 = pd.read_csv(self.requires().get('src_iso4217').output().path,
-                              keep_default_na=False, na_values=['_'])
-        marc = pd.read_csv(self.requires().get('src_marc').output().path,
-                           keep_default_na=False, na_values=['_'])
-        ukgov = pd.read_csv(self.requires().get('src_ukgov').output().path,
-                            keep_default_na=False, na_values=['_'])
-        cldr = pd.read_csv(self.requires().get('src_cldr').output().path,
+            UNCodes = backend.drop(UNCodes, ['_merge'])
+        combined = UNCodes
+
+        # load and clean tabular sources, and join them on ISO 3166 alpha 3 codes
+        if 'exio-wiod-eora' in sources:
+            exio = read_raw_csv('exio-wiod-eora', self.requires().get('src_exio').output(),
+                                keep_default_na=False, na_values=['_'], sep='\t')
+            exio['ISOnumeric'] = pad_code(exio['ISOnumeric'])
+            exio['UNcode'] = pad_code(exio['UNcode'])
+            exio = exio.add_suffix(' (exio-wiod-eora)')
+            combined = backend.join(combined, backend.from_pandas(exio),
+                                    left_on='ISO-alpha3 Code (M49)',
+                                    right_on='ISO3 (exio-wiod-eora)')
+
+        if 'fao' in sources:
+            fao = read_csv('fao', self.requires().get('src_fao').output().path,
                            keep_default_na=False, na_values=['_'])
-        edgar = pd.read_csv(self.requires().get('src_edgar').output().path,
+            fao['Short name'] = remove(fao['Short name'], ESCAPED_NEWLINE)
+            fao = fao.add_suffix(' (fao)')
+            combined = backend.join(combined, backend.from_pandas(fao),
+                                    left_on='ISO-alpha3 Code (M49)',
+                                    right_on='ISO3 (fao)')
+
+        if 'fifa-ioc' in sources:
+            fifa = read_csv('fifa-ioc', self.requires().get('src_fifa').output().path,
                             keep_default_na=False, na_values=['_'])
-        edgar.columns = ['Edgar Code (edgar)', 'Country Name (edgar)']
-
-        # load and clean tabular sources
-        geonames = pd.read_csv(self.requires().get('src_geonames').output().path,
-                               keep_default_na=False, na_values=['_'],
-                               converters={'ISO-Numeric': convert_numeric_code_with_pad},
-                               header=50, sep='\t')
-        geonames = geonames.astype(dtype={'ISO-Numeric': 'object'})
-        geonames = geonames.rename(lambda x: x.replace('#', ''), axis=1)
-        geonames = geonames.add_suffix(' (geonames)')
-
-        # TODO this source has some errors...
-        # ISO code column has incorrect codes for Kosovo, DRC, and Myanmar
-        usacensus = pd.read_csv(self.requires().get('src_usacensus').output().path,
-                                converters={' ISO Code': lambda x: x.replace(' ', '')},
-                                header=3, skiprows=[4, 246, 247, 248, 249],
-                                sep='|')
-        usacensus = usacensus.rename(lambda x: x.strip(), axis=1)
-        usacensus = usacensus.add_suffix(' (usa-census)')
-
-        exio = pd.read_csv(self.requires().get('src_exio').output().path,
-                           keep_default_na=False, na_values=['_'], sep='\t',
-                           converters={'ISOnumeric': convert_numeric_code_with_pad,
-                                       'UNcode': convert_numeric_code_with_pad})
-        exio = exio.astype(dtype={'ISOnumeric': 'object',
-                                  'UNcode': 'object'})
-        exio = exio.add_suffix(' (exio-wiod-eora)')
-
-        fao = pd.read_csv(self.requires().get('src_fao').output().path,
-                          keep_default_na=False, na_values=['_'],
-                          converters={'Short name': lambda x: re.sub(r'\\n', '', x)})
-        fao = fao.add_suffix(' (fao)')
-
-        fifa = pd.read_csv(self.requires().get('src_fifa').output().path,
-                           keep_default_na=False, na_values=['_'],
-                           converters={'ISO': lambda x: re.sub(r'\\n|\[\d+\]', '', x),
-                                       'Country': lambda x: re.sub(r'\[\d+\]', '', x),
-                           })
-        fifa.drop('Flag', inplace=True, axis=1)
-        fifa = fifa.add_suffix(' (fifa-ioc)')
-
-        itu = pd.read_csv(self.requires().get('src_itu').output().path,
-                           keep_default_na=False, na_values=['_'])
-        itu = itu.add_suffix(' (itu-glad)')
-
-        # join on ISO 3166 alpha 3 codes
-        combined = pd.merge(UNCodes, exio, how='outer',
-                            left_on='ISO-alpha3 Code (M49)',
-                            right_on='ISO3 (exio-wiod-eora)')
-
-        combined = pd.merge(combined, fao, how='outer',
-                            left_on='ISO-alpha3 Code (M49)',
-                            right_on='ISO3 (fao)')
-
-        combined = pd.merge(combined, fifa, how='outer',
-                            left_on='ISO-alpha3 Code (M49)',
-                            right_on='ISO (fifa-ioc)')
+            fifa['ISO'] = remove(fifa['ISO'], f'{ESCAPED_NEWLINE}|{FOOTNOTE}')
+            fifa['Country'] = remove(fifa['Country'], FOOTNOTE)
+            fifa.drop('Flag', inplace=True, axis=1)
+            fifa = fifa.add_suffix(' (fifa-ioc)')
+            combined = backend.join(combined, backend.from_pandas(fifa),
+                                    left_on='ISO-alpha3 Code (M49)',
+                                    right_on='ISO (fifa-ioc)')
 
         # join on ISO 3166 alpha 2 codes
-        combined  = pd.merge(combined, geonames, how='outer',
-                              left_on='ISO2 (exio-wiod-eora)',
-                              right_on='ISO (geonames)')
-        combined = pd.merge(combined, usacensus, how='outer',
-                           left_on='ISO (geonames)',
-                           right_on='ISO Code (usa-census)')
-
-        combined = pd.merge(combined, ukgov, how='outer',
-                           left_on='ISO Code (usa-census)',
-                           right_on='country (ukgov)')
-
-        combined = pd.merge(combined, cldr, how='outer',
-                           left_on='ISO (geonames)',
-                           right_on='Locale Code (cldr)')
-
-        def match_on_names(df, name_column):
-            def correct(territory):
-                matches = []
-                for t in regex_tuples:
-                    pat = re.compile(t[1], flags=re.I)
-                    if pat.findall(territory):
-                        matches.append(t[0])
-                if any(matches):
-                    return pd.Series({'ISO3': matches[0], name_column: territory})
-                return pd.Series({'ISO3': '', name_column: territory})
-            return pd.merge(df, df.get(name_column).apply(correct))
-
-        # exio-wiod-eora source includes handy regexes for matching country names
-        regex_tuples = combined[['ISO3 (exio-wiod-eora)',
-                                 'regex (exio-wiod-eora)']].dropna().apply(tuple, axis=1).to_list()
-
-        marc = match_on_names(marc, 'Country Name (marc)')
-        iso4217 = match_on_names(iso4217, 'Country Name (iso4217)')
-        edgar = match_on_names(edgar, 'Country Name (edgar)')
-        # TODO errors when matching, so leaving out for now
-        itu = match_on_names(itu, 'Designation (itu-glad)')
-
-        matched = pd.merge(iso4217, marc, how='outer',
-                           left_on='ISO3',
-                           right_on='ISO3')
-        matched = pd.merge(matched, edgar, how='outer',
-                           left_on='ISO3',
-                           right_on='ISO3')
-        combined = pd.merge(combined, matched, how='outer',
-                            left_on='ISO3 (exio-wiod-eora)',
-                            right_on='ISO3')
-        combined.drop('ISO3', inplace=True, axis=1)
+        if 'geonames' in sources:
+            geonames = read_raw_csv('geonames', self.requires().get('src_geonames').output(),
+                                    keep_default_na=False, na_values=['_'], header=50, sep='\t')
+            geonames['ISO-Numeric'] = pad_code(geonames['ISO-Numeric'])
+            geonames = geonames.rename(lambda x: x.replace('#', ''), axis=1)
+            geonames = geonames.add_suffix(' (geonames)')
+            combined = backend.join(combined, backend.from_pandas(geonames),
+                                    left_on='ISO2 (exio-wiod-eora)',
+                                    right_on='ISO (geonames)')
+
+        if 'usa-census' in sources:
+            # TODO this source has some errors...
+            # ISO code column has incorrect codes for Kosovo, DRC, and Myanmar
+            usacensus = read_raw_csv('usa-census', self.requires().get('src_usacensus').output(),
+                                     header=3, skiprows=[4, 246, 247, 248, 249],
+                                     sep='|')
+            usacensus[' ISO Code'] = usacensus[' ISO Code'].fillna('').str.replace(' ', '', regex=False)
+            usacensus = usacensus.rename(lambda x: x.strip(), axis=1)
+            usacensus = usacensus.add_suffix(' (usa-census)')
+            combined = backend.join(combined, backend.from_pandas(usacensus),
+                                    left_on='ISO (geonames)',
+                                    right_on='ISO Code (usa-census)')
+
+        if 'ukgov' in sources:
+            ukgov = backend.read_frame(self.requires().get('src_ukgov').output().path)
+            combined = backend.join(combined, ukgov,
+                                    left_on='ISO Code (usa-census)',
+                                    right_on='country (ukgov)')
+
+        if 'cldr' in sources:
+            cldr = backend.read_frame(self.requires().get('src_cldr').output().path)
+            combined = backend.join(combined, cldr,
+                                    left_on='ISO (geonames)',
+                                    right_on='Locale Code (cldr)')
+
+        # sources without codes are matched on names, with pandas
+        matched = []
+        if sources & {'iso4217', 'marc', 'edgar', 'itu-glad'}:
+            # exio-wiod-eora source includes handy regexes for matching country names
+            regex_tuples = backend.to_pandas(combined, ['ISO3 (exio-wiod-eora)',
+                                                        'regex (exio-wiod-eora)']
+                                             ).dropna().apply(tuple, axis=1).to_list()
+            # names matched by previous builds with the same regexes are not scanned again
+            matcher = NameMatcher(regex_tuples, directory=self.DATA_ROOT)
+
+        if 'iso4217' in sources:
+            iso4217 = read_frame(self.requires().get('src_iso4217').output().path)
+            matched.append(match_on_names(iso4217, 'Country Name (iso4217)', matcher))
+
+        if 'marc' in sources:
+            marc = read_frame(self.requires().get('src_marc').output().path)
+            matched.append(match_on_names(marc, 'Country Name (marc)', matcher))
+
+        if 'edgar' in sources:
+            edgar = read_csv('edgar', self.requires().get('src_edgar').output().path,
+                             keep_default_na=False, na_values=['_'])
+            edgar.columns = ['Edgar Code (edgar)', 'Country Name (edgar)']
+            matched.append(match_on_names(edgar, 'Country Name (edgar)', matcher))
+
+        if 'itu-glad' in sources:
+            itu = read_csv('itu-glad', self.requires().get('src_itu').output().path,
+                           keep_default_na=False, na_values=['_'])
+            itu = itu.add_suffix(' (itu-glad)')
+            matched.append(match_on_names(itu, 'Designation (itu-glad)', matcher))
+
+        if matched:
+            matcher.save()
+            merged = merge_matched(matched)
+            unmatched = merged['ISO3'] == ''
+            combined = backend.join(combined, backend.from_pandas(merged[~unmatched]),
+                                    left_on='ISO3 (exio-wiod-eora)',
+                                    right_on='ISO3')
+            combined = backend.drop(combined, ['ISO3'])
+            # names matching no country are kept, in rows of their own
+            if unmatched.any():
+                combined = backend.append(combined, backend.from_pandas(
+                    merged[unmatched].drop('ISO3', axis=1)))
+
+        if self.columns:
+            columns = backend.columns(combined)
+            selected = projection.select(columns, projection.parse(self.columns))
+            combined = backend.drop(combined, [c for c in columns if c not in selected])
 
         with self.output().open('w') as f:
-            combined.to_csv(f, index=False, float_format='%.0f')
+            backend.write_csv(combined, f)
 
 
 class Datapackage(Task):
@@ -420,7 +620,6 @@ class Datapackage(Task):
     source = Requirement(CountryCodes)
 
     def run(self):
-        package = Package()
         metadata = {"name": "country-codes",
                     "title": "Comprehensive country codes: ISO 3166, ITU, ISO 4217 currency codes and many more",
                     "licenses": [{"name": "ODC-PDDL-1.0",
@@ -463,7 +662,11 @@ class Datapackage(Task):
                         }
                     ]
                    }
-        metadata.update(package.infer(self.requires().get('source').output().path))
+        # schema is declared for columns of known sources, so only
+        # columns from unknown sources are inferred (from a sample)
+        resource = describe_resource(self.requires().get('source').output().path)
+        metadata.update({'profile': 'tabular-data-package',
+                         'resources': [resource]})
         metadata.update({'sources': SOURCES})
         with self.output().open('w') as f:
             json.dump(metadata, f)
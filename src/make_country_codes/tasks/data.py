@@ -1,7 +1,8 @@
 import shelve
 import os
-import csv
-import urllib
+import json
+import hashlib
+from contextlib import contextmanager
 from functools import reduce
 
 from luigi import format
@@ -9,117 +10,159 @@ from luigi import Parameter
 from luigi import Task
 from luigi import WrapperTask
 from luigi.task_register import load_task
+from luigi.configuration import get_config
 from luigi.task import logger as luigi_logger
 
 import requests
-from lxml import html
 import pandas as pd
 
 from ..utils import bytes_pls
-from ..utils import clean
+from ..utils import fetch
 from ..utils import sha256sum
 from ..utils import TargetOutput
 from ..utils import Requires
 from ..utils import Requirement
+from ..utils import ZstdFormat
+from ..utils import ZSTD_EXT
+from ..utils import CHUNK_SIZE
+from ..utils import REQUEST_HEADERS
 from ..utils import SuffixPreservingLocalTarget as LocalTarget
+from ..cldr import available_locales
+from ..cldr import fetch_locales
+from ..cldr import AVAILABLE_LOCALES_URL
+from ..locks import locked
+from ..normalize import flag
+from ..sources import host_limits
+from ..sources import sources
+from ..sources import wait_for_turn
+from ..sources import CUSTOM
+from ..sources import FILE
+from ..sources import REGISTER
+from ..sources import REGISTRY
+from ..sources import THROTTLE_DIR
+from ..sources import TABLE
+from ..registers import iter_records
+from ..registers import to_jsonl
+from ..scrape import extract_tables
+from ..scrape import TableSpec
 
 USE_SHELVE = False
 DEV_MODE = False
-
-REMOTE_FILE_SOURCES = {
-    'unterm': 'https://protocol.un.org/dgacm/pls/site.nsf/files/Country%20Names%20UNTERM2/$FILE/UNTERM%20EFSRCA.xlsx',
-    'iso4217': 'https://www.currency-iso.org/dam/downloads/lists/list_one.xml',
-    'marc': 'http://www.loc.gov/standards/codelists/countries.xml',
-    'cldr': 'https://raw.githubusercontent.com/unicode-cldr/cldr-localenames-full/master/main/en/territories.json',
-    'geonames': 'http://download.geonames.org/export/dump/countryInfo.txt',
-    'usa-census': 'https://www.census.gov/foreign-trade/schedules/c/country2.txt',
-    'exio-wiod-eora': 'https://raw.githubusercontent.com/konstantinstadler/country_converter/master/country_converter/country_data.tsv',
-    'ukgov': 'https://country.register.gov.uk/records.json'
+# store raw upstream artifacts zstandard-compressed (requires `zstandard`),
+# unless set otherwise by `compress_raw` in the `[make-country-codes]`
+# section of luigi's configuration, see :func:`compress_raw`
+COMPRESS_RAW = False
+
+# urls of registered sources by kind, see :mod:`make_country_codes.sources`
+REMOTE_FILE_SOURCES = {s.name: s.url for s in sources(FILE)}
+CUSTOM_SCRAPE_SOURCES = {s.name: s.url for s in sources(CUSTOM)}
+REGISTER_SOURCES = {s.name: s.url for s in sources(REGISTER)}
+SIMPLE_TABLE_SCRAPE_SOURCES = {s.name: s.url for s in sources(TABLE)}
+
+# tables scraped from each page of `CUSTOM_SCRAPE_SOURCES` and
+# `SIMPLE_TABLE_SCRAPE_SOURCES`, see :mod:`make_country_codes.scrape`
+M49_FLAGS = {column: flag for column in [
+    'Least Developed Countries (LDC)',
+    'Land Locked Developing Countries (LLDC)',
+    'Small Island Developing States (SIDS)']}
+M49_TABLES = {'en': 'downloadTableEN', 'cn': 'downloadTableZH',
+              'ru': 'downloadTableRU', 'fr': 'downloadTableFR',
+              'es': 'downloadTableES', 'ar': 'downloadTableAR'}
+
+SCRAPE_SPECS = {
+    # codes follow a row labelled `Other Countries`, after US states
+    'Edgar': [TableSpec('Edgar', index=3, header=None,
+                        start_marker='Other Countries', width=2)],
+    'M49': [TableSpec(lang, selector=f'//table[@id="{table_id}"]', cleaners=M49_FLAGS)
+            for lang, table_id in M49_TABLES.items()],
+    'itu-glad': [TableSpec('itu-glad')],
+    'fao': [TableSpec('fao')],
+    'fifa-ioc': [TableSpec('fifa-ioc')],
 }
 
-CUSTOM_SCRAPE_SOURCES = {
-    'Edgar': 'https://www.sec.gov/edgar/searchedgar/edgarstatecodes.htm',
-    'M49': 'https://unstats.un.org/unsd/methodology/m49/overview/',
-}
+# sources of the table, as listed in its datapackage
+SOURCES = [s.metadata() for s in sources(history=False)]
+
+
+def configure_host_resources():
+    """Declares a luigi resource per host, limiting concurrent fetches
+    from each host to the strictest limit of its sources
+
+    Capacities already set in the `[resources]` section of luigi's
+    configuration are kept.
+    """
+    config = get_config()
+    if not config.has_section('resources'):
+        config.add_section('resources')
+    for host, (concurrency, _) in host_limits().items():
+        name = f'host:{host}'
+        if not config.has_option('resources', name):
+            config.set('resources', name, str(concurrency))
+
+
+def compress_raw():
+    """Returns whether raw upstream artifacts are stored compressed,
+    checked whenever a target is built rather than on import"""
+    return get_config().getboolean('make-country-codes', 'compress_raw', COMPRESS_RAW)
+
+
+@contextmanager
+def raw_compression(enabled):
+    """Stores raw upstream artifacts compressed or not within the
+    context, whatever is configured (see :func:`compress_raw`)
+
+    :param bool enabled: whether raw artifacts are compressed
+    """
+    config = get_config()
+    if not config.has_section('make-country-codes'):
+        config.add_section('make-country-codes')
+    previous = config.get('make-country-codes', 'compress_raw', None)
+    config.set('make-country-codes', 'compress_raw', 'true' if enabled else 'false')
+    try:
+        yield
+    finally:
+        if previous is None:
+            config.remove_option('make-country-codes', 'compress_raw')
+        else:
+            config.set('make-country-codes', 'compress_raw', previous)
 
 
-SIMPLE_TABLE_SCRAPE_SOURCES = {
-    'itu-glad': 'https://www.itu.int/gladapp/GeographicalArea/List',
-    'fao': 'http://www.fao.org/countryprofiles/iso3list/en/',
-    'fifa-ioc': 'https://simple.wikipedia.org/wiki/Comparison_of_IOC,_FIFA,_and_ISO_3166_country_codes',
-}
+class RawOutput(TargetOutput):
+    """Descriptor of the output of a raw upstream artifact, with a `.zst`
+    suffix and zstandard-compressed when :func:`compress_raw`"""
+    def __init__(self, file_pattern, base_dir='build/', target_class=LocalTarget, cached=False):
+        super().__init__(file_pattern=file_pattern, ext='', base_dir=base_dir,
+                         target_class=target_class, cached=cached)
+
+    def __call__(self, task):
+        target_path = self.base_dir + self.file_pattern.format(task=task)
+        if compress_raw():
+            return self.target(target_path + ZSTD_EXT, format=ZstdFormat())
+        return self.target(target_path, format=format.Nop)
+
+
+class PoliteFetch:
+    """Mixin for tasks fetching the registered source named by `slug`
+
+    Tasks hold their host's resource while running and are
+    prioritized by the expected size of their source.
+    """
+    @property
+    def priority(self):
+        return REGISTRY[self.slug].priority
+
+    @property
+    def resources(self):
+        return {REGISTRY[self.slug].resource: 1}
 
-SOURCES = [
-    {
-        'name': 'unterm',
-        'title': 'United Nations Protocol and Liason Service',
-        'path': 'https://protocol.un.org/dgacm/pls/site.nsf/files/Country%20Names%20UNTERM2/$FILE/UNTERM%20EFSRCA.xlsx',
-    },
-    {
-        'name': 'iso4217',
-        'title': 'Swiss Association for Standardization',
-        'path': 'https://www.currency-iso.org/dam/downloads/lists/list_one.xml',
-    },
-    {
-        'name': 'marc',
-        'title': 'USA Library of Congress',
-        'path': 'http://www.loc.gov/standards/codelists/countries.xml',
-    },
-    {
-        'name': 'cldr',
-        'title': 'Unicode Common Locale Data Repository',
-        'path': 'https://raw.githubusercontent.com/unicode-cldr/cldr-localenames-full/master/main/en/territories.json',
-    },
-    {
-        'name': 'geonames',
-        'title': 'GeoNames',
-        'path': 'http://download.geonames.org/export/dump/countryInfo.txt',
-    },
-    {
-        'name': 'usa-census',
-        'title': 'USA Census Bureau',
-        'path': 'https://www.census.gov/foreign-trade/schedules/c/country2.txt',
-    },
-    {
-        'name': 'exio-wiod-eora',
-        'title': 'Secondary source providing EXIOBASE, WIOD, Eora, and other country codes',
-        'path': 'https://raw.githubusercontent.com/konstantinstadler/country_converter/master/country_converter/country_data.tsv',
-    },
-    {
-        'name': 'ukgov',
-        'title': 'Government of the United Kingdom',
-        'path': 'https://country.register.gov.uk/records.json'
-    },
-    {
-        'name': 'Edgar',
-        'title': 'USA Security and Exchange Commission',
-        'path': 'https://www.sec.gov/edgar/searchedgar/edgarstatecodes.htm',
-    },
-    {
-        'name': 'M49',
-        'title': 'United Nations Statistics Division',
-        'path': 'https://unstats.un.org/unsd/methodology/m49/overview/',
-    },
-    {
-        'name': 'itu-glad',
-        'title': 'International Telecommunications Union',
-        'path': 'https://www.itu.int/gladapp/GeographicalArea/List',
-    },
-    {
-        'name': 'fao',
-        'title': 'Food and Agriculture Organization',
-        'path': 'http://www.fao.org/countryprofiles/iso3list/en/',
-    },
-    {
-        'name': 'fifa-ioc',
-        'title': 'Wikipedia (FIFA and IOC)',
-        'path': 'https://simple.wikipedia.org/wiki/Comparison_of_IOC,_FIFA,_and_ISO_3166_country_codes',
-    },
-]
-
-
-
-class FileSource(Task):
+    @property
+    def throttle_dir(self):
+        """Where times of requests to hosts are recorded, shared by
+        tasks building in the same DATA_ROOT"""
+        return os.path.join(self.DATA_ROOT, THROTTLE_DIR)
+
+
+class FileSource(PoliteFetch, Task):
     __version__ = '0.1'
     DATA_ROOT = 'build/'
 
@@ -127,20 +170,20 @@ class FileSource(Task):
     ext = Parameter()
 
     pattern = '{task.__class__.__name__}-{task.slug}{task.ext}'
-    output = TargetOutput(file_pattern=pattern, ext='',
-                          base_dir=DATA_ROOT,
-                          target_class=LocalTarget,
-                          format=format.Nop)
+    output = RawOutput(file_pattern=pattern, base_dir=DATA_ROOT,
+                       target_class=LocalTarget)
 
+    @locked
     def run(self):
         url = REMOTE_FILE_SOURCES.get(self.slug)
 
-        with requests.get(url, stream=True) as r:
+        wait_for_turn(url, self.throttle_dir)
+        with requests.get(url, stream=True, headers=REQUEST_HEADERS) as r:
             r.raise_for_status()
             if r.encoding is None:
                 r.encoding = 'utf-8'
             with self.output().open('w') as f:
-                for chunk in r.iter_content(chunk_size=128):
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
                     f.write(bytes_pls(chunk))
 
 
@@ -156,18 +199,57 @@ class SaltedFileSource(Task):
     source = Requirement(FileSource, slug=slug, ext=ext)
 
     pattern = '{task.__class__.__name__}-{task.slug}-{task.salt}{task.ext}'
-    output = TargetOutput(file_pattern=pattern, ext='',
-                          base_dir=DATA_ROOT,
-                          target_class=LocalTarget,
-                          format=format.Nop)
+    output = RawOutput(file_pattern=pattern, base_dir=DATA_ROOT,
+                       target_class=LocalTarget, cached=True)
 
+    @locked
     def run(self):
         source = self.requires().get('source').output()
         target = self.output().path
         source.copy(target)
 
 
-class EdgarSource(Task):
+class RegisterSource(PoliteFetch, Task):
+    """Every record of a GOV.UK register, as JSON lines, streamed
+    page by page, see :mod:`make_country_codes.registers`"""
+    __version__ = '0.1'
+    DATA_ROOT = 'build/'
+
+    slug = Parameter()
+    ext = Parameter(default='.jsonl')
+
+    pattern = '{task.__class__.__name__}-{task.slug}{task.ext}'
+    output = RawOutput(file_pattern=pattern, base_dir=DATA_ROOT,
+                       target_class=LocalTarget)
+
+    @locked
+    def run(self):
+        with self.output().open('w') as f:
+            for record in iter_records(REGISTER_SOURCES.get(self.slug), self.throttle_dir):
+                f.write(to_jsonl(record))
+
+
+class SaltedRegisterSource(Task):
+    __version__ = '0.1'
+    DATA_ROOT = 'build/'
+
+    slug = Parameter()
+    ext = Parameter(default='.jsonl')
+    salt = sha256sum()
+
+    requires = Requires()
+    source = Requirement(RegisterSource, slug=slug, ext=ext)
+
+    pattern = '{task.__class__.__name__}-{task.slug}-{task.salt}{task.ext}'
+    output = RawOutput(file_pattern=pattern, base_dir=DATA_ROOT,
+                       target_class=LocalTarget, cached=True)
+
+    @locked
+    def run(self):
+        self.requires().get('source').output().copy(self.output().path)
+
+
+class EdgarSource(PoliteFetch, Task):
     __version__ = '0.1'
     DATA_ROOT = 'build/'
     slug = Parameter(default='Edgar')
@@ -178,38 +260,14 @@ class EdgarSource(Task):
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
+    @locked
     def run(self):
         url = CUSTOM_SCRAPE_SOURCES.get('Edgar')
 
-        content = urllib.request.urlopen(url).read()
-        doc = html.fromstring(content)
-        rows = doc.xpath('//table')[3].getchildren()
-
-        seen_other_countries = False
-        data = []
-
-        for row in rows:
-            if seen_other_countries is not True:
-                if clean(row.text_content()) != 'Other Countries':
-                    continue
-                else:
-                    seen_other_countries = True
-                    continue
-
-            cells = row.getchildren()
-            if len(cells) != 2:
-                luigi_logger.debug('ERROR IN CELL COUNT')
-                for cell in cells:
-                    luigi_logger.debug(cell)
-                    luigi_logger.debug(cell.text_content())
-                continue
-            code = clean(cells[0].text_content())
-            name = clean(cells[1].text_content())
-            data.append((code, name))
+        tables = extract_tables(fetch(url, self.throttle_dir), SCRAPE_SPECS['Edgar'])
 
         with self.output().open('w') as f:
-            writer = csv.writer(f)
-            writer.writerows(data)
+            f.write(tables['Edgar'].to_csv(index=False, header=False))
 
 
 class SaltedEdgarSource(Task):
@@ -226,13 +284,15 @@ class SaltedEdgarSource(Task):
     pattern = '{task.__class__.__name__}-{task.slug}-{task.salt}{task.ext}'
     output = TargetOutput(file_pattern=pattern, ext='',
                           base_dir=DATA_ROOT,
-                          target_class=LocalTarget)
+                          target_class=LocalTarget,
+                          cached=True)
 
+    @locked
     def run(self):
         self.requires().get('source').output().copy(self.output().path)
 
 
-class M49Source(Task):
+class M49Source(PoliteFetch, Task):
     __version__ = '0.1'
     DATA_ROOT = 'build/'
     slug = Parameter(default='M49')
@@ -243,6 +303,7 @@ class M49Source(Task):
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
+    @locked
     def run(self):
         url = CUSTOM_SCRAPE_SOURCES.get('M49')
 
@@ -252,47 +313,28 @@ class M49Source(Task):
                 shelf = shelve.open('tmpdb')
                 content = shelf['M49']
             except KeyError:
-                content = urllib.request.urlopen(url).read()
+                content = fetch(url, self.throttle_dir)
                 shelf['M49'] = content
             finally:
                 shelf.close()
         else:
-            content = urllib.request.urlopen(url).read()
-
-        tables = {'en': 'downloadTableEN', 'cn': 'downloadTableZH',
-                  'ru': 'downloadTableRU', 'fr': 'downloadTableFR',
-                  'es': 'downloadTableES', 'ar': 'downloadTableAR'}
-
-        def read_table(table_language, table_id):
-            l = table_language
-            attrs = {'id': table_id}
-            converters = {
-                    'Region Code': lambda x: str(x),
-                    'Intermediate Region Code': lambda x: str(x),
-                    'Least Developed Countries (LDC)': lambda x: bool(x) if bool(x) else '',
-                    'Land Locked Developing Countries (LLDC)': lambda x: bool(x) if bool(x) else '',
-                    'Small Island Developing States (SIDS)': lambda x: bool(x) if bool(x) else '',
-                    'Developed /  Developing Countries': lambda x: x.replace('\r\n', ''),
-                    }
-            df = pd.read_html(content, encoding='utf-8', attrs=attrs,
-                              header=0, converters=converters)
-            return df[0]
+            content = fetch(url, self.throttle_dir)
 
+        # parse the page once for all 6 html tables,
+        # arranged in list of 2-item tuples
+        # like [('language', dataframe),...]
         if USE_SHELVE:
             luigi_logger.debug('USING SHELVE')
             try:
                 shelf = shelve.open('tmpdb')
                 frames_tuples = shelf['m49-frames_tuples']
             except KeyError:
-                # read the 6 html tables into dataframes,
-                # arrange dataframes in list of 2-item tuples
-                # like [('language', dataframe),...]
-                frames_tuples = [(lang, read_table(lang, table)) for lang, table in tables.items()]
+                frames_tuples = list(extract_tables(content, SCRAPE_SPECS['M49']).items())
                 shelf['m49-frames_tuples'] = frames_tuples
             finally:
                 shelf.close()
         else:
-            frames_tuples = [(lang, read_table(lang, table)) for lang, table in tables.items()]
+            frames_tuples = list(extract_tables(content, SCRAPE_SPECS['M49']).items())
 
         # values in these columns are the same in any language
         # (excluding `M49 Code` bc we need it to merge dataframes)
@@ -319,7 +361,7 @@ class M49Source(Task):
                         frames_tuples)
 
         with self.output().open('w') as f:
-            merged[1].to_csv(f, index=False)
+            f.write(merged[1].to_csv(index=False))
 
 
 class SaltedM49Source(Task):
@@ -336,13 +378,15 @@ class SaltedM49Source(Task):
     pattern = '{task.__class__.__name__}-{task.slug}-{task.salt}{task.ext}'
     output = TargetOutput(file_pattern=pattern, ext='',
                           base_dir=DATA_ROOT,
-                          target_class=LocalTarget)
+                          target_class=LocalTarget,
+                          cached=True)
 
+    @locked
     def run(self):
         self.requires().get('source').output().copy(self.output().path)
 
 
-class SimpleTableScrapeSource(Task):
+class SimpleTableScrapeSource(PoliteFetch, Task):
     __version__ = '0.1'
     DATA_ROOT = 'build/'
     slug = Parameter()
@@ -353,6 +397,7 @@ class SimpleTableScrapeSource(Task):
                           base_dir=DATA_ROOT,
                           target_class=LocalTarget)
 
+    @locked
     def run(self):
         url = SIMPLE_TABLE_SCRAPE_SOURCES.get(self.slug)
         if USE_SHELVE:
@@ -361,16 +406,16 @@ class SimpleTableScrapeSource(Task):
                 shelf = shelve.open('tmpdb')
                 content = shelf[self.slug]
             except KeyError:
-                content = urllib.request.urlopen(url).read()
+                content = fetch(url, self.throttle_dir)
                 shelf[self.slug] = str(content)
             finally:
                 shelf.close()
         else:
-            content = urllib.request.urlopen(url).read()
+            content = fetch(url, self.throttle_dir)
 
-        df = pd.read_html(content, header=0)
+        tables = extract_tables(content, SCRAPE_SPECS.get(self.slug, [TableSpec(self.slug)]))
         with self.output().open('w') as f:
-            df[0].to_csv(f, index=False)
+            f.write(tables[self.slug].to_csv(index=False))
 
 
 class SaltedSTSSource(Task):
@@ -387,20 +432,77 @@ class SaltedSTSSource(Task):
     pattern = '{task.__class__.__name__}-{task.slug}-{task.salt}{task.ext}'
     output = TargetOutput(file_pattern=pattern, ext='',
                           base_dir=DATA_ROOT,
-                          target_class=LocalTarget)
+                          target_class=LocalTarget,
+                          cached=True)
 
+    @locked
     def run(self):
         self.requires().get('source').output().copy(self.output().path)
 
 
+class CLDRLocalesSource(PoliteFetch, Task):
+    """Territory names of every CLDR locale, or of `locales`, fetched
+    concurrently into a directory, with a manifest of their hashes"""
+    __version__ = '0.1'
+    DATA_ROOT = 'build/'
+    slug = Parameter(default='cldr')
+    # comma separated, defaults to every available locale
+    locales = Parameter(default='')
+
+    pattern = '{task.__class__.__name__}-{task.slug}-{task.selection}'
+    output = TargetOutput(file_pattern=pattern, ext='.json',
+                          base_dir=DATA_ROOT,
+                          target_class=LocalTarget)
+
+    @property
+    def selection(self):
+        if not self.locales:
+            return 'all'
+        return hashlib.sha256(self.locales.encode()).hexdigest()[:6]
+
+    @property
+    def concurrency(self):
+        """Requests in flight at once, the capacity of the host's resource
+        (see :func:`configure_host_resources`), which is held throughout"""
+        return get_config().getint('resources', REGISTRY[self.slug].resource, 1)
+
+    @property
+    def resources(self):
+        return {REGISTRY[self.slug].resource: self.concurrency}
+
+    @locked
+    def run(self):
+        source = REGISTRY[self.slug]
+        if self.locales:
+            locales = self.locales.split(',')
+        else:
+            locales = available_locales(fetch(AVAILABLE_LOCALES_URL, self.throttle_dir))
+
+        directory = os.path.splitext(self.output().path)[0]
+        manifest = fetch_locales(source.url, locales, directory, self.throttle_dir,
+                                 max_workers=self.concurrency)
+        with self.output().open('w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+
 class SaltedSources(WrapperTask):
+    """Every source of the table (sources only used by the history are
+    required by :class:`make_country_codes.tasks.export.History`)"""
 
     def requires(self):
         for slug, url in REMOTE_FILE_SOURCES.items():
+            if REGISTRY[slug].history_only:
+                continue
             _, ext = os.path.splitext(url)
             luigi_logger.debug(['SaltedFileSource', slug, ext])
             yield SaltedFileSource(slug=slug, ext=ext)
 
+        for slug, url in REGISTER_SOURCES.items():
+            if REGISTRY[slug].history_only:
+                continue
+            luigi_logger.debug(['SaltedRegisterSource', slug, '.jsonl'])
+            yield SaltedRegisterSource(slug=slug, ext='.jsonl')
+
         for slug, url in SIMPLE_TABLE_SCRAPE_SOURCES.items():
             luigi_logger.debug(['SaltedSTSSource', slug, '.csv'])
             yield SaltedSTSSource(slug=slug, ext='.csv')
@@ -0,0 +1,186 @@
+import os
+import csv
+import json
+
+from luigi import Parameter
+from luigi import Task
+from luigi.format import UTF8
+from lxml import etree
+
+from ..utils import SaltedOutput
+from ..utils import SuffixPreservingLocalTarget as LocalTarget
+from ..utils import Requires
+from ..utils import Requirement
+from ..utils import cutoff_early
+from ..utils import open_target
+from ..artifacts import salt_of
+from ..locks import locked
+from ..names import build_index
+from .. import database
+from ..shards import write_shards
+from ..registers import iter_jsonl
+from ..names import NameIndex as NameLookup
+from .. import history
+
+from .assemble import CountryCodes
+from .data import SaltedFileSource
+from .data import SaltedRegisterSource
+
+
+class NameIndex(Task):
+    __version__ = '0.1'
+    DATA_ROOT = 'build/'
+
+    pattern = 'name-index-{salt}'
+    output = SaltedOutput(file_pattern=pattern, ext='.json',
+                          base_dir=DATA_ROOT,
+                          target_class=LocalTarget,
+                          format=UTF8)
+
+    requires = Requires()
+    source = Requirement(CountryCodes)
+
+    @property
+    def salt(self):
+        # that of the table it indexes, so that they are loaded together,
+        # see :func:`make_country_codes.table.latest_paths`
+        return salt_of(self.requires().get('source').output().path)
+
+    @cutoff_early
+    @locked
+    def run(self):
+        # index every name variant, in every language, by its folded form
+        # so that names can be resolved with a single dict lookup.
+        # see :class:`make_country_codes.names.NameIndex`
+        with open(self.requires().get('source').output().path, 'r',
+                  newline='', encoding='utf-8') as f:
+            index = build_index(csv.DictReader(f))
+
+        with self.output().open('w') as f:
+            json.dump(index, f, ensure_ascii=False, sort_keys=True)
+
+
+class Database(Task):
+    """The assembled table as an SQLite database, or DuckDB with `engine`
+    `duckdb`, see :mod:`make_country_codes.database`"""
+    __version__ = '0.1'
+    DATA_ROOT = 'build/'
+
+    engine = Parameter(default='sqlite')
+
+    pattern = 'country-codes-{salt}.{task.engine}'
+    output = SaltedOutput(file_pattern=pattern, ext='',
+                          base_dir=DATA_ROOT,
+                          target_class=LocalTarget)
+
+    requires = Requires()
+    source = Requirement(CountryCodes)
+
+    @cutoff_early
+    @locked
+    def run(self):
+        write = {'sqlite': database.write_sqlite,
+                 'duckdb': database.write_duckdb}[self.engine]
+        with open(self.requires().get('source').output().path, 'r',
+                  newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+
+        # written whole, at a temporary path that is renamed once complete
+        with self.output().temporary_path() as path:
+            write(rows, path)
+
+
+class Shards(Task):
+    """Lookup maps and a shard per country, named by their hashes, and
+    a manifest of them, see :mod:`make_country_codes.shards`"""
+    __version__ = '0.1'
+    DATA_ROOT = 'build/'
+
+    pattern = 'shards-{salt}/manifest'
+    output = SaltedOutput(file_pattern=pattern, ext='.json',
+                          base_dir=DATA_ROOT,
+                          target_class=LocalTarget,
+                          format=UTF8)
+
+    requires = Requires()
+    source = Requirement(CountryCodes)
+
+    @cutoff_early
+    @locked
+    def run(self):
+        with open(self.requires().get('source').output().path, 'r',
+                  newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+
+        # shards first, so a manifest only ever lists shards that exist
+        manifest = write_shards(rows, os.path.dirname(self.output().path))
+        with self.output().open('w') as f:
+            json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+
+
+class History(Task):
+    """Appends the assembled table, and dated facts from its sources, to
+    the append-only store at `path`, see :mod:`make_country_codes.history`
+
+    The store lives outside of `build/` and accumulates every generation
+    of the table, each of which is ingested once.
+    """
+    __version__ = '0.1'
+
+    path = Parameter(default='history.sqlite')
+    # date the assembled table is valid from, today if empty
+    date = Parameter(default='')
+
+    requires = Requires()
+    source = Requirement(CountryCodes)
+    ukgov = Requirement(SaltedRegisterSource, slug='ukgov', ext='.jsonl')
+    territories = Requirement(SaltedRegisterSource, slug='ukgov-territory', ext='.jsonl')
+    currencies = Requirement(SaltedFileSource, slug='iso4217-historic', ext='.xml')
+
+    def output(self):
+        # the store, locked while appending to it (see :func:`make_country_codes.locks.locked`)
+        return LocalTarget(self.path)
+
+    def generations(self):
+        # generations are named by the (salted) filenames of inputs
+        return {name: os.path.basename(task.output().path)
+                for name, task in self.requires().items()}
+
+    def complete(self):
+        if not all(task.complete() for task in self.requires().values()):
+            return False
+        if not os.path.exists(self.path):
+            return False
+        with history.History(self.path) as store:
+            return all(store.has_generation(g) for g in self.generations().values())
+
+    @locked
+    def run(self):
+        with open(self.requires().get('source').output().path, 'r',
+                  newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        entities = {row[history.ENTITY]: row for row in rows if row[history.ENTITY]}
+        iso3_by_iso2 = {row['ISO2 (exio-wiod-eora)']: entity
+                        for entity, row in entities.items()}
+        names = NameLookup(build_index(rows))
+
+        # every item of the registers, not only current ones
+        items = {}
+        for register in ('ukgov', 'territories'):
+            with open_target(self.requires().get(register).output()) as f:
+                items[register] = [item for record in iter_jsonl(f) for item in record['item']]
+        with open_target(self.requires().get('currencies').output()) as f:
+            entries = [{c.tag: c.text for c in entry}
+                       for entry in etree.parse(f).iter('HstrcCcyNtry')]
+
+        generations = self.generations()
+        date = self.date or history.today()
+        with history.History(self.path) as store:
+            # seeds come first, so the table's changes are relative to them
+            store.append(history.ukgov_facts(items['ukgov'], iso3_by_iso2),
+                         generations['ukgov'], 'ukgov', date)
+            store.append(history.ukgov_facts(items['territories'], iso3_by_iso2),
+                         generations['territories'], 'ukgov-territory', date)
+            store.append(history.currency_facts(entries, names.resolve, entities),
+                         generations['currencies'], 'iso4217-historic', date)
+            store.ingest(rows, generations['source'], valid_from=date)
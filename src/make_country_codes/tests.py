@@ -1,6 +1,18 @@
 import os
+import json
+import shutil
+import socket
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from io import BytesIO
+import time
+from unittest import skipIf
+from unittest import SkipTest
 from unittest import TestCase
 from tempfile import TemporaryDirectory
+from unittest import mock
 
 from luigi import format
 from luigi import Parameter
@@ -8,16 +20,98 @@ from luigi import LocalTarget
 from luigi import Task
 from luigi import build
 from luigi.mock import MockTarget
+from luigi.configuration import get_config
+import pandas as pd
+from requests import HTTPError
 
+from . import cache
+from . import utils
 from .utils import bytes_pls
 from .utils import clean
 from .utils import convert_numeric_code
+from .utils import cached_by_stat
+from .utils import Requires
+from .utils import Requirement
+from .utils import cutoff_early
+from .utils import SaltedOutput
 from .utils import convert_numeric_code_with_pad
 from .utils import get_salt_for_source
 from .utils import TargetOutput
 from .utils import salted_SPLT
+from .utils import sha256sum
 from .utils import SuffixPreservingLocalTarget
 from .utils import BaseAtomicProviderLocalTarget
+from .utils import open_target
+from .utils import zstandard
+from .utils import ZstdFormat
+from .backends import PandasBackend
+from .backends import PolarsBackend
+from .backends import pl
+from .schema import infer_field_type
+from .schema import table_schema
+from .schema import read_csv
+from .schema import field_type
+from .schema import FIELD_TYPES
+from .normalize import collapse_whitespace
+from .normalize import numeric_code
+from .normalize import pad_code
+from .normalize import remove
+from .normalize import replace_aliases
+from .normalize import FOOTNOTE
+from .locks import FileLock
+from .locks import locked
+from .sources import declared_host
+from .sources import host_of
+from .sources import host_limits
+from .sources import register
+from .sources import wait_for_turn
+from .sources import Source
+from .sources import REGISTRY
+from .scrape import extract_tables
+from .scrape import TableSpec
+from .frames import read_frame
+from .frames import write_frame
+from .frames import write_frames
+from .frames import as_text
+from .frames import FRAME_EXT
+from .spreadsheet import read_xlsx
+from .cldr import fetch_locales
+from .cldr import fold_alternates
+from .cldr import iter_rows
+from .cldr import locale_url
+from .cldr import territory_names
+from .cldr import territory_rows
+from .registers import iter_jsonl
+from .registers import iter_members
+from .registers import iter_records
+from .registers import to_jsonl
+from .frames import get_frame_cache
+from .frames import keep_frames
+from .plan import format_plan
+from .plan import plan
+from .watch import rebuild
+from .watch import watch
+from .database import write_sqlite
+from .shards import write_shards
+from . import projection
+from .bench import bench
+from .matching import NameMatcher
+from .bench import format_report
+from .synthetic import countries
+from .tasks.assemble import CountryCodes
+from .tasks.data import FileSource
+from .tasks.assemble import JOINED_THROUGH
+from .tasks.assemble import match_on_names
+from .tasks.assemble import merge_matched
+from .history import currency_facts
+from .history import History
+from .names import build_index
+from .names import fold
+from .names import NameIndex
+from .table import CountryTable
+from .service import LookupService
+from .service import LRUCache
+from .enrich import enrich
 
 
 class UtilsTests(TestCase):
@@ -157,3 +251,1148 @@ class TargetTests(TestCase):
         root, ext = os.path.splitext(salty.path)
         path = root.split('-')
         assert salt != path[1]
+
+
+class EarlyCutoffTests(TestCase):
+
+    def test_cutoff_early(self):
+        """ ensure that tasks downstream of unchanged content are not rerun """
+        with TemporaryDirectory() as tmp:
+            upstream = {'text': 'asdf\n'}
+            runs = []
+
+            class CutoffRaw(Task):
+                __version__ = '0.1'
+
+                def output(self):
+                    return LocalTarget(os.path.join(tmp, 'raw.txt'))
+
+                def run(self):
+                    with self.output().open('w') as f:
+                        f.write(upstream['text'])
+
+            class CutoffClean(Task):
+                __version__ = '0.1'
+                output = SaltedOutput(base_dir=tmp + '/')
+
+                def requires(self):
+                    return {'source': CutoffRaw()}
+
+                @cutoff_early
+                def run(self):
+                    with self.input()['source'].open('r') as f, self.output().open('w') as o:
+                        o.write(f.read().strip())
+
+            class CutoffFinal(Task):
+                __version__ = '0.1'
+                output = SaltedOutput(base_dir=tmp + '/')
+
+                def requires(self):
+                    return {'source': CutoffClean()}
+
+                @cutoff_early
+                def run(self):
+                    runs.append(self.output().path)
+                    with self.output().open('w') as o:
+                        o.write('done')
+
+            utils.EARLY_CUTOFF = True
+            try:
+                assert build([CutoffFinal()], local_scheduler=True)
+                # a cosmetic change upstream is cleaned away
+                upstream['text'] = 'asdf  \r\n'
+                os.remove(os.path.join(tmp, 'raw.txt'))
+                assert build([CutoffFinal()], local_scheduler=True)
+            finally:
+                utils.EARLY_CUTOFF = False
+
+            files = os.listdir(tmp)
+            assert len([f for f in files if f.startswith('CutoffClean-')]) == 2
+            assert len([f for f in files if f.startswith('CutoffFinal-')]) == 1
+            assert len(runs) == 1
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """ in-memory stand-in for the parts of boto3's S3 client we use """
+    def __init__(self):
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error('404')
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def download_file(self, Bucket, Key, Filename):
+        with open(Filename, 'wb') as f:
+            f.write(self.objects[(Bucket, Key)])
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, 'rb') as f:
+            self.objects[(Bucket, Key)] = f.read()
+
+
+class CacheTests(TestCase):
+
+    def test_s3_cache(self):
+        """ ensure that artifacts are pushed once and pulled atomically """
+        client = FakeS3Client()
+        s3 = cache.S3Cache('bucket', '/builds/', client=client)
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'UNCodes-asdf12.csv')
+            with open(path, 'w') as f:
+                f.write('a,b\n')
+            assert s3.push(path, 'UNCodes-asdf12.csv')
+            assert not s3.push(path, 'UNCodes-asdf12.csv')
+            assert list(client.objects) == [('bucket', 'builds/UNCodes-asdf12.csv')]
+
+            pulled = os.path.join(tmp, 'pulled', 'UNCodes-asdf12.csv')
+            assert s3.pull('UNCodes-asdf12.csv', pulled)
+            assert not s3.pull('UNCodes-qwer34.csv', pulled + '2')
+            assert os.listdir(os.path.dirname(pulled)) == ['UNCodes-asdf12.csv']
+
+    def test_build_pulls_from_cache(self):
+        """ ensure that salted outputs built elsewhere are pulled rather than rebuilt """
+        with TemporaryDirectory() as tmp:
+            runs = []
+
+            class CachedTask(Task):
+                __version__ = '0.1'
+                output = SaltedOutput(base_dir=os.path.join(tmp, 'build') + '/')
+
+                def run(self):
+                    runs.append(self)
+                    with self.output().open('w') as f:
+                        f.write('asdf')
+
+            cache.configure(os.path.join(tmp, 'cache'))
+            try:
+                assert build([CachedTask()], local_scheduler=True)
+                path = CachedTask().output().path
+                assert os.listdir(os.path.join(tmp, 'cache')) == [os.path.basename(path)]
+
+                # another machine, with an empty build directory
+                os.remove(path)
+                assert build([CachedTask()], local_scheduler=True)
+            finally:
+                cache.configure(None)
+            assert len(runs) == 1
+            with open(path) as f:
+                assert f.read() == 'asdf'
+
+    def test_recorded_source_salts(self):
+        """ ensure that a machine which hasn't fetched a source pulls it
+            with the salt recorded by the machine that did """
+        with TemporaryDirectory() as tmp:
+            fetches = []
+            build_dir = os.path.join(tmp, 'build')
+
+            class CachedRaw(Task):
+                def output(self):
+                    return LocalTarget(os.path.join(build_dir, 'raw.txt'))
+
+                def run(self):
+                    fetches.append(self)
+                    with self.output().open('w') as f:
+                        f.write('asdf')
+
+            class CachedSalted(Task):
+                __version__ = '0.1'
+                slug = Parameter(default='raw')
+                ext = Parameter(default='.txt')
+                salt = sha256sum()
+                requires = Requires()
+                source = Requirement(CachedRaw)
+                output = SaltedOutput(base_dir=build_dir + '/', ext='.txt')
+
+                def run(self):
+                    self.requires().get('source').output().copy(self.output().path)
+
+            cache.configure(os.path.join(tmp, 'cache'))
+            try:
+                assert build([CachedSalted()], local_scheduler=True)
+                path = CachedSalted().output().path
+                assert 'CachedSalted-raw.txt.salt' in os.listdir(os.path.join(tmp, 'cache'))
+
+                # another machine, with an empty build directory
+                shutil.rmtree(build_dir)
+                utils._recorded_salts.clear()
+                assert CachedSalted().output().path == path
+                assert build([CachedSalted()], local_scheduler=True)
+            finally:
+                cache.configure(None)
+            assert len(fetches) == 1
+            assert not os.path.exists(os.path.join(build_dir, 'raw.txt'))
+            with open(path) as f:
+                assert f.read() == 'asdf'
+
+    def test_abstract_cache(self):
+        with self.assertRaises(TypeError):
+            cache.ArtifactCache()
+
+
+def territories_json(locale, territories):
+    return json.dumps({'main': {locale: {'identity': {'language': locale},
+                                         'localeDisplayNames': {'territories': territories}}}})
+
+
+class CLDRTests(TestCase):
+    territories = {'001': 'World', 'DZ': 'Algeria', 'GB': 'United Kingdom',
+                   'GB-alt-short': 'UK', 'NA': 'Namibia', 'CD-alt-variant': 'Congo (DRC)',
+                   'CD': 'Congo - Kinshasa'}
+
+    def test_rows(self):
+        """ ensure that names are flattened to rows of countries with variants """
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'en.json')
+            with open(path, 'w') as f:
+                f.write(territories_json('en', self.territories))
+            with open(path, 'rb') as f:
+                rows = list(territory_rows(territory_names(f), 'en'))
+        assert rows == [('DZ', 'en', 'Algeria', ''), ('GB', 'en', 'United Kingdom', ''),
+                        ('GB', 'en', 'UK', 'short'), ('NA', 'en', 'Namibia', ''),
+                        ('CD', 'en', 'Congo (DRC)', 'variant'),
+                        ('CD', 'en', 'Congo - Kinshasa', '')]
+        assert fold_alternates(rows) == {'DZ': 'Algeria', 'GB': 'United Kingdom; UK',
+                                         'NA': 'Namibia', 'CD': 'Congo - Kinshasa; Congo (DRC)'}
+
+    def test_locales(self):
+        """ ensure that locales are fetched, then parsed in a pool of processes """
+        url = ('https://raw.githubusercontent.com/unicode-cldr/cldr-localenames-full/'
+               'master/main/en/territories.json')
+        assert locale_url(url, 'pt-AO').endswith('/main/pt-AO/territories.json')
+        documents = {'fr': {'DZ': 'Algérie', '419': 'Amérique latine'},
+                     'de': {'DZ': 'Algerien', 'GB-alt-short': 'VK'}}
+
+        def fetch(url, throttle_dir):
+            locale = url.split('/')[-2]
+            if locale not in documents:
+                raise HTTPError(response=mock.Mock(status_code=404))
+            return territories_json(locale, documents[locale]).encode()
+
+        with TemporaryDirectory() as tmp, mock.patch('make_country_codes.cldr.fetch', fetch):
+            manifest = fetch_locales(url, ['fr', 'de', 'xx'], tmp, tmp, max_workers=2)
+            assert list(manifest) == ['de', 'fr']
+            paths = {locale: entry['path'] for locale, entry in manifest.items()}
+            expected = [('DZ', 'de', 'Algerien', ''), ('GB', 'de', 'VK', 'short'),
+                        ('DZ', 'fr', 'Algérie', '')]
+            assert list(iter_rows(paths, processes=2)) == expected
+            assert list(iter_rows(paths, processes=1)) == expected
+
+
+class RegisterHandler(BaseHTTPRequestHandler):
+    """ serves a register of three records in pages of two """
+    pages = {
+        '/records.json?page-size=2': ({'LY': {'key': 'LY', 'item': [{'country': 'LY', 'name': 'Libya'}]},
+                                       'SU': {'key': 'SU', 'item': [
+                                           {'country': 'SU', 'name': 'USSR', 'end-date': '1991-12-25'},
+                                           {'country': 'SU', 'name': 'Soviet Union'}]}},
+                                      '<?page-index=2&page-size=2>; rel="next"'),
+        '/records.json?page-index=2&page-size=2': ({'ZW': {'key': 'ZW', 'entry-number': 3,
+                                                           'item': [{'country': 'ZW'}]}}, None),
+    }
+
+    def do_GET(self):
+        body, link = self.pages[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if link:
+            self.send_header('Link', link)
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class RegisterTests(TestCase):
+
+    def test_members(self):
+        """ ensure that members of an object are built one at a time """
+        members = list(iter_members(BytesIO(b'{"LY": {"item": [{"name": "Libya"}]}, "NA": {"n": 1.5}}')))
+        assert members[0] == ('LY', {'item': [{'name': 'Libya'}]})
+        assert members[1][0] == 'NA'
+        assert json.loads(to_jsonl(members[1][1])) == {'n': 1.5}
+
+    def test_pages(self):
+        """ ensure that every record of every page is streamed, with all items """
+        server = HTTPServer(('127.0.0.1', 0), RegisterHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with TemporaryDirectory() as tmp:
+                url = f'http://127.0.0.1:{server.server_port}/records.json'
+                lines = b''.join(to_jsonl(record) for record in
+                                 iter_records(url, tmp, page_size=2))
+        finally:
+            server.shutdown()
+            thread.join()
+        records = list(iter_jsonl(BytesIO(lines)))
+        assert [record['key'] for record in records] == ['LY', 'SU', 'ZW']
+        assert [item['name'] for item in records[1]['item']] == ['USSR', 'Soviet Union']
+        assert records[2]['entry-number'] == 3
+
+
+class SpreadsheetTests(TestCase):
+
+    def test_read_xlsx(self):
+        """ ensure that streamed sheets match pandas.read_excel """
+        df = pd.DataFrame({'English Short': ['Algeria', None, 'Namibia', 'Zimbabwe'],
+                           'Code': [12, None, 516, 716],
+                           'Area': [2381741.5, None, 824292.0, 390757.0],
+                           'English Short ': ['DZ', None, 'NA', 'ZW']})
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'unterm.xlsx')
+            df.to_excel(path, index=False)
+            expected = pd.read_excel(path, keep_default_na=False, na_values=[''])
+            with open(path, 'rb') as f:
+                actual = read_xlsx(f)
+        assert list(actual['English Short ']) == ['DZ', None, 'NA', 'ZW']
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_frame_round_trip(self):
+        """ ensure that cached frames keep their values and types """
+        df = pd.DataFrame({'English Short': ['Algeria', None], 'Code': [12, 516]},
+                          index=[3, 7])
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'UntermSheet-asdf12' + FRAME_EXT)
+            write_frame(df, path)
+            pd.testing.assert_frame_equal(read_frame(path), df.reset_index(drop=True))
+
+    def test_write_frames(self):
+        """ ensure that frames written in batches are read back as one """
+        df = pd.DataFrame({'country': ['DZ', 'NA', 'ZW'], 'name': ['Algeria', '', 'Zimbabwe']})
+        for ext in {FRAME_EXT, '.pkl'}:
+            with TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'ukgov-asdf12' + ext)
+                write_frames((df[i:i + 2] for i in range(0, 3, 2)), path, ['name', 'country'])
+                pd.testing.assert_frame_equal(read_frame(path), df[['name', 'country']])
+                write_frames(iter([]), path, ['name', 'country'])
+                assert list(read_frame(path).columns) == ['name', 'country']
+
+    def test_as_text(self):
+        """ ensure that intermediate frames hold what their CSV would have """
+        df = pd.DataFrame({'M49': ['004', None, '516'], 'Code': [12, None, 516],
+                           'ISO2': ['AF', '_', 'NA'], 'Mixed': [1.5, 'x', None]})
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'UNCodes.csv')
+            df.to_csv(path, index=False, float_format='%.0f')
+            expected = PandasBackend().read_csv('UNCodes', path).fillna('')
+            path = os.path.join(tmp, 'UNCodes' + FRAME_EXT)
+            write_frame(as_text(df), path)
+            actual = PandasBackend().read_frame(path)
+        assert list(actual['Code']) == ['12', '', '516']
+        assert list(actual['ISO2']) == ['AF', '', 'NA']
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+class PlanTests(TestCase):
+
+    def test_stat_cache(self):
+        """ ensure that values are computed again only when a file changes """
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'FileSource-ukgov.json')
+            with open(path, 'w') as f:
+                f.write('{}')
+            computed = []
+
+            def compute():
+                computed.append(path)
+                return len(computed)
+            assert cached_by_stat(path, 'salt', compute) == 1
+            assert cached_by_stat(path, 'salt', compute) == 1
+            assert os.path.exists(os.path.join(tmp, '.salts.json'))
+
+            with open(path, 'w') as f:
+                f.write('{"LY": {}}')
+            assert cached_by_stat(path, 'salt', compute) == 2
+
+    def test_plan(self):
+        """ ensure that plans list tasks that would run, requirements first """
+        with TemporaryDirectory() as tmp:
+            base_dir = os.path.join(tmp, 'build') + '/'
+
+            class PlannedSource(Task):
+                __version__ = '0.1'
+                output = SaltedOutput(base_dir=base_dir)
+
+                def run(self):
+                    with self.output().open('w') as f:
+                        f.write('asdf')
+
+            class PlannedTable(Task):
+                __version__ = '0.1'
+                output = SaltedOutput(base_dir=base_dir, ext='.csv')
+                requires = Requires()
+                source = Requirement(PlannedSource)
+
+                def run(self):
+                    with self.output().open('w') as f:
+                        f.write('qwer')
+
+            steps = plan([PlannedTable()])
+            assert [type(s.task) for s in steps] == [PlannedSource, PlannedTable]
+            assert [s.state for s in steps] == ['stale', 'stale']
+            assert steps[0].reason == 'never built'
+            assert steps[1].reason == 'never built, after PlannedSource()'
+            assert steps[1].paths == [PlannedTable().output().path]
+            assert steps[1].salt in steps[1].paths[0]
+
+            assert build([PlannedTable()], local_scheduler=True)
+            steps = plan([PlannedTable()])
+            assert [s.state for s in steps] == ['ok', 'ok']
+            assert format_plan(steps).endswith('0 of 2 tasks would run')
+
+            # a dry run, even salting by content, pulls nothing from the cache
+            cache.configure(os.path.join(tmp, 'cache'))
+            utils.EARLY_CUTOFF = True
+            try:
+                cache.get_cache().push(PlannedSource().output().path,
+                                       os.path.basename(PlannedSource().output().path))
+                os.remove(PlannedSource().output().path)
+                steps = plan([PlannedTable()])
+                assert cache.get_cache() is not None
+            finally:
+                utils.EARLY_CUTOFF = False
+                cache.configure(None)
+            assert steps[0].state == 'stale'
+            assert not os.path.exists(PlannedSource().output().path)
+
+
+class WatchTests(TestCase):
+
+    def test_rebuild_changes(self):
+        """ ensure that only changed files are parsed again by a warm process """
+        with TemporaryDirectory() as tmp:
+            paths = {name: os.path.join(tmp, f'{name}.csv') for name in ['codes', 'names']}
+            for name, path in paths.items():
+                with open(path, 'w') as f:
+                    f.write(f'ISO3,{name}\nDZA,x\n')
+            runs = []
+
+            class WatchedFile(Task):
+                name = Parameter()
+
+                def output(self):
+                    return LocalTarget(paths[self.name])
+
+            class WatchedTable(Task):
+                __version__ = '0.1'
+                output = SaltedOutput(base_dir=os.path.join(tmp, 'build') + '/', ext='.csv')
+                requires = Requires()
+                codes = Requirement(WatchedFile, name='codes')
+                names = Requirement(WatchedFile, name='names')
+
+                def run(self):
+                    runs.append(self)
+                    frames = [read_csv('watched', task.output().path)
+                              for task in self.requires().values()]
+                    with self.output().open('w') as f:
+                        f.write(pd.merge(*frames, on='ISO3').to_csv(index=False))
+
+            try:
+                watch(lambda: [WatchedTable()], interval=0, iterations=2)
+                assert len(runs) == 1
+                cache = get_frame_cache()
+                assert (cache.hits, cache.misses) == (0, 2)
+                # the mode of the rest of the process is left as it was
+                assert not utils.EARLY_CUTOFF
+
+                utils.EARLY_CUTOFF = True
+                with open(paths['codes'], 'w') as f:
+                    f.write('ISO3,codes\nDZA,y\n')
+                os.utime(paths['codes'], ns=(0, 0))
+                rebuild([WatchedTable()])
+                assert len(runs) == 2
+                assert (cache.hits, cache.misses) == (1, 3)
+                with WatchedTable().output().open('r') as f:
+                    assert f.read() == 'ISO3,codes,names\nDZA,y,x\n'
+            finally:
+                utils.EARLY_CUTOFF = False
+                keep_frames(0)
+
+    def test_failed_rebuild(self):
+        """ ensure that a failing task is built once, not reported as rebuilt,
+            and only built again once its inputs change """
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'codes.csv')
+            with open(path, 'w') as f:
+                f.write('ISO3\nDZA\n')
+            runs = []
+
+            class FailingFile(Task):
+                def output(self):
+                    return LocalTarget(path)
+
+            class FailingTable(Task):
+                __version__ = '0.1'
+                output = SaltedOutput(base_dir=os.path.join(tmp, 'build') + '/', ext='.csv')
+                requires = Requires()
+                codes = Requirement(FailingFile)
+
+                def run(self):
+                    runs.append(self)
+                    raise ValueError('unparseable')
+
+            # without keeping frames in memory
+            watch(lambda: [FailingTable()], interval=0, frame_cache_size=0, iterations=2)
+            assert len(runs) == 1
+
+            utils.EARLY_CUTOFF = True
+            try:
+                failures = {}
+                assert rebuild([FailingTable()], failures=failures) == []
+                assert len(runs) == 2
+                # unchanged inputs, so it is not built again
+                assert rebuild([FailingTable()], failures=failures) == []
+                assert len(runs) == 2
+
+                with open(path, 'w') as f:
+                    f.write('ISO3\nNAM\n')
+                os.utime(path, ns=(0, 0))
+                assert rebuild([FailingTable()], failures=failures) == []
+                assert len(runs) == 3
+            finally:
+                utils.EARLY_CUTOFF = False
+
+
+class LockTests(TestCase):
+
+    def test_exclusive(self):
+        """ ensure that a lock is held by one holder at a time """
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'build', 'UNCodes-asdf12.csv.lock')
+            first = FileLock(path)
+            second = FileLock(path, poll_interval=0.01)
+            assert first.acquire()
+            assert first.holder()['pid'] == os.getpid()
+            assert not second.acquire(timeout=0.05)
+            first.release()
+            assert second.acquire(timeout=0.05)
+            second.release()
+            assert not os.path.exists(path)
+
+    def test_stale(self):
+        """ ensure that locks of exited or long gone holders are broken """
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'UNCodes-asdf12.csv.lock')
+            # a pid beyond the maximum on linux
+            holders = [{'pid': 2 ** 22 + 1, 'host': socket.gethostname(), 'time': time.time()},
+                       {'pid': 1, 'host': 'elsewhere', 'time': time.time() - 7200}]
+            for holder in holders:
+                with open(path, 'w') as f:
+                    json.dump(holder, f)
+                lock = FileLock(path, stale_after=3600)
+                assert lock.acquire(timeout=0)
+                assert lock.holder()['pid'] == os.getpid()
+                lock.release()
+
+            with open(path, 'w') as f:
+                json.dump({'pid': 1, 'host': 'elsewhere', 'time': time.time()}, f)
+            assert not FileLock(path, stale_after=3600).acquire(timeout=0)
+
+    def test_adopt(self):
+        """ ensure that an output built by another process while waiting is adopted """
+        with TemporaryDirectory() as tmp:
+            runs = []
+
+            class LockedTask(Task):
+                def output(self):
+                    return LocalTarget(os.path.join(tmp, 'build', 'Locked.csv'))
+
+                @locked
+                def run(self):
+                    runs.append(self)
+                    with self.output().open('w') as f:
+                        f.write('asdf')
+
+            task = LockedTask()
+            lock = FileLock(task.output().path + '.lock')
+            assert lock.acquire()
+
+            def build_elsewhere():
+                time.sleep(0.1)
+                with task.output().open('w') as f:
+                    f.write('qwer')
+                lock.release()
+
+            other = threading.Thread(target=build_elsewhere)
+            other.start()
+            task.run()
+            other.join()
+            assert runs == []
+            with task.output().open('r') as f:
+                assert f.read() == 'qwer'
+
+            os.remove(task.output().path)
+            task.run()
+            assert runs == [task]
+            assert not os.path.exists(lock.path)
+
+
+class FormatTests(TestCase):
+
+    def test_open_target_plain(self):
+        """ ensure that open_target reads uncompressed targets as bytes """
+        with TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, 'asdf.txt')
+            with open(fp, 'w') as o:
+                o.write('asdf')
+            with open_target(SuffixPreservingLocalTarget(path=fp)) as i:
+                assert i.read() == b'asdf'
+
+    @skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd_format(self):
+        """ ensure that ZstdFormat compresses on write and
+            that open_target decompresses transparently """
+        with TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, 'asdf.txt.zst')
+            target = SuffixPreservingLocalTarget(path=fp, format=ZstdFormat())
+            with target.open('w') as o:
+                o.write(b'asdf' * 100)
+            with open(fp, 'rb') as i:
+                assert i.read() != b'asdf' * 100
+            with open_target(target) as i:
+                assert i.read() == b'asdf' * 100
+
+    @skipIf(zstandard is None, 'zstandard is not installed')
+    def test_compress_raw(self):
+        """ ensure that compression of raw sources is configured when
+            targets are built, rather than when tasks are imported """
+        task = FileSource(slug='geonames', ext='.txt')
+        assert task.output().path == 'build/FileSource-geonames.txt'
+        config = get_config()
+        if not config.has_section('make-country-codes'):
+            config.add_section('make-country-codes')
+        config.set('make-country-codes', 'compress_raw', 'true')
+        try:
+            assert task.output().path == 'build/FileSource-geonames.txt.zst'
+            assert isinstance(task.output().format, ZstdFormat)
+        finally:
+            config.remove_option('make-country-codes', 'compress_raw')
+
+
+class SchemaTests(TestCase):
+
+    def test_infer_field_type(self):
+        assert infer_field_type(['1', '', '20']) == 'integer'
+        assert infer_field_type(['1.5', '2']) == 'number'
+        assert infer_field_type(['2019-04-28', '']) == 'date'
+        assert infer_field_type(['004', '008']) == 'string'
+        assert infer_field_type(['', '']) == 'string'
+
+    def test_table_schema(self):
+        """ ensure that known columns are typed from the declared schema,
+            unknown columns are inferred, and keys are verified """
+        with TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, 'asdf.csv')
+            with open(fp, 'w') as o:
+                o.write('M49 Code (M49),Population (geonames),ISO3 (exio-wiod-eora),new\n')
+                o.write('004,100,AFG,1\n')
+                o.write('008,200,ALB,2\n')
+            schema = table_schema(fp)
+            types = {f['name']: f['type'] for f in schema['fields']}
+            assert types['M49 Code (M49)'] == 'string'
+            assert types['Population (geonames)'] == 'integer'
+            assert types['new'] == 'integer'
+            assert schema['primaryKey'] == ['ISO3 (exio-wiod-eora)']
+            assert schema['missingValues'] == ['']
+
+    def test_read_csv(self):
+        """ ensure that codes keep leading zeros and
+            declared columns are read as categoricals """
+        with TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, 'asdf.csv')
+            with open(fp, 'w') as o:
+                o.write('ISO-Numeric,Continent\n')
+                o.write('004,AS\n')
+                o.write(',EU\n')
+            df = read_csv('geonames', fp, keep_default_na=False, na_values=['_'])
+            assert list(df['ISO-Numeric']) == ['004', '']
+            assert str(df['Continent'].dtype) == 'category'
+
+    def test_declared_dtypes(self):
+        """ ensure that declared columns are read with their dtypes
+            and that their field types are derived from them """
+        with TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, 'asdf.csv')
+            with open(fp, 'w') as o:
+                o.write('ISO,Population,Area(in sq km)\n')
+                o.write('DZ,42228429,2381740\n')
+                o.write('VA,,0.44\n')
+            df = read_csv('geonames', fp, keep_default_na=False, na_values=['_'])
+            assert field_type(df['Population'].dtype) == 'integer'
+            assert field_type(df['Area(in sq km)'].dtype) == 'number'
+            assert df['Population'].isna().tolist() == [False, True]
+        assert FIELD_TYPES['Population (geonames)'] == 'integer'
+        assert FIELD_TYPES['start-date (ukgov)'] == 'date'
+        assert field_type('object') == 'string'
+
+
+class ProjectionTests(TestCase):
+
+    def test_sources(self):
+        """ ensure that sources are derived from schemes and suffixes,
+            along with the sources they are joined through """
+        assert projection.sources(projection.parse('ISO2, ISO3'), JOINED_THROUGH) == {'exio-wiod-eora'}
+        assert projection.sources(projection.parse('*(usa-census)'), JOINED_THROUGH) \
+            == {'usa-census', 'geonames', 'exio-wiod-eora'}
+        assert projection.sources(['Currency*'], JOINED_THROUGH) == {'iso4217', 'exio-wiod-eora'}
+        assert 'fifa-ioc' in projection.sources(['*Short*'], JOINED_THROUGH)
+        assert projection.normalize(' ISO*, ,*(iso4217) ') == 'ISO*,*(iso4217)'
+
+    def test_select(self):
+        columns = ['M49 Code (M49)', 'ISO2 (exio-wiod-eora)', 'regex (exio-wiod-eora)',
+                   'Currency Name (iso4217)', 'Currency Code Alpha (iso4217)']
+        assert projection.select(columns, ['ISO*', 'M49', 'Currency Name*']) \
+            == ['M49 Code (M49)', 'ISO2 (exio-wiod-eora)', 'Currency Name (iso4217)']
+
+    def test_requires(self):
+        """ ensure that a projection only requires the sources it needs """
+        assert len(CountryCodes().requires()) == 12
+        assert sorted(CountryCodes(columns='ISO*,FIFA').requires()) == ['src_UNCodes', 'src_exio', 'src_fifa']
+
+    def test_output(self):
+        """ ensure that a projection is never taken for the whole table """
+        assert os.path.basename(CountryCodes().output().path).startswith('country-codes-')
+        assert os.path.basename(CountryCodes(columns='ISO*').output().path).startswith('projection-')
+
+
+class BackendTests(TestCase):
+
+    @skipIf(pl is None, "polars is not installed")
+    def test_backends_agree(self):
+        """ ensure that outer joins of each backend give identical output """
+        from io import StringIO
+        left = pd.DataFrame({'ISO3': ['ZAF', 'NAM', None, 'NAM', ''], 'M49': list('12345')})
+        right = pd.DataFrame({'code': ['NAM', 'XKX', None, '', 'NAM'], 'ISO2': list('abcde')})
+        more = pd.DataFrame({'ISO3': ['NAM', 'ATA'], 'name': ['Namibia', 'Antarctica'],
+                             'area': [824292.0, None]})
+        outputs = []
+        for backend in (PandasBackend(), PolarsBackend()):
+            joined = backend.join(backend.from_pandas(left), backend.from_pandas(right),
+                                  left_on='ISO3', right_on='code')
+            joined = backend.join(joined, backend.from_pandas(more),
+                                  left_on='ISO3', right_on='ISO3')
+            if backend.name == 'polars':
+                # joins are planned, and only run when the table is written
+                assert isinstance(joined, pl.LazyFrame)
+            f = StringIO()
+            backend.write_csv(backend.drop(joined, ['code']), f)
+            outputs.append(f.getvalue())
+        assert outputs[0] == outputs[1]
+        assert outputs[0].splitlines()[:3] == ['ISO3,M49,ISO2,name,area', 'ZAF,1,,,',
+                                             'NAM,2,a,Namibia,824292']
+
+
+class NormalizeTests(TestCase):
+
+    def test_collapse_whitespace(self):
+        dirty = pd.Series(["1\n", "2\r", "\n\r3", "\xa04", "\xa05\r", "6\xa0 7"])
+        assert list(collapse_whitespace(dirty)) == list(map(clean, dirty))
+
+    def test_pad_code(self):
+        """ ensure that vectorized padding matches convert_numeric_code_with_pad """
+        codes = pd.Series(["1", "002", "3", "4.0", "", "asdf"])
+        assert list(pad_code(codes)) == ['001', '002', '003', '004', '', '']
+        assert list(numeric_code(codes)) == ['1', '2', '3', '4', '', '']
+
+    def test_remove_and_replace(self):
+        names = pd.Series(["Algeria[3]", "Swaziland", "the Czech Republic"])
+        assert list(remove(names, FOOTNOTE)) == ["Algeria", "Swaziland", "the Czech Republic"]
+        aliases = {"Czech Republic": "Czechia", "Swaziland": "Eswatini"}
+        assert list(replace_aliases(names, aliases)) == ["Algeria[3]", "Eswatini", "the Czechia"]
+
+
+SCRAPED = '''<html><body>
+<table id="codes"><thead><tr><th>Code</th><th>Name</th><th>Name</th><th>LDC</th></tr></thead>
+<tr><td>004</td><td colspan="2">Afghanistan</td><td>x</td></tr>
+<tr><td rowspan="2">012</td><td>Algeria</td><td>Algérie[1]</td><td></td></tr>
+<tr><td>People's Democratic\r\n Republic</td><td>&#160;</td><td></td></tr>
+</table>
+<table><tr><td>Other Countries</td></tr><tr><td>A0</td><td>Alberta, Canada</td></tr>
+<tr><td>B2</td></tr><tr><td>C3</td><td>Algeria</td></tr></table>
+</body></html>'''
+
+
+class ScrapeTests(TestCase):
+
+    def test_extract_tables(self):
+        """ ensure that spans, headers and markers are handled like pd.read_html """
+        specs = [TableSpec('codes', selector='//table[@id="codes"]',
+                           cleaners={'LDC': lambda s: s.str.upper()}),
+                 TableSpec('edgar', index=1, header=None,
+                           start_marker='Other Countries', width=2)]
+        tables = extract_tables(SCRAPED.encode('utf-8'), specs)
+
+        codes = tables['codes']
+        assert list(codes.columns) == ['Code', 'Name', 'Name.1', 'LDC']
+        assert list(codes['Code']) == ['004', '012', '012']
+        assert list(codes['Name.1']) == ['Afghanistan', 'Algérie[1]', '']
+        assert codes['Name'][2] == "People's Democratic Republic"
+        assert list(codes['LDC']) == ['X', '', '']
+
+        assert tables['edgar'].values.tolist() == [['A0', 'Alberta, Canada'], ['C3', 'Algeria']]
+
+
+class SourcesTests(TestCase):
+
+    def test_host_limits(self):
+        """ ensure that sources declaring the same host share its strictest limits
+            and that other hosts, even under a common suffix, do not """
+        assert host_of('https://www.fao.org.uk/') == 'www.fao.org.uk'
+        assert REGISTRY['ukgov'].host != REGISTRY['ukgov-territory'].host
+        assert REGISTRY['M49'].resource == REGISTRY['unterm'].resource == 'host:un.org'
+        assert declared_host('https://unstats.un.org/unsd/other') == 'un.org'
+        try:
+            register(Source('un-test', 'Test', 'https://test.un.org/x.csv',
+                            host='un.org', max_concurrency=3, min_interval=5.0))
+            assert host_limits()['un.org'] == (1, 5.0)
+        finally:
+            del REGISTRY['un-test']
+        assert REGISTRY['M49'].priority > REGISTRY['usa-census'].priority
+
+    def test_history_only(self):
+        """ ensure that sources only used by the history are neither fetched
+            with the table's sources nor listed in its datapackage """
+        from .tasks.data import SaltedSources
+        from .tasks.data import SOURCES
+        slugs = {task.slug for task in SaltedSources().requires()}
+        assert 'ukgov' in slugs and 'iso4217' in slugs
+        assert not slugs & {'ukgov-territory', 'iso4217-historic'}
+        assert 'iso4217-historic' not in {source['name'] for source in SOURCES}
+
+    def test_wait_for_turn(self):
+        """ ensure that requests to a host are spaced by its min_interval """
+        with TemporaryDirectory() as tmp:
+            url = 'https://raw.githubusercontent.com/a.json'
+            assert wait_for_turn(url, throttle_dir=tmp) == 0
+            assert 0 < wait_for_turn(url, throttle_dir=tmp) <= REGISTRY['cldr'].min_interval
+            assert wait_for_turn('https://elsewhere.org/', throttle_dir=tmp) == 0
+
+    def test_concurrent_turns(self):
+        """ ensure that concurrent requests to a host take turns """
+        from concurrent.futures import ThreadPoolExecutor
+        url = 'https://raw.githubusercontent.com/a.json'
+        with TemporaryDirectory() as tmp, ThreadPoolExecutor(3) as pool:
+            delays = sorted(pool.map(lambda _: wait_for_turn(url, throttle_dir=tmp), range(3)))
+        assert delays[0] == 0 and delays[1] > 0.1 and delays[2] > 0.1
+
+
+class NameIndexTests(TestCase):
+
+    def test_fold(self):
+        assert fold("Côte d’Ivoire") == fold("COTE D'IVOIRE") == 'cote d ivoire'
+        assert fold("Алжир") == fold("АЛЖИР")
+        assert fold("الْجَزَائِر") == fold("الجزائر")
+        assert fold("  Åland\xa0Islands ") == 'aland islands'
+
+    def test_build_index(self):
+        """ ensure that variants in every language are indexed
+            and that names shared by different countries are not """
+        rows = [{'ISO3 (exio-wiod-eora)': 'HKG',
+                 'Locale Display Name (cldr)': 'Hong Kong SAR China; Hong Kong',
+                 'Country or Area_ru (M49)': 'Китай, Специальный административный район Гонконг',
+                 'Country (geonames)': 'Georgia'},
+                {'ISO3 (exio-wiod-eora)': '',
+                 'ISO-alpha3 Code (M49)': 'GEO',
+                 'Country (geonames)': 'Georgia'}]
+        index = NameIndex(build_index(rows))
+        assert index.resolve('hong kong') == 'HKG'
+        assert index.resolve('Hong Kong SAR China') == 'HKG'
+        assert index.resolve('китай специальный административный район гонконг') == 'HKG'
+        assert index.resolve('Georgia') is None
+        assert 'georgia' in index.ambiguous
+
+
+ROWS = [{'ISO3 (exio-wiod-eora)': 'DZA', 'ISO2 (exio-wiod-eora)': 'DZ',
+         'M49 Code (M49)': '012', 'Country or Area_fr (M49)': 'Algérie'},
+        {'ISO3 (exio-wiod-eora)': 'NAM', 'ISO2 (exio-wiod-eora)': 'NA',
+         'M49 Code (M49)': '516', 'Country or Area_fr (M49)': 'Namibie'}]
+
+
+class HistoryTests(TestCase):
+
+    def test_as_of(self):
+        """ ensure that only changes are appended and values are resolved as of a date """
+        with TemporaryDirectory() as tmp, History(os.path.join(tmp, 'h.sqlite')) as history:
+            entity = 'ISO3 (exio-wiod-eora)'
+            old = [{entity: 'SWZ', 'name': 'Swaziland', 'ISO2': 'SZ'}]
+            new = [{entity: 'SWZ', 'name': 'Eswatini', 'ISO2': 'SZ'}]
+            assert history.ingest(old, 'country-codes-a.csv', '2017-01-01') == 3
+            assert history.ingest(old, 'country-codes-a.csv', '2017-01-01') is None
+            assert history.ingest(new, 'country-codes-b.csv', '2018-04-19') == 1
+            assert history.ingest([], 'country-codes-c.csv', '2020-01-01') == 3
+
+            assert history.as_of('SWZ', '2016-12-31') == {}
+            assert history.as_of('SWZ', '2018-01-01')['name'] == 'Swaziland'
+            assert history.as_of('SWZ', '2019-01-01')['name'] == 'Eswatini'
+            assert history.as_of('SWZ', '2021-01-01') == {}
+            assert [f[2] for f in history.changes('2018-01-01', '2019-01-01')] == ['Eswatini']
+            for statement in ["UPDATE facts SET value = 'Swaziland'", 'DELETE FROM facts']:
+                with self.assertRaises(sqlite3.IntegrityError):
+                    history.db.execute(statement)
+
+            resolve = history.resolver('name')
+            assert [resolve('SWZ', d) for d in ['2000-01-01', '2017-06-01', '2019-06-01']] \
+                == [None, 'Swaziland', 'Eswatini']
+
+    def test_concurrent_append(self):
+        """ ensure that a generation appended by another process meanwhile is skipped """
+        facts = [('ZWE', 'name', 'Zimbabwe', '2020-01-01', None)]
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'h.sqlite')
+            with History(path) as first, History(path) as second:
+                assert not second.has_generation('country-codes-a.csv')
+                assert first.append(facts, 'country-codes-a.csv', 'country-codes', '2020-01-01') == 1
+                assert second.append(facts, 'country-codes-a.csv', 'country-codes', '2020-01-01') is None
+                assert len(second.current()) == 1
+
+    def test_currency_seed(self):
+        """ ensure that withdrawn currencies are chained by withdrawal date """
+        entries = [{'CtryNm': 'ZIMBABWE', 'Ccy': 'ZWN', 'WthdrwlDt': '2008-08'},
+                   {'CtryNm': 'ZIMBABWE', 'Ccy': 'ZWD', 'WthdrwlDt': '2006-08'}]
+        current = {'ZWE': {'Currency Code Alpha (iso4217)': 'ZWL'}}
+        facts = currency_facts(entries, lambda name: 'ZWE', current)
+        with TemporaryDirectory() as tmp, History(os.path.join(tmp, 'h.sqlite')) as history:
+            history.append(facts, 'list_three.xml', 'iso4217-historic', '2020-01-01')
+            field = 'Currency Code Alpha (iso4217)'
+            assert [history.value_as_of('ZWE', field, d)
+                    for d in ['2000-01-01', '2007-01-01', '2010-01-01']] == ['ZWD', 'ZWN', 'ZWL']
+
+
+class DatabaseTests(TestCase):
+
+    def test_write_sqlite(self):
+        """ ensure that schemes are columns, other fields are attributes
+            and names are searchable in every language """
+        rows = [dict(ROWS[0], **{'Capital (geonames)': 'Algiers',
+                                 'Locale Display Name (cldr)': 'Algeria; Algérie'}),
+                dict(ROWS[1], **{'M49 Code (M49)': ''})]
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'country-codes.sqlite')
+            write_sqlite(rows, path)
+            db = sqlite3.connect(path)
+            assert db.execute('SELECT "ISO3" FROM countries WHERE "M49" = ?', ['012']).fetchall() == [('DZA',)]
+            assert db.execute('SELECT "M49" FROM countries WHERE "ISO3" = ?', ['NAM']).fetchall() == [(None,)]
+            plan = ' '.join(r[-1] for r in db.execute(
+                'EXPLAIN QUERY PLAN SELECT id FROM countries WHERE "ISO2" = ?', ['NA']))
+            assert 'USING INDEX' in plan or 'USING COVERING INDEX' in plan
+            assert db.execute('SELECT value FROM attributes a JOIN countries c ON c.id = a.country_id '
+                              'WHERE c."ISO2" = ? AND "column" = ?',
+                              ['DZ', 'Capital (geonames)']).fetchall() == [('Algiers',)]
+            assert sorted(db.execute('SELECT lang, name FROM names WHERE folded = ?', ['algerie'])) \
+                == [('en', 'Algérie'), ('fr', 'Algérie')]
+            try:
+                found = db.execute('SELECT DISTINCT c."ISO3" FROM names_fts JOIN names n ON n.id = names_fts.rowid '
+                                   'JOIN countries c ON c.id = n.country_id WHERE names_fts MATCH ?',
+                                   ['namibie']).fetchall()
+            except sqlite3.OperationalError:
+                raise SkipTest('sqlite3 without FTS5')
+            finally:
+                db.close()
+            assert found == [('NAM',)]
+
+
+class ShardsTests(TestCase):
+
+    def test_write_shards(self):
+        """ ensure that shards are named by their content
+            and that unchanged shards are not rewritten """
+        with TemporaryDirectory() as tmp:
+            manifest = write_shards(ROWS, tmp)
+            shards = manifest['shards']
+            assert sorted(shards['countries']) == ['DZA', 'NAM']
+
+            def load(kind, name):
+                path = os.path.join(tmp, manifest['path'].format(
+                    kind=kind, name=name, hash=shards[kind][name], format='json'))
+                with open(path, 'rb') as f:
+                    return f.read()
+
+            assert json.loads(load('maps', 'ISO2')) == {'DZ': ['DZA'], 'NA': ['NAM']}
+            assert json.loads(load('index', 'names'))['DZA'] == {'fr': 'Algérie'}
+            assert b'", "' not in load('countries', 'NAM')
+            assert json.loads(load('countries', 'DZA'))['M49 Code (M49)'] == '012'
+
+            mtime = os.stat(os.path.join(tmp, 'maps')).st_mtime_ns
+            changed = [dict(ROWS[0], **{'Country or Area_fr (M49)': 'Algerie'}), ROWS[1]]
+            again = write_shards(changed, tmp)['shards']
+            assert again['maps'] == shards['maps']
+            assert again['countries']['NAM'] == shards['countries']['NAM']
+            assert again['countries']['DZA'] != shards['countries']['DZA']
+            assert os.stat(os.path.join(tmp, 'maps')).st_mtime_ns == mtime
+
+
+class MatchingTests(TestCase):
+
+    REGEXES = [('CIV', 'ivoire'), ('COD', 'congo.*dem|dem.*congo'), ('COG', 'congo')]
+
+    def test_match(self):
+        """ ensure that names get the code of the first matching regex """
+        matcher = NameMatcher(self.REGEXES + [('CIV', 'ivoire')])
+        assert [matcher.match(name) for name in ['CONGO', 'Congo (Democratic Republic)', "Côte d'Ivoire"]] \
+            == ['COG', 'COD', 'CIV']
+        assert matcher.match('Atlantis') == matcher.match(float('nan')) == ''
+        assert len(matcher.regexes) == 3
+
+    def test_record(self):
+        """ ensure that matches are reused by later builds,
+            until the regexes change """
+        with TemporaryDirectory() as tmp:
+            matcher = NameMatcher(self.REGEXES, directory=tmp)
+            matcher.match('Congo')
+            matcher.save()
+
+            again = NameMatcher(self.REGEXES, directory=tmp)
+            assert again.match('Congo') == 'COG'
+            # nothing was scanned, so nothing was compiled
+            assert again._patterns is None and not again.unseen
+
+            changed = NameMatcher([('COG', 'congo')] + self.REGEXES, directory=tmp)
+            assert changed.salt != matcher.salt and changed.matches == {}
+            changed.match('Democratic Republic of the Congo')
+            changed.save()
+            assert os.listdir(tmp) == [os.path.basename(changed.path)]
+
+    def test_merge_matched(self):
+        """ ensure that names matching no country are kept
+            but not joined to each other """
+        matcher = NameMatcher(self.REGEXES)
+        iso4217 = pd.DataFrame({'Country Name (iso4217)': ['CONGO', 'ZZ01', 'ZZ02'],
+                                'Currency Code Alpha (iso4217)': ['XAF', 'XUA', 'XSU']})
+        itu = pd.DataFrame({'Designation (itu-glad)': ['Congo (Rep. of the)', 'Atlantis', 'Mu'],
+                            'Code (itu-glad)': ['COG', 'ATL', 'MU']})
+        merged = merge_matched([match_on_names(iso4217, 'Country Name (iso4217)', matcher),
+                                match_on_names(itu, 'Designation (itu-glad)', matcher)])
+        assert merged.iloc[0].to_dict() == {'Country Name (iso4217)': 'CONGO', 'Currency Code Alpha (iso4217)': 'XAF',
+                                            'ISO3': 'COG', 'Designation (itu-glad)': 'Congo (Rep. of the)',
+                                            'Code (itu-glad)': 'COG'}
+        assert list(merged['ISO3']) == ['COG', '', '', '', '']
+        assert list(merged['Country Name (iso4217)'].iloc[1:3]) == ['ZZ01', 'ZZ02']
+        assert merged['Country Name (iso4217)'].iloc[3:].isnull().all()
+        assert list(merged['Designation (itu-glad)'].iloc[3:]) == ['Atlantis', 'Mu']
+
+
+class BenchTests(TestCase):
+
+    def test_countries(self):
+        """ ensure that made up countries have unique codes
+            and that no name contains another """
+        world = countries(4)
+        assert len(world) == len({c.iso3 for c in world}) == len({c.numeric for c in world})
+        names = [c.name for c in world]
+        assert not any(a != b and a[:-3] in b for a in names[:40] for b in names)
+
+    def test_bench(self):
+        """ ensure that the pipeline builds over synthetic sources
+            and that each task is timed """
+        with TemporaryDirectory() as tmp:
+            runs = bench(lambda: [CountryCodes()], scales=[0.1, 0.2], root=tmp)
+            assert [run.succeeded for run in runs] == [True, True]
+            assert runs[1].recorder.seconds['CountryCodes(columns=)'] > 0
+            assert 'M49Source(slug=M49, ext=.csv)' in runs[0].recorder.seconds
+            report = format_report(runs)
+            assert report.splitlines()[0].split()[1:] == ['0.1x', '0.2x', 'growth']
+            assert os.listdir(tmp) == []
+
+    def test_bench_isolated(self):
+        """ ensure that a bench neither uses the cache of artifacts
+            nor compresses the raw sources it writes """
+        config = get_config()
+        if not config.has_section('make-country-codes'):
+            config.add_section('make-country-codes')
+        config.set('make-country-codes', 'compress_raw', 'true')
+        with TemporaryDirectory() as tmp:
+            cache.configure(os.path.join(tmp, 'cache'))
+            try:
+                runs = bench(lambda: [CountryCodes()], scales=[0.1], root=tmp)
+                assert runs[0].succeeded
+                assert not os.path.exists(os.path.join(tmp, 'cache'))
+                assert cache.get_cache() is not None
+                assert config.getboolean('make-country-codes', 'compress_raw')
+            finally:
+                cache.configure(None)
+                config.remove_option('make-country-codes', 'compress_raw')
+
+
+class ServiceTests(TestCase):
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+
+    def test_respond(self):
+        """ ensure that conversions, name resolution and rows are served """
+        service = LookupService(table=CountryTable(ROWS))
+
+        status, body = service.respond('GET', '/convert?from=ISO2&to=M49&value=na')
+        assert status == 200 and json.loads(body)['result'] == '516'
+        assert len(service.cache) == 1
+
+        status, body = service.respond('POST', '/convert', json.dumps(
+            {'from': 'name', 'to': 'ISO2', 'values': ['algerie', 'nowhere']}).encode())
+        assert json.loads(body)['results'] == ['DZ', None]
+
+        status, body = service.respond('GET', '/row/M49/012')
+        assert json.loads(body)['ISO3 (exio-wiod-eora)'] == 'DZA'
+
+        assert service.respond('GET', '/row/XYZ')[0] == 404
+        assert service.respond('GET', '/convert?from=nope&to=M49&value=1')[0] == 400
+
+
+    def test_latest(self):
+        """ ensure that the latest table is loaded with its own name index """
+        with TemporaryDirectory() as tmp:
+            table_path = os.path.join(tmp, 'country-codes-asdf12.csv')
+            pd.DataFrame(ROWS).to_csv(table_path, index=False)
+            with open(os.path.join(tmp, 'name-index-qwer34.json'), 'w') as f:
+                json.dump(build_index(ROWS[:1]), f)
+            with self.assertRaises(FileNotFoundError):
+                CountryTable.latest(tmp)
+            with open(os.path.join(tmp, 'name-index-asdf12.json'), 'w') as f:
+                json.dump(build_index(ROWS), f)
+            table = CountryTable.latest(tmp)
+            assert table.path == table_path and table.salt == 'asdf12'
+            assert table.find('Namibie', 'name')['M49 Code (M49)'] == '516'
+
+    def test_standard_library(self):
+        """ ensure that lookups don't import luigi or pandas """
+        import subprocess
+        import sys
+        code = 'import sys, make_country_codes.service; print(sorted({"luigi", "pandas"} & set(sys.modules)))'
+        output = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+                                cwd=os.path.dirname(os.path.dirname(__file__))).stdout
+        assert output.strip() == b'[]'
+
+
+class EnrichTests(TestCase):
+
+    def test_enrich(self):
+        """ ensure that chunks are enriched and written in order """
+        with TemporaryDirectory() as tmp:
+            pd.DataFrame(ROWS).to_csv(os.path.join(tmp, 'country-codes-asdf12.csv'), index=False)
+            with open(os.path.join(tmp, 'name-index-asdf12.json'), 'w') as f:
+                json.dump(build_index(ROWS), f)
+            in_path = os.path.join(tmp, 'in.csv')
+            out_path = os.path.join(tmp, 'out.csv')
+            names = ['Namibie', 'algérie', 'nowhere'] * 5
+            pd.DataFrame({'country': names}).to_csv(in_path, index=False)
+
+            written = enrich(in_path, out_path, 'country', 'name', ['ISO2', 'M49'],
+                             root=tmp, chunksize=4, processes=2)
+            assert written == len(names)
+            out = pd.read_csv(out_path, dtype=str, keep_default_na=False)
+            assert list(out['country']) == names
+            assert list(out['country_ISO2'][:3]) == ['NA', 'DZ', '']
+            assert list(out['country_M49'][:3]) == ['516', '012', '']
@@ -1,20 +1,55 @@
 import os
+import csv
+import io
+import json
 import random
 import hashlib
-from functools import reduce
 from contextlib import contextmanager
+from functools import wraps
 
+import requests
+from luigi import format
+from luigi import Event
 from luigi import LocalTarget
 from luigi import Parameter
+from luigi import Task
 from luigi.local_target import atomic_file
+from luigi.task import flatten
 from salted.salted_demo import get_salted_version
 from luigi.task import logger as luigi_logger
 
-replacements = (u'\xa0', u''), (u'\n', u''), (u'\r', u'')
+from .cache import cached_target_class
+from .cache import get_cache
+from .sources import wait_for_turn
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli  # noqa: F401 (urllib3 decodes `br` when available)
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+REQUEST_HEADERS = {'Accept-Encoding': ACCEPT_ENCODING}
+CHUNK_SIZE = 64 * 1024
+ZSTD_EXT = '.zst'
+
+# salt derived outputs by the content of their complete requirements rather
+# than only by their lineage, and reuse outputs whose salt is unchanged.
+# see :func:`get_content_salted_version`
+EARLY_CUTOFF = False
 
 
 def clean(word):
-    reduce(lambda a, kv: a.replace(*kv), replacements, word)
+    """Collapses runs of whitespace (including NBSP, CR and LF)
+    into single spaces and strips leading and trailing whitespace
+
+    See :func:`make_country_codes.normalize.collapse_whitespace`
+    to clean a whole :class:`pandas.Series`.
+    """
     return " ".join(word.split())
 
 
@@ -30,6 +65,45 @@ def bytes_pls(some_val):
     return some_val.encode()
 
 
+# replaces requests in :func:`fetch`, see :func:`fetching_with`
+_fetcher = None
+
+
+def fetch(url, throttle_dir):
+    """Returns the content of `url`, negotiating a compressed transfer
+
+    requests transparently decodes gzip/deflate (and brotli, when
+    installed) response bodies, so callers always receive the original bytes.
+    Requests are spaced out according to the politeness limits of the
+    host, see :func:`make_country_codes.sources.wait_for_turn`.
+
+    :param str url: location of remote resource
+    :param str throttle_dir: where times of requests to hosts are recorded
+    :rtype: bytes
+    """
+    if _fetcher is not None:
+        return _fetcher(url, throttle_dir)
+    wait_for_turn(url, throttle_dir)
+    with requests.get(url, headers=REQUEST_HEADERS) as r:
+        r.raise_for_status()
+        return r.content
+
+
+@contextmanager
+def fetching_with(fetcher):
+    """Fetches with `fetcher` rather than requests within the context,
+    e.g. to read pages written locally
+
+    :param callable fetcher: called like :func:`fetch`, returns bytes
+    """
+    global _fetcher
+    previous, _fetcher = _fetcher, fetcher
+    try:
+        yield
+    finally:
+        _fetcher = previous
+
+
 def convert_numeric_code_with_pad(x):
     """
     Codes like M49 and ISO 3166 numeric should be
@@ -65,15 +139,16 @@ class sha256sum:
         and/or the hash of the file contents of salted target's requires()
 
         In cases where the salted target's required task is not complete,
-        descriptor returns a placeholder ('tk') so luigi will know to run the task.
+        descriptor returns the salt recorded in the cache by the machine that
+        last fetched it (see :func:`record_source_salt`), if any, or else a
+        placeholder ('tk') so luigi will know to run the task.
     """
     def __get__(self, task, cls):
         if task is None:
             return self
         if task.requires().get('source').complete():
             return get_salt_for_source(task.requires())
-        else:
-            return 'tk'
+        return recorded_source_salt(task) or 'tk'
 
     def __call__(self, task):
         """Returns the salt (chars of sha256 checksum) of task's output file
@@ -84,23 +159,284 @@ class sha256sum:
         return get_salt_for_task(task)
 
 
+# file recording values computed from the files in its directory
+STAT_CACHE = '.salts.json'
+# entries of each stat cache, by its path
+_stat_caches = {}
+
+
+def _read_stat_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def cached_by_stat(path, kind, compute):
+    """Returns a value computed from the file at `path`, such as its salt,
+    reusing the value last computed while the file's size and mtime are
+    unchanged
+
+    Values are recorded in a `.salts.json` file next to `path`, so they
+    are shared by processes and builds, and checking whether a file has
+    changed is a `stat` rather than reading it.
+
+    :param str kind: name of the value, e.g. `salt`
+    :param callable compute: returns the value, when not cached
+    """
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    cache_path = os.path.join(os.path.dirname(path), STAT_CACHE)
+    key = f'{kind}:{os.path.basename(path)}'
+    if cache_path not in _stat_caches:
+        _stat_caches[cache_path] = _read_stat_cache(cache_path)
+    entries = _stat_caches[cache_path]
+    if entries.get(key, [None])[0] != stamp:
+        # another process may have computed it meanwhile
+        entries.update(_read_stat_cache(cache_path))
+    if entries.get(key, [None])[0] != stamp:
+        entries[key] = [stamp, compute()]
+        # entries are merged with those on disk and replaced atomically
+        merged = _read_stat_cache(cache_path)
+        merged.update(entries)
+        entries.update(merged)
+        tmp_path = f'{cache_path}-tmp-{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(merged, f, sort_keys=True)
+        os.replace(tmp_path, cache_path)
+    return entries[key][1]
+
+
 def get_salt_for_source(task):
+    # salts are defined on decompressed content, so compressing
+    # raw artifacts on disk does not change any salted filenames
+    source = task.get('source').output()
+
+    def salt():
+        checksum = hashlib.sha256()
+        with open_target(source) as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                checksum.update(bytes_pls(chunk))
+        return checksum.hexdigest()[:6]
+    return cached_by_stat(source.path, 'salt', salt)
+
+
+# key of the latest salt of a salted source recorded in the cache
+SALT_RECORD = '{task.__class__.__name__}-{task.slug}{task.ext}.salt'
+# salts read from the cache, by cache and key
+_recorded_salts = {}
+
+
+def recorded_source_salt(task):
+    """Returns the salt of a salted source recorded in the configured
+    cache, or None, reading it once per process
+
+    :rtype: str or None
+    """
+    cache = get_cache()
+    if cache is None:
+        return None
+    key = SALT_RECORD.format(task=task)
+    if (cache, key) not in _recorded_salts:
+        try:
+            _recorded_salts[(cache, key)] = cache.recorded(key)
+        except Exception:
+            luigi_logger.warning('failed to read %s from %r', key, cache, exc_info=True)
+            return None
+    return _recorded_salts[(cache, key)]
+
+
+@Task.event_handler(Event.SUCCESS)
+def record_source_salt(task):
+    """Records the salt of every salted source built in the configured
+    cache, see :func:`recorded_source_salt`"""
+    cache = get_cache()
+    if cache is None or not isinstance(getattr(type(task), 'salt', None), sha256sum):
+        return
+    key = SALT_RECORD.format(task=task)
+    try:
+        cache.record(key, task.salt)
+    except Exception:
+        luigi_logger.warning('failed to record %s', key, exc_info=True)
+    else:
+        _recorded_salts[(cache, key)] = task.salt
+
+
+def canonical_hash(path):
+    """Returns the sha256 hexdigest of the canonical form of the file at `path`
+
+    CSV is hashed by its rows, so line endings and quoting don't matter,
+    JSON by its data, so formatting and key order don't matter, and
+    anything else by its (decompressed) bytes.
+
+    :rtype: str
+    """
     checksum = hashlib.sha256()
-    # TODO read and hash in chunks
+    name = path[:-len(ZSTD_EXT)] if path.endswith(ZSTD_EXT) else path
+    if path.endswith(ZSTD_EXT):
+        opened = ZstdFormat().pipe_reader(open(path, 'rb'))
+    else:
+        opened = open(path, 'rb')
+    with opened as f:
+        if name.endswith('.csv'):
+            text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            for row in csv.reader(text):
+                checksum.update(json.dumps(row, ensure_ascii=False).encode('utf-8'))
+        elif name.endswith('.json'):
+            data = json.load(io.TextIOWrapper(f, encoding='utf-8'))
+            checksum.update(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        else:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                checksum.update(chunk)
+    return checksum.hexdigest()
 
-    source = task.get('source').output()
-    with open(source.path, 'rb') as f:
-        checksum.update(bytes_pls(f.read()))
-    return checksum.hexdigest()[:6]
+
+def content_salt(task):
+    """Returns the salt of `task` as a requirement in early cutoff mode
+
+    Salted sources already have a salt from their content. Other complete
+    tasks are salted by the canonical hash of their outputs, and
+    incomplete tasks by their lineage until they have run.
+
+    :rtype: str
+    """
+    if hasattr(task, 'salt'):
+        return task.salt
+    if not task.complete():
+        return get_salted_version(task)
+    # outputs are hashed once, see :func:`cached_by_stat`
+    return ''.join(cached_by_stat(target.path, 'canonical',
+                                  lambda: canonical_hash(target.path))
+                   for target in flatten(task.output()))
+
+
+def get_content_salted_version(task):
+    """Like :func:`salted.salted_demo.get_salted_version`, but salted by
+    the content of requirements (see :func:`content_salt`)
+
+    When a requirement is rebuilt with identical content (say, its raw
+    source only changed in whitespace the transform ignores), the salt of
+    `task` is unchanged, so its prior output is reused.
+
+    :rtype: str
+    """
+    msg = ''.join(content_salt(req) for req in flatten(task.requires()))
+    msg += ','.join([task.__class__.__name__, task.__version__] + [
+        '{}={}'.format(param_name, repr(task.param_kwargs[param_name]))
+        for param_name, param in sorted(task.get_params())
+        if param.significant
+    ])
+    return hashlib.sha256(msg.encode()).hexdigest()
+
+
+def cutoff_early(run):
+    """Decorates `run` of a task with a salted output, so that in early
+    cutoff mode it does nothing when the output already exists
+
+    Luigi schedules tasks before their requirements have run, while their
+    salts still depend on the lineage of incomplete requirements. Once the
+    requirements are complete, the salt may turn out to be that of an
+    existing output, which is then reused.
+    """
+    @wraps(run)
+    def wrapper(task):
+        if EARLY_CUTOFF and task.complete():
+            luigi_logger.info('%s is unchanged, reusing %s', task,
+                              ', '.join(t.path for t in flatten(task.output())))
+            return
+        return run(task)
+    return wrapper
+
+
+def resource_stats(path):
+    """Returns size and sha256 hash of the file at `path`, read in chunks
+
+    :returns: `bytes` and `hash` properties of a data resource descriptor
+    :rtype: dict
+    """
+    checksum = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            size += len(chunk)
+            checksum.update(chunk)
+    return {'bytes': size, 'hash': f'sha256:{checksum.hexdigest()}'}
+
+
+def open_target(target):
+    """Opens a local target for reading bytes, decompressing if needed
+
+    :param LocalTarget target: target whose contents are desired
+    :rtype: file-like object
+    """
+    if isinstance(target.format, ZstdFormat):
+        return target.open('r')
+    return open(target.path, 'rb')
+
+
+class zstd_writer:
+    """Compresses writes into `output_pipe` as a single zstandard frame
+
+    Like :class:`luigi.local_target.atomic_file`, the underlying
+    pipe is only closed (and therefore committed) if no exception occurred.
+    """
+    def __init__(self, output_pipe, level):
+        self._output_pipe = output_pipe
+        self._writer = zstandard.ZstdCompressor(level=level).stream_writer(
+            output_pipe, closefd=False)
+
+    def write(self, b):
+        return self._writer.write(bytes_pls(b))
+
+    def close(self):
+        self._writer.close()
+        self._output_pipe.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type:
+            return
+        self.close()
+
+
+class ZstdFormat(format.Format):
+    """luigi format storing target contents zstandard-compressed
+
+    Requires the optional `zstandard` package.
+    """
+    input = 'bytes'
+    output = 'bytes'
+
+    def __init__(self, level=10):
+        if zstandard is None:
+            raise ImportError('ZstdFormat requires the zstandard package')
+        self.level = level
+
+    def pipe_reader(self, input_pipe):
+        return zstandard.ZstdDecompressor().stream_reader(input_pipe)
+
+    def pipe_writer(self, output_pipe):
+        return zstd_writer(output_pipe, level=self.level)
 
 
 class TargetOutput:
+    """Descriptor of a task's output
+
+    :param bool cached: whether the target is shared through the artifact
+        cache, see :mod:`make_country_codes.cache`. Only targets whose
+        filenames are salted should be cached.
+    """
     def __init__(self, file_pattern='{task.__class__.__name__}',
-                 ext='.txt', base_dir='data/', target_class=LocalTarget, **target_kwargs):
+                 ext='.txt', base_dir='data/', target_class=LocalTarget,
+                 cached=False, **target_kwargs):
         self.file_pattern = file_pattern
         self.ext = ext
         self.base_dir = base_dir
         self.target_class = target_class
+        self.cached = cached
         self.target_kwargs = target_kwargs
 
     def __get__(self, task, cls):
@@ -108,29 +444,40 @@ class TargetOutput:
             return self
         return lambda: self(task)
 
+    def target(self, target_path, **target_kwargs):
+        target_class = self.target_class
+        if self.cached and get_cache() is not None:
+            target_class = cached_target_class(target_class)
+        return target_class(target_path, **dict(self.target_kwargs, **target_kwargs))
+
     def __call__(self, task):
         target_path = self.base_dir + self.file_pattern.format(task=task) + self.ext
-        return self.target_class(target_path, **self.target_kwargs)
+        return self.target(target_path)
 
 
 class SaltedOutput(TargetOutput):
     def __init__(self, file_pattern='{task.__class__.__name__}-{salt}',
-        ext='.txt', base_dir='data/', target_class=LocalTarget, **target_kwargs):
+        ext='.txt', base_dir='data/', target_class=LocalTarget, cached=True,
+        **target_kwargs):
         self.file_pattern = file_pattern
         self.ext = ext
         self.base_dir = base_dir
         self.target_class = target_class
+        self.cached = cached
         self.target_kwargs = target_kwargs
 
     def __call__(self, task):
         if hasattr(task, 'salt'):
             # if the task has its own salt, use it
             salt = task.salt
+        elif EARLY_CUTOFF:
+            # or on the content of requirements, if complete
+            salt = get_content_salted_version(task)[:6]
         else:
             # otherwise compute based on task graph versions
             salt = get_salted_version(task)[:6]
         target_path = self.base_dir + self.file_pattern.format(task=task, salt=salt) + self.ext
-        return self.target_class(target_path, **self.target_kwargs)
+        return self.target(target_path)
 
 
 def salted_SPLT(task, file_pattern, format=None, **kwargs):
@@ -161,7 +508,7 @@ class BaseAtomicProviderLocalTarget(LocalTarget):
         if rwmode == 'w':
             self.makedirs()
             return self.format.pipe_writer(self.atomic_provider(self.path))
-        super(LocalTarget, self).open(mode=mode)
+        return super().open(mode=mode)
 
     @contextmanager
     def temporary_path(self):
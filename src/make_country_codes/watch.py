@@ -0,0 +1,120 @@
+"""
+Warm rebuilds in a long running process.
+
+`make-country-codes watch` builds once, then checks for changes every few
+seconds with :func:`make_country_codes.plan.plan` (a `stat` of each file
+on a warm `build/`) and rebuilds in the same process whenever a task would
+run, e.g. after a raw source in `build/` was edited or removed (to fetch
+it again). pandas and the package are imported once, and frames read from
+unchanged files are kept in memory (see :func:`make_country_codes.frames.keep_frames`),
+so a rebuild only parses what changed.
+
+Derived tables are salted by the content of their inputs (see
+:func:`make_country_codes.utils.get_content_salted_version`), so only
+transforms whose inputs actually changed run again, followed by
+`CountryCodes` and its exports.
+"""
+import time
+
+from luigi import build
+from luigi.task import flatten
+from luigi.task import logger as luigi_logger
+
+from . import utils
+from .frames import keep_frames
+from .frames import FRAME_CACHE_SIZE
+from .plan import plan
+
+# seconds between checks for changes
+INTERVAL = 2.0
+# builds per rebuild, see :func:`rebuild`
+MAX_ROUNDS = 3
+
+
+def input_salts(task):
+    """Returns the salts of the requirements of `task`, which change
+    whenever its inputs do (see :func:`make_country_codes.utils.content_salt`)
+
+    :rtype: tuple
+    """
+    return tuple(utils.content_salt(requirement) for requirement in flatten(task.requires()))
+
+
+def rebuild(tasks, max_rounds=MAX_ROUNDS, failures=None):
+    """Builds `tasks` in this process, if any task would run
+
+    luigi computes the outputs of all tasks when it schedules them, while
+    tasks downstream of a changed table are still salted by their lineage,
+    so tasks that turn out to be stale after a build are built again.
+
+    Tasks that failed are recorded in `failures` with the salts of their
+    inputs (see :func:`input_salts`), and they (and tasks downstream of
+    them) are skipped until one of those salts changes, so a broken source
+    isn't retried at every check.
+
+    :param dict failures: salts of inputs of failed tasks, kept across calls
+    :returns: steps of the tasks that were stale and have been built, see
+        :func:`make_country_codes.plan.plan`
+    :rtype: list
+    """
+    failures = {} if failures is None else failures
+    rebuilt = []
+    for _ in range(max_rounds):
+        skipped = set()
+        stale = []
+        # requirements come first, so skipped requirements are known
+        for step in plan(tasks):
+            if step.complete:
+                continue
+            if (failures.get(step.task) == input_salts(step.task)
+                    or any(task in skipped for task in step.upstream)):
+                skipped.add(step.task)
+            else:
+                stale.append(step)
+        if not stale:
+            break
+        for step in stale:
+            luigi_logger.info('%s: %s', step.task, step.reason)
+        # with a single worker, luigi runs tasks in this process
+        if not build([step.task for step in stale], local_scheduler=True, workers=1):
+            # tasks still stale failed, or depend on a task that failed
+            failed = {step.task for step in plan(tasks) if not step.complete}
+            for step in stale:
+                if step.task in failed:
+                    failures[step.task] = input_salts(step.task)
+                else:
+                    failures.pop(step.task, None)
+                    rebuilt.append(step)
+            break
+        for step in stale:
+            failures.pop(step.task, None)
+        rebuilt.extend(stale)
+    return rebuilt
+
+
+def watch(make_tasks, interval=INTERVAL, frame_cache_size=FRAME_CACHE_SIZE, iterations=None):
+    """Rebuilds the tasks returned by `make_tasks()` whenever they are stale
+
+    :param callable make_tasks: returns the tasks to build
+    :param float interval: seconds between checks for changes
+    :param int frame_cache_size: most frames kept in memory, or 0 to keep none
+    :param int iterations: checks made before returning, or None to watch forever
+    """
+    early_cutoff, utils.EARLY_CUTOFF = utils.EARLY_CUTOFF, True
+    try:
+        cache = keep_frames(frame_cache_size)
+        failures = {}
+        count = 0
+        while iterations is None or count < iterations:
+            if count:
+                time.sleep(interval)
+            started = time.time()
+            hits = cache.hits if cache else 0
+            stale = rebuild(make_tasks(), failures=failures)
+            if stale:
+                luigi_logger.info('rebuilt %d tasks in %.1fs, %d frames read from memory',
+                                  len(stale), time.time() - started,
+                                  (cache.hits if cache else 0) - hits)
+            count += 1
+    finally:
+        utils.EARLY_CUTOFF = early_cutoff